@@ -0,0 +1,273 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+from corpus import Corpus, CLASSES
+from tokenizer import Tokenizer
+from stemmer import Stemmer
+from instrument import instruments
+
+PERSIAN_LETTERS: str = "ابپتثجچحخدذرزژسشصضطظعغفقکگلمنوهی"
+# suffixes the stemmer strips, weighted so most words come without one
+SUFFIXES: [(str, int)] = [("", 60), ("ها", 8), ("های", 5), ("ی", 6), ("ان", 4), ("ات", 3), ("م", 2),
+                          ("ت", 2), ("ش", 3), ("مان", 1), ("تان", 1), ("شان", 1), ("ء", 1)]
+PUNCTUATION: [str] = ["،", ".", ":", "؟"]
+
+
+class SyntheticCorpus(Corpus):
+    """
+    a reproducible corpus of fake persian articles. words follow a zipf distribution over a ranking in
+    which the stop words take the top ranks, followed by a generated vocabulary of stems with persian
+    suffixes, so stop words are as frequent as in real text. every class draws part of its words from
+    its own zipf ranking of the vocabulary so the classes can be told apart. documents are generated
+    one at a time from their own seed, so any number of them can be streamed and a corpus with another
+    seed gives a different sample of the same classes.
+    """
+    _size: int
+    _seed: int
+    _doc_length: int
+    _topic_ratio: float
+    _vocabulary: [str]
+    _stop_words: set
+    _ranking: [str]
+    _cum_weights: [float]
+    _rankings: {int, list}
+
+    def __init__(self, size: int, seed: int = 0, vocabulary_size: int = 20000, doc_length: int = 400,
+                 zipf_exponent: float = 1.1, topic_ratio: float = 0.3, classes: [(int, str)] = None,
+                 vocabulary_seed: int = 0):
+        """
+        vocabulary_seed fixes the vocabulary and the class rankings, seed fixes the documents.
+        """
+        super().__init__(classes)
+        self._size = size
+        self._seed = seed
+        self._doc_length = doc_length
+        self._topic_ratio = topic_ratio
+        with open("./stopwords/stopwords.txt", encoding="utf-8") as file:
+            self._stop_words = set(file.read().strip().split())
+        rng = random.Random(vocabulary_seed)
+        vocabulary: set = set()
+        while len(vocabulary) < vocabulary_size:
+            stem: str = "".join(rng.choice(PERSIAN_LETTERS) for i in range(0, rng.randint(3, 7)))
+            if stem not in self._stop_words:
+                vocabulary.add(stem)
+        self._vocabulary = sorted(vocabulary)
+        rng.shuffle(self._vocabulary)
+        self._ranking = sorted(self._stop_words)
+        rng.shuffle(self._ranking)
+        self._ranking += self._vocabulary
+        self._cum_weights = []
+        total: float = 0
+        for rank in range(1, len(self._ranking) + 1):
+            total += 1 / rank ** zipf_exponent
+            self._cum_weights.append(total)
+        self._rankings = {}
+        for _class, _name in self._classes:
+            ranking: [str] = list(self._vocabulary)
+            random.Random(vocabulary_seed * 7919 + _class).shuffle(ranking)
+            self._rankings[_class] = ranking
+        self._suffixes = [suffix for suffix, weight in SUFFIXES]
+        self._suffix_weights = [weight for suffix, weight in SUFFIXES]
+
+    def __len__(self):
+        return self._size
+
+    def iterDocuments(self) -> typing.Iterator[typing.Tuple[int, str]]:
+        for i in range(0, self._size):
+            yield self.getDocument(i)
+
+    def getDocument(self, i: int) -> (int, str):
+        _class: int = self._classes[i % len(self._classes)][0]
+        rng = random.Random(self._seed * 1000003 + i)
+        length: int = rng.randint(self._doc_length // 2, self._doc_length * 3 // 2)
+        topic_words: int = int(length * self._topic_ratio)
+        # the class rankings only hold the vocabulary, which the first cumulative weights cover
+        words: [str] = rng.choices(self._rankings[_class], cum_weights=self._cum_weights[:len(self._vocabulary)],
+                                   k=topic_words)
+        words += rng.choices(self._ranking, cum_weights=self._cum_weights, k=length - topic_words)
+        words = [word if word in self._stop_words else word + suffix for word, suffix in
+                 zip(words, rng.choices(self._suffixes, weights=self._suffix_weights, k=len(words)))]
+        rng.shuffle(words)
+        lines: [str] = []
+        for start in range(0, len(words), 15):
+            lines.append(" ".join(words[start:start + 15]) + rng.choice(PUNCTUATION))
+        return _class, "\n".join(lines)
+
+
+def parseSize(size: str) -> int:
+    # 10k, 100k, 1m or a plain number of documents
+    size = size.strip().lower()
+    for suffix, factor in (("k", 1000), ("m", 1000000)):
+        if size.endswith(suffix):
+            return int(float(size[:-len(suffix)]) * factor)
+    return int(size)
+
+
+class Benchmark:
+    """
+    times every stage of the pipeline on a synthetic corpus, in a work directory of its own since the
+    index is always written to ./dist. process_max_rss is the peak resident set size of the process so
+    far, which later stages inherit, and max_rss_growth how much the stage raised it. with trace_memory,
+    python_peak_bytes is the peak of python allocations during the stage. the text stage generates,
+    tokenizes and normalizes the training corpus, the tokenize and normalize stages are its parts
+    spent in the tokenizer and the stemmer.
+    """
+    _train: SyntheticCorpus
+    _test: SyntheticCorpus
+    _workers: int
+    _trace_memory: bool
+    _results: dict
+
+    def __init__(self, train: SyntheticCorpus, test: SyntheticCorpus, workers: int = 1, trace_memory=False):
+        self._train = train
+        self._test = test
+        self._workers = workers
+        self._trace_memory = trace_memory
+        self._results = {}
+
+    def run(self) -> dict:
+        from indexer import Indexer
+        from tester import evaluate
+        self._results = {
+            "config": {"train_docs": len(self._train), "test_docs": len(self._test), "workers": self._workers},
+            "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                            "cpus": multiprocessing.cpu_count()},
+            "stages": {},
+        }
+        self._measure("text", self._tokenize, docs=len(self._train))
+        text: dict = self._results["stages"]["text"]
+        text["generate_seconds"] = text["seconds"] - sum(self._results["stages"][name]["seconds"]
+                                                         for name in ("tokenize", "normalize"))
+        indexer = Indexer(workers=self._workers, corpus=self._train)
+        self._measure("index", indexer.indexCorpus, docs=len(self._train))
+        self._measure("vectors", indexer.cacheVectors, docs=len(self._train))
+        self._measure("centroids", indexer.makeCentroids)
+        evaluation = self._measure("classify", lambda: evaluate(workers=self._workers, corpus=self._test),
+                                   docs=len(self._test))
+        self._results["accuracy"] = evaluation.getAccuracy()
+        self._results["instruments"] = instruments.getSummary()
+        self._results["index_bytes"] = sum(os.path.getsize(os.path.join(root, name))
+                                           for root, dirs, names in os.walk("./dist") for name in names)
+        return self._results
+
+    def _tokenize(self):
+        # tokenizer and stemmer on their own, the time to generate documents is left out
+        tokenizer = Tokenizer()
+        stemmer = Stemmer()
+        tokenize_time: float = 0.0
+        normalize_time: float = 0.0
+        tokens: int = 0
+        for _class, doc in self._train:
+            start: float = time.perf_counter()
+            doc_tokens = tokenizer.tokenizeDoc(doc)
+            middle: float = time.perf_counter()
+            stemmer.normalize_list(doc_tokens)
+            tokenize_time += middle - start
+            normalize_time += time.perf_counter() - middle
+            tokens += len(doc_tokens)
+        for name, seconds in (("tokenize", tokenize_time), ("normalize", normalize_time)):
+            self._results["stages"][name] = {
+                "seconds": seconds,
+                "tokens": tokens,
+                "tokens_per_second": tokens / seconds if seconds > 0 else 0.0,
+            }
+
+    def _measure(self, name: str, stage: typing.Callable, docs: int = 0):
+        if self._trace_memory:
+            tracemalloc.start()
+        rss: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else 0
+        start: float = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = stage()
+        seconds: float = time.perf_counter() - start
+        stats: dict = {"seconds": seconds}
+        if docs > 0:
+            stats["docs_per_second"] = docs / seconds if seconds > 0 else 0.0
+        self._results["stages"][name] = stats
+        if self._trace_memory:
+            stats["python_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if resource is not None:
+            # kilobytes on linux, bytes on macos
+            stats["process_max_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            stats["max_rss_growth"] = stats["process_max_rss"] - rss
+        return result
+
+
+def compare(results: dict, baseline: dict) -> str:
+    # time of every stage relative to the baseline run, above 1 is slower
+    s: str = "stage | seconds | baseline | ratio\n"
+    for name, stats in results["stages"].items():
+        base: dict or None = baseline.get("stages", {}).get(name)
+        if base is None or base["seconds"] == 0:
+            continue
+        s += f"{name} | {round(stats['seconds'], 3)} | {round(base['seconds'], 3)} | " \
+             f"{round(stats['seconds'] / base['seconds'], 2)}\n"
+    return s
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="times the indexing and classification pipeline on a synthetic corpus")
+    parser.add_argument("--docs", default="10k", help="training documents: a number or 10k, 100k, 1m")
+    parser.add_argument("--test-docs", default=None, help="test documents, a tenth of --docs by default")
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--doc-length", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--trace-memory", action="store_true", help="also record python allocation peaks (slower)")
+    parser.add_argument("--workdir", default=None, help="where ./dist is written, a temporary directory by default")
+    parser.add_argument("--out", default=None, help="json file for the results, ./benchmarks/<time>.json by default")
+    parser.add_argument("--compare", default=None, help="json results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    docs: int = parseSize(args.docs)
+    test_docs: int = parseSize(args.test_docs) if args.test_docs is not None else max(docs // 10, len(CLASSES))
+    out: str = os.path.abspath(args.out if args.out is not None else
+                               "./benchmarks/" + time.strftime("%Y%m%d-%H%M%S") + ".json")
+    baseline: dict or None = None
+    if args.compare is not None:
+        with open(args.compare, "r") as inputFile:
+            baseline = json.load(inputFile)
+
+    workdir: str = args.workdir if args.workdir is not None else tempfile.mkdtemp(prefix="ir-benchmark-")
+    os.makedirs(workdir, exist_ok=True)
+    shutil.copytree("./stopwords", os.path.join(workdir, "stopwords"), dirs_exist_ok=True)
+    os.chdir(workdir)
+    try:
+        train = SyntheticCorpus(docs, seed=args.seed, vocabulary_size=args.vocabulary, doc_length=args.doc_length)
+        test = SyntheticCorpus(test_docs, seed=args.seed + 1, vocabulary_size=args.vocabulary,
+                               doc_length=args.doc_length)
+        results: dict = Benchmark(train, test, workers=args.workers, trace_memory=args.trace_memory).run()
+        results["config"].update({"vocabulary": args.vocabulary, "doc_length": args.doc_length, "seed": args.seed})
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as outFile:
+        json.dump(results, outFile, indent=2)
+    print(json.dumps(results, indent=2))
+    if baseline is not None:
+        print(compare(results, baseline))
+    print("results saved to " + out, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import typing
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    size bounded cache with least recently used eviction. the bound is a number of entries,
+    a number of bytes as estimated by sizeof, or both. a bound of 0 means no bound.
+    """
+    _entries: OrderedDict
+    _max_entries: int
+    _max_bytes: int
+    _bytes: int
+    _hits: int
+    _misses: int
+    _evictions: int
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 0, sizeof: typing.Callable = None):
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._sizeof = sizeof if sizeof is not None else (lambda value: 1)
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, default=None):
+        # moves a hit to the most recently used end
+        if key in self._entries:
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+        self._misses += 1
+        return default
+
+    def put(self, key, value):
+        self.remove(key)
+        size: int = self._sizeof(value) if self._max_bytes > 0 else 0
+        self._entries[key] = (value, size)
+        self._bytes += size
+        while len(self._entries) > 1 and ((0 < self._max_entries < len(self._entries))
+                                         or (0 < self._max_bytes < self._bytes)):
+            _key, (_value, _size) = self._entries.popitem(last=False)
+            self._bytes -= _size
+            self._evictions += 1
+
+    def remove(self, key):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def getStats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
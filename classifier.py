@@ -0,0 +1,260 @@
+import heapq
+import math
+
+from corpus import TextSource, openText
+from indexer import Dictionary, PostingList, ChampionList
+from hashing import HashedModel
+from tokenizer import Token, Tokenizer
+from stemmer import Stemmer
+
+
+class Classifier:
+    """
+    rocchio classifier over the trained centroids. documents are scored through the class index of the
+    model, the l2 normalized and possibly pruned centroids transposed to term -> (class, weight) rows,
+    so only the classes sharing a term with a document are touched and the cost of a document depends
+    on its distinct terms rather than on the number of classes.
+    """
+    _dictionary: Dictionary
+    _tokenizer: Tokenizer
+    _stemmer: Stemmer
+    _classes: [int]
+    _index: {int, tuple} or None
+
+    def __init__(self, dictionary: Dictionary = None, engine=None):
+        """
+        engine is an optional, already fitted engine.SparseEngine used to score whole batches at once.
+        """
+        self._dictionary = dictionary
+        self._tokenizer = Tokenizer()
+        self._stemmer = Stemmer()
+        self._engine = engine
+        self._index = None
+        self._classes = self._load()
+
+    def _load(self) -> [int]:
+        # reads what documents are scored against and returns its classes, here the class index
+        if self._dictionary is None:
+            self._dictionary = Dictionary(load=True)
+        classes: [int] = self._dictionary.getCentroidClasses()
+        if len(classes) > 0 and not self._dictionary.hasClassIndex():
+            # a model written before the class index, which is built in memory instead
+            centroids = ((_class, self._dictionary.getCentroidRow(_class)) for _class in classes)
+            self._index = {pl_id: (list(row.keys()), list(row.values()))
+                           for pl_id, row in self._dictionary.makeClassIndex(centroids).items()}
+        return classes
+
+    def classify(self, doc: str or TextSource) -> ([int], {int, float}):
+        return self.classify_batch([doc])[0]
+
+    def classify_batch(self, docs: [str or TextSource]) -> [([int], {int, float})]:
+        """
+        returns the guessed classes (more than one on a tie) and the score of every class for each doc.
+        """
+        token_lists: [[Token]] = [self.normalizeDoc(doc) for doc in docs]
+        scores: [{int, float}]
+        if self._engine is not None:
+            classes: [int] = self._engine.getClasses()
+            # classes without a term in common with a document are left out, like score_batch does
+            scores = [{_class: float(score) for _class, score in zip(classes, row) if score != 0}
+                      for row in self._engine.score(token_lists)]
+        else:
+            scores = self.score_batch(token_lists)
+        return [(self.getBestClasses(_scores), _scores) for _scores in scores]
+
+    def score_batch(self, token_lists: [[Token]]) -> [{int, float}]:
+        """
+        score over a batch of documents. every distinct term of the batch is looked up in the lexicon,
+        the term statistics and the class index once, however many documents it appears in.
+        """
+        terms: {str, tuple} = {}
+        results: [{int, float}] = []
+        for tokens in token_lists:
+            tfs: {str, int} = {}
+            for t in tokens:
+                tfs[t.getWord()] = tfs.get(t.getWord(), 0) + 1
+            size: float = 0.0
+            result: {int, float} = {}
+            for word, tf in tfs.items():
+                term: tuple or None = terms.get(word)
+                if term is None:
+                    pl_id: int = self._dictionary.getPostingListId(word)
+                    # terms left out of the vocabulary are left out of the query vector as well
+                    term = (self._dictionary.getIDF(word), self.getClassWeights(pl_id)) \
+                        if self._dictionary.isSelected(pl_id) else (0, None)
+                    terms[word] = term
+                value: float = self._dictionary.getWeight(tf, term[0])
+                size += value * value
+                if term[1] is not None and value != 0:
+                    for _class, weight in zip(*term[1]):
+                        result[_class] = result.get(_class, 0.0) + value * weight
+            size = math.sqrt(size)
+            results.append({_class: dot_product / size for _class, dot_product in result.items()} if size > 0 else {})
+        return results
+
+    def getClassWeights(self, pl_id: int) -> (list, list) or None:
+        # (classes, weights) of a term in the class index
+        if pl_id < 0:
+            return None
+        if self._index is not None:
+            return self._index.get(pl_id)
+        return self._dictionary.getClassWeights(pl_id)
+
+    def normalizeDoc(self, doc: str or TextSource) -> [Token]:
+        with openText(doc) as source:
+            return [Token(word, position)
+                    for word, position in self._stemmer.iter_normalized(self._tokenizer.iterWords(source))]
+
+    def score(self, tokens: [Token]) -> {int, float}:
+        # cosine similarity of the document against every centroid sharing a term with it
+        return self.score_batch([tokens])[0]
+
+    def buildVector(self, tokens: [Token]) -> dict:
+        tfs: dict = {}
+        t: Token
+        for t in tokens:
+            tfs[t.getWord()] = tfs.get(t.getWord(), 0) + 1
+        _vector: dict = {}
+        for key, value in tfs.items():
+            _vector[key] = self._dictionary.getWeight(value, self._dictionary.getIDF(key))
+        return _vector
+
+    def getCentroids(self) -> [(int, dict)]:
+        # the normalized centroids, keyed by posting list id, as stored and not pruned
+        centroids: [(int, dict)] = []
+        for _class in self._classes:
+            norm: float = self._dictionary.getCentroidNorm(_class)
+            vector: {int, float} = self._dictionary.getCentroidRow(_class) if norm > 0 else {}
+            centroids.append((_class, {pl_id: weight / norm for pl_id, weight in vector.items()}))
+        return centroids
+
+    @staticmethod
+    def getBestClasses(scores: {int, float}) -> [int]:
+        if len(scores) == 0:
+            return []
+        _max_score = max(scores.values())
+        return [key for key, val in scores.items() if val == _max_score]
+
+    @staticmethod
+    def getVectorSize(vector: dict) -> float:
+        s: float = 0
+        for value in vector.values():
+            s += value * value
+        return math.sqrt(s)
+
+    def normalize(self, vector: dict) -> dict:
+        size: float = self.getVectorSize(vector)
+        if size == 0:
+            return {}
+        return {key: value / size for key, value in vector.items()}
+
+
+class HashingClassifier(Classifier):
+    """
+    the centroid classifier over hashed features, trained by hashing.HashingIndexer. documents are
+    vectorized without the lexicon or the term statistics, and scored through the hashed class index.
+    """
+    _model: HashedModel
+
+    def __init__(self, model: HashedModel = None):
+        self._model = model if model is not None else HashedModel()
+        super().__init__()
+
+    def _load(self) -> [int]:
+        # the hashed model, which needs no dictionary
+        return self._model.getClasses()
+
+    def score_batch(self, token_lists: [[Token]]) -> [{int, float}]:
+        results: [{int, float}] = []
+        for tokens in token_lists:
+            vector: {int, float} = self.buildVector(tokens)
+            size: float = self.getVectorSize(vector)
+            result: {int, float} = {}
+            for feature, value in vector.items():
+                row = self._model.getClassWeights(feature)
+                if row is not None:
+                    for _class, weight in zip(*row):
+                        result[_class] = result.get(_class, 0.0) + value * weight
+            results.append({_class: dot_product / size for _class, dot_product in result.items()} if size > 0 else {})
+        return results
+
+    def buildVector(self, tokens: [Token]) -> {int, float}:
+        return self._model.buildVector(tokens)
+
+    def getClassWeights(self, feature: int) -> (list, list) or None:
+        return self._model.getClassWeights(feature)
+
+
+class KnnClassifier(Classifier):
+    """
+    k nearest neighbours over the champion lists used as an inverted index. scores are accumulated term at
+    a time for the documents sharing a term with the query only, and the top k documents by cosine vote
+    for their class with their similarity. with use_postings the full posting lists are read instead,
+    which is exact but costs the whole document frequency of every query term. a query without neighbours
+    gets no scores. the document lengths come from the forward index, which indexes built before it lack.
+    """
+    _k: int
+    _use_postings: bool
+    _doc_sizes: {str, float}
+
+    def __init__(self, dictionary: Dictionary = None, k: int = 10, use_postings=False):
+        self._k = k
+        self._use_postings = use_postings
+        super().__init__(dictionary)
+
+    def _load(self) -> [int]:
+        # the training documents instead of the centroids
+        if self._dictionary is None:
+            self._dictionary = Dictionary(load=True)
+        self._doc_sizes = self._getDocSizes()
+        return sorted({self._dictionary.getDocClass(doc_id) for doc_id in self._doc_sizes.keys()})
+
+    def _getDocSizes(self) -> {str, float}:
+        # length of every document vector, weighted like the cached vectors
+        if not self._dictionary.hasForwardIndex():
+            raise ValueError("the index has no forward index, retrain it to classify with knn")
+        terms: [str] = self._dictionary.getTerms()
+        sizes: {str, float} = {}
+        for doc_id, tfs in self._dictionary.getForwardIndex():
+            s: float = 0
+            for pl_id, tf in tfs:
+                weight = self._dictionary.getWeight(tf, self._dictionary.getIDF(terms[pl_id]))
+                if weight > 0:
+                    s += weight * weight
+            sizes[doc_id] = math.sqrt(s)
+        return sizes
+
+    def score_batch(self, token_lists: [[Token]]) -> [{int, float}]:
+        return [self.score(tokens) for tokens in token_lists]
+
+    def score(self, tokens: [Token]) -> {int, float}:
+        vector: dict = self.buildVector(tokens)
+        result: {int, float} = {}
+        for doc_id, similarity in self.getNeighbours(vector):
+            _class: int = self._dictionary.getDocClass(doc_id)
+            result[_class] = result.get(_class, 0.0) + similarity
+        return result
+
+    def getNeighbours(self, vector: dict) -> [(str, float)]:
+        """
+        the k documents most similar to a query vector as (doc id, cosine) pairs, best first.
+        """
+        size: float = self.getVectorSize(vector)
+        if size == 0:
+            return []
+        postfix: str = PostingList.POSTFIX if self._use_postings else ChampionList.POSTFIX
+        accumulators: {str, float} = {}
+        for term, weight in vector.items():
+            if weight <= 0:
+                continue
+            pl: PostingList or None = self._dictionary.getPostingList(term, postfix=postfix)
+            if pl is None:
+                continue
+            idf: float = self._dictionary.getIDF(term)
+            for posting in pl.getPostings():
+                doc_weight = self._dictionary.getWeight(posting.getTermFrequency(), idf)
+                if doc_weight > 0:
+                    accumulators[posting.getDocId()] = accumulators.get(posting.getDocId(), 0) + weight * doc_weight
+        similarities = ((doc_id, dot_product / (size * self._doc_sizes[doc_id]))
+                        for doc_id, dot_product in accumulators.items() if self._doc_sizes.get(doc_id, 0) > 0)
+        return heapq.nlargest(self._k, similarities, key=lambda item: item[1])
@@ -0,0 +1,279 @@
+import io
+import json
+import mmap
+import os
+import re
+import typing
+import xml.etree.ElementTree as ElementTree
+
+# (class id, class name) of the bundled dataset, the names are the directories under train/ and test/
+CLASSES = [(1, "history"), (2, "hygin"), (3, "math"), (4, "physics"), (5, "technology")]
+
+
+def discoverClasses(root: str, classes: [(int, str)] = None) -> [(int, str)]:
+    """
+    (class id, class name) of every directory under root. the classes given keep their ids and the other
+    directories are numbered after them in name order, so a test set is numbered like the training set
+    it is checked against. without classes, directories are numbered from 1 in name order, which gives
+    the bundled dataset the ids of CLASSES.
+    """
+    result: [(int, str)] = list(classes) if classes is not None else []
+    if not os.path.isdir(root):
+        return result
+    known: set = {_name for _class, _name in result}
+    next_id: int = max((_class for _class, _name in result), default=0) + 1
+    for _name in sorted(os.listdir(root)):
+        if _name not in known and os.path.isdir(os.path.join(root, _name)):
+            result.append((next_id, _name))
+            next_id += 1
+    return result
+
+
+class TextSource:
+    """
+    the text of a document left where it is until it is read. open returns a text file object, so a long
+    document can be tokenized a chunk at a time by Tokenizer.iterWords. sources are small enough to be
+    handed to worker processes, which read the text themselves.
+    """
+
+    def open(self) -> typing.TextIO:
+        raise NotImplementedError
+
+    def read(self) -> str:
+        with self.open() as file:
+            return file.read()
+
+
+class FileSource(TextSource):
+    _path: str
+
+    def __init__(self, path: str):
+        self._path = path
+
+    def open(self) -> typing.TextIO:
+        return open(self._path, "r", encoding='utf-8')
+
+
+class JsonlSource(TextSource):
+    # a field of the json record found at offset in a jsonl dump, parsed when opened
+    _path: str
+    _offset: int
+    _size: int
+    _field: str
+
+    def __init__(self, path: str, offset: int, size: int, field: str):
+        self._path = path
+        self._offset = offset
+        self._size = size
+        self._field = field
+
+    def open(self) -> typing.TextIO:
+        with open(self._path, "rb") as file:
+            file.seek(self._offset)
+            record: dict = json.loads(file.read(self._size))
+        return io.StringIO(record.get(self._field, ""))
+
+
+def openText(doc: typing.Union[str, TextSource]) -> typing.TextIO:
+    # documents are either strings or text sources
+    return doc.open() if isinstance(doc, TextSource) else io.StringIO(doc)
+
+
+def readText(doc: typing.Union[str, TextSource]) -> str:
+    return doc.read() if isinstance(doc, TextSource) else doc
+
+
+class Corpus:
+    """
+    a labelled collection of documents, read lazily one document at a time. a document is either a
+    string or a TextSource, see openText.
+    """
+    _classes: [(int, str)]
+
+    def __init__(self, classes: [(int, str)] = None):
+        self._classes = list(classes) if classes is not None else list(CLASSES)
+
+    def getClasses(self) -> [(int, str)]:
+        return self._classes
+
+    def getClassId(self, class_name: str) -> int or None:
+        for _class, _name in self._classes:
+            if _name == class_name:
+                return _class
+        return None
+
+    def iterDocuments(self) -> typing.Iterator[typing.Tuple[int, typing.Union[str, TextSource]]]:
+        # yields (class id, document)
+        raise NotImplementedError
+
+    def __iter__(self):
+        return self.iterDocuments()
+
+
+class DirectoryCorpus(Corpus):
+    """
+    the bundled layout: one directory per class under root, one .txt file per document. the classes are
+    the directories found under root unless they are given.
+    """
+    _root: str
+
+    def __init__(self, root: str, classes: [(int, str)] = None):
+        super().__init__(classes if classes is not None else discoverClasses(root))
+        self._root = root if root.endswith("/") else root + "/"
+
+    def iterFiles(self) -> typing.Iterator[typing.Tuple[int, str]]:
+        # yields (class id, file path) in the order the documents are indexed
+        for _class, _class_name in self._classes:
+            _dir = self._root + _class_name + "/"
+            if not os.path.isdir(_dir):
+                continue  # a class without documents in this set
+            for _filename in os.listdir(_dir):
+                if os.path.isfile(_dir + _filename):
+                    yield _class, _dir + _filename
+
+    def iterDocuments(self) -> typing.Iterator[typing.Tuple[int, FileSource]]:
+        for _class, path in self.iterFiles():
+            yield _class, FileSource(path)
+
+
+JSON_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+JSON_SCALAR = re.compile(rb'[^,}\]\s]*')
+JSON_NESTED = re.compile(rb'[^"{}\[\]]*')
+JSON_SPACE = re.compile(rb'\s*')
+
+
+def _skipJsonString(record: bytes, offset: int) -> int:
+    # the offset right after the json string starting at offset, found without decoding it. the next quote
+    # ends the string unless it is escaped, in which case the string is matched by JSON_STRING
+    end: int = record.find(b'"', offset + 1)
+    if end > 0 and record[end - 1] != 0x5c:
+        return end + 1
+    match = JSON_STRING.match(record, offset)
+    if match is None:
+        raise ValueError("truncated json string")
+    return match.end()
+
+
+def _skipJsonValue(record: bytes, offset: int) -> int:
+    # the offset right after the json value at offset
+    if record[offset:offset + 1] == b'"':
+        return _skipJsonString(record, offset)
+    if record[offset:offset + 1] not in (b'{', b'['):
+        return JSON_SCALAR.match(record, offset).end()
+    depth: int = 0
+    while True:
+        offset = JSON_NESTED.match(record, offset).end()
+        char: bytes = record[offset:offset + 1]
+        if char == b'':
+            raise ValueError("truncated json value")
+        if char == b'"':
+            offset = _skipJsonString(record, offset)
+            continue
+        depth += 1 if char in (b'{', b'[') else -1
+        offset += 1
+        if depth == 0:
+            return offset
+
+
+def readJsonField(record: bytes, field: str, default=None):
+    """
+    the value of a top level field of a json object, only that value is decoded. the other values are
+    skipped over, so the label of a record is read without decoding the article next to it.
+    """
+    offset: int = JSON_SPACE.match(record, 0).end()
+    if record[offset:offset + 1] != b'{':
+        raise ValueError("not a json object")
+    offset += 1
+    while True:
+        offset = JSON_SPACE.match(record, offset).end()
+        if record[offset:offset + 1] in (b'}', b''):
+            return default
+        if record[offset:offset + 1] != b'"':
+            raise ValueError("not a json object")
+        key_end: int = _skipJsonString(record, offset)
+        key: str = json.loads(record[offset:key_end])
+        offset = JSON_SPACE.match(record, key_end).end()
+        if record[offset:offset + 1] != b':':
+            raise ValueError("not a json object")
+        start: int = JSON_SPACE.match(record, offset + 1).end()
+        offset = _skipJsonValue(record, start)
+        if key == field:
+            return json.loads(record[start:offset])
+        offset = JSON_SPACE.match(record, offset).end()
+        if record[offset:offset + 1] == b',':
+            offset += 1
+
+
+class JsonlCorpus(Corpus):
+    """
+    a single dump with one json object per line, holding the class name under label_field and
+    the article under text_field. the file is memory-mapped and read one line at a time, only the
+    label is decoded and the article is left in the dump until its source is opened.
+    """
+    _path: str
+    _label_field: str
+    _text_field: str
+
+    def __init__(self, path: str, classes: [(int, str)] = None, label_field: str = "label", text_field: str = "text"):
+        super().__init__(classes)
+        self._path = path
+        self._label_field = label_field
+        self._text_field = text_field
+
+    def iterDocuments(self) -> typing.Iterator[typing.Tuple[int, JsonlSource]]:
+        with open(self._path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset: int = 0
+            line: bytes = mm.readline()
+            while line:
+                if line.strip():
+                    _class = self.getClassId(str(readJsonField(line, self._label_field)))
+                    if _class is not None:
+                        yield _class, JsonlSource(self._path, offset, len(line), self._text_field)
+                offset += len(line)
+                line = mm.readline()
+
+
+class MediaWikiCorpus(Corpus):
+    """
+    a MediaWiki XML export. pages are parsed incrementally from the memory-mapped dump and freed right
+    after, and a page gets the first class whose name is one of its categories. pages without a known
+    category are skipped. the categories are read from the text of the page, so pages come as strings.
+    categories maps a class name to the category names standing for it, by default just the class name.
+    """
+    _path: str
+    _categories: {str, str}
+    CATEGORY_RULE = re.compile(r"\[\[\s*(?:Category|رده)\s*:\s*([^\]|]+?)\s*(?:\|[^\]]*)?\]\]", re.IGNORECASE)
+
+    def __init__(self, path: str, classes: [(int, str)] = None, categories: {str, list} = None):
+        super().__init__(classes)
+        self._path = path
+        self._categories = {}
+        for _class, _name in self._classes:
+            for category in (categories or {}).get(_name, [_name]):
+                self._categories[category] = _name
+
+    def iterDocuments(self) -> typing.Iterator[typing.Tuple[int, str]]:
+        with open(self._path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            root = None
+            for event, element in ElementTree.iterparse(mm, events=("start", "end")):
+                tag: str = element.tag.rsplit("}", 1)[-1]
+                if event == "start":
+                    if root is None:
+                        root = element
+                    continue
+                if tag != "page":
+                    continue
+                text: str = ""
+                for child in element.iter():
+                    if child.tag.rsplit("}", 1)[-1] == "text" and child.text:
+                        text = child.text
+                _class = self._getPageClass(text)
+                if _class is not None:
+                    yield _class, text
+                root.clear()
+
+    def _getPageClass(self, text: str) -> int or None:
+        for category in self.CATEGORY_RULE.findall(text):
+            if category in self._categories:
+                return self.getClassId(self._categories[category])
+        return None
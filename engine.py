@@ -0,0 +1,134 @@
+import numpy as np
+import scipy.sparse as sp
+
+from indexer import Dictionary
+from tokenizer import Token
+
+
+class SparseEngine:
+    """
+    vectorized alternative to the dict based vectors: the training set is a CSR doc x term matrix with
+    posting list ids as columns, centroids are per class means and classification is a single sparse
+    product against the l2 normalized centroids. like the class index, only the selected vocabulary is
+    used and the centroids are pruned to the centroid size of the dictionary before being normalized.
+    needs numpy and scipy, unlike the rest of the project.
+    """
+    _dictionary: Dictionary
+    _classes: [int]
+    _centroids: sp.csr_matrix or None
+    _normalized: sp.csr_matrix or None
+    _idfs: np.ndarray or None
+    _selected: np.ndarray or None
+
+    def __init__(self, dictionary: Dictionary):
+        self._dictionary = dictionary
+        self._classes = []
+        self._centroids = None
+        self._normalized = None
+        self._idfs = None
+        self._selected = None
+
+    def fit(self):
+        """
+        builds the document matrix from the forward index and derives the centroids from it.
+        """
+        terms: [str] = self._dictionary.getTerms()
+        self._idfs = np.array([self._dictionary.getIDF(term) for term in terms], dtype=np.float64)
+        self._selected = np.array([self._dictionary.isSelected(pl_id) for pl_id in range(0, len(terms))], dtype=bool)
+        indptr: [int] = [0]
+        indices: [int] = []
+        tfs: [int] = []
+        labels: [int] = []
+        for doc_id, doc_tfs in self._dictionary.getForwardIndex():
+            for pl_id, tf in doc_tfs:
+                indices.append(pl_id)
+                tfs.append(tf)
+            indptr.append(len(indices))
+            labels.append(self._dictionary.getDocClass(doc_id))
+        cols = np.array(indices, dtype=np.int64)
+        weights = self._weights(np.array(tfs, dtype=np.float64), self._idfs[cols], self._dictionary.getDocCount())
+        # like the cached document vectors, only positive weights of selected terms are kept
+        weights[(weights < 0) | ~self._selected[cols]] = 0
+        matrix = sp.csr_matrix((weights, cols, np.array(indptr, dtype=np.int64)),
+                               shape=(len(labels), len(terms)))
+        matrix.eliminate_zeros()
+
+        self._classes = sorted(set(labels))
+        class_rows: {int, int} = {_class: row for row, _class in enumerate(self._classes)}
+        rows = np.array([class_rows[label] for label in labels], dtype=np.int64)
+        counts = np.bincount(rows, minlength=len(self._classes)).astype(np.float64)
+        membership = sp.csr_matrix((1 / counts[rows], (rows, np.arange(len(labels)))),
+                                   shape=(len(self._classes), len(labels)))
+        self._centroids = (membership @ matrix).tocsr()
+        self._normalized = self._normalize(self._prune(self._centroids, self._dictionary.getCentroidSize()))
+
+    def transform(self, token_lists: [[Token]]) -> sp.csr_matrix:
+        """
+        turns normalized query tokens into a CSR matrix weighted the same way as Tester.buildVector.
+        """
+        indptr: [int] = [0]
+        indices: [int] = []
+        tfs: [int] = []
+        for tokens in token_lists:
+            counts: {int, int} = {}
+            for token in tokens:
+                pl_id: int = self._dictionary.getPostingListId(token.getWord())
+                if pl_id >= 0:
+                    counts[pl_id] = counts.get(pl_id, 0) + 1
+            indices.extend(counts.keys())
+            tfs.extend(counts.values())
+            indptr.append(len(indices))
+        cols = np.array(indices, dtype=np.int64)
+        weights = self._weights(np.array(tfs, dtype=np.float64), self._idfs[cols], self._dictionary.getDocCount())
+        # terms left out of the vocabulary are left out of the query vector as well
+        weights[~self._selected[cols]] = 0
+        return sp.csr_matrix((weights, cols, np.array(indptr, dtype=np.int64)),
+                             shape=(len(token_lists), self._idfs.shape[0]))
+
+    def score(self, token_lists: [[Token]]) -> np.ndarray:
+        # cosine of every query against every centroid, one row per query and one column per class
+        return np.asarray((self._normalize(self.transform(token_lists)) @ self._normalized.T).todense())
+
+    def classify(self, token_lists: [[Token]]) -> [[int]]:
+        # the best scoring classes of every query, more than one on a tie like Tester.test_doc
+        scores = self.score(token_lists)
+        best = scores.max(axis=1, keepdims=True)
+        return [[self._classes[i] for i in np.flatnonzero(row == row_best)]
+                for row, row_best in zip(scores, best)]
+
+    def getClasses(self) -> [int]:
+        return self._classes
+
+    def getCentroid(self, _class: int) -> dict:
+        # the centroid as a term -> weight dict, like Dictionary.loadCentroid
+        terms: [str] = self._dictionary.getTerms()
+        row = self._centroids[self._classes.index(_class)]
+        return {terms[pl_id]: float(weight) for pl_id, weight in zip(row.indices, row.data)}
+
+    @staticmethod
+    def _weights(tfs: np.ndarray, idfs: np.ndarray, doc_count: int) -> np.ndarray:
+        # Dictionary.getWeight over whole arrays
+        weights = np.zeros(tfs.shape[0], dtype=np.float64)
+        mask = (tfs > 0) & (idfs > 0)
+        weights[mask] = (1 + np.log(tfs[mask])) * np.log(doc_count * idfs[mask])
+        return weights
+
+    @staticmethod
+    def _prune(matrix: sp.csr_matrix, size: int) -> sp.csr_matrix:
+        # keeps the size largest weights of every row by absolute value like model.makeClassIndex, 0 keeps all
+        matrix = matrix.copy()
+        matrix.sort_indices()
+        if size > 0:
+            for row in range(0, matrix.shape[0]):
+                start, end = matrix.indptr[row], matrix.indptr[row + 1]
+                if end - start > size:
+                    order = np.argsort(-np.abs(matrix.data[start:end]), kind="stable")
+                    matrix.data[start + order[size:]] = 0
+        matrix.eliminate_zeros()
+        return matrix
+
+    @staticmethod
+    def _normalize(matrix: sp.csr_matrix) -> sp.csr_matrix:
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sp.diags(1 / norms) @ matrix
@@ -0,0 +1,320 @@
+"""
+vocabulary free vectorization. normalized stems are hashed into a fixed number of signed features,
+the idf comes from a hashed document frequency array of that size, and the class centroids are
+trained in a single pass over a stream of documents. nothing grows with the vocabulary: no lexicon,
+no posting lists, and documents are vectorized independently of each other.
+"""
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import struct
+import typing
+import zlib
+from array import array
+
+from corpus import Corpus, DirectoryCorpus, TextSource, openText
+from indexer import TRAIN_SET_DIR, imapWindows
+from model import ModelWriter, ModelReader, VECTOR, CENTROID, CLASS_INDEX, makeClassIndex
+from tokenizer import Token, Tokenizer
+from stemmer import Stemmer
+from instrument import instruments, initCounted
+
+HASHED_DIST = "./dist/hashed/"
+DF_MAGIC: bytes = b'IRHDF001'
+DF_HEADER = struct.Struct('<8sII')  # magic, dimension, document count
+SUMS_MAGIC: bytes = b'IRHSM001'
+SUMS_HEADER = struct.Struct('<8sI')  # magic, class count
+SUMS_ROW = struct.Struct('<iI')  # class, feature count
+
+
+class HashingVectorizer:
+    """
+    signed feature hashing: a stem goes to the feature crc32(stem) mod dimension, with a sign taken from
+    the top bit of the hash so colliding stems tend to cancel out instead of adding up.
+    """
+    _dimension: int
+
+    def __init__(self, dimension: int = 1 << 18):
+        if not 0 < dimension <= 1 << 31:
+            raise ValueError("dimension has to be between 1 and 2^31")
+        self._dimension = dimension
+
+    def getDimension(self) -> int:
+        return self._dimension
+
+    def getFeature(self, word: str) -> (int, int):
+        h: int = zlib.crc32(word.encode('utf-8'))
+        return h % self._dimension, 1 if h & 0x80000000 else -1
+
+    def countFeatures(self, tokens: typing.Iterable[Token]) -> {int, int}:
+        # signed term frequencies of the features of a document, features cancelled out are left out
+        counts: {int, int} = {}
+        for t in tokens:
+            feature, sign = self.getFeature(t.getWord())
+            counts[feature] = counts.get(feature, 0) + sign
+        return {feature: count for feature, count in counts.items() if count != 0}
+
+    @staticmethod
+    def getLogFrequencies(counts: {int, int}) -> {int, float}:
+        # the signed tf part of Dictionary.getWeight, (1 + log tf) keeping the sign of the count
+        return {feature: math.copysign(1 + math.log(abs(count)), count) for feature, count in counts.items()}
+
+
+class HashedDocFrequencies:
+    """
+    document frequency of every feature and the number of documents, a fixed size array saved as one file.
+    """
+    _addr: str
+    _dfs: array
+    _doc_count: int
+
+    def __init__(self, addr: str, dimension: int = 1 << 18, load=False):
+        self._addr = addr
+        self._dfs = array('I', [0]) * dimension
+        self._doc_count = 0
+        if load:
+            self.load()
+
+    def exists(self) -> bool:
+        return os.path.exists(self._addr)
+
+    def load(self):
+        with open(self._addr, 'rb') as df_file:
+            magic, dimension, self._doc_count = DF_HEADER.unpack(df_file.read(DF_HEADER.size))
+            if magic != DF_MAGIC:
+                raise ValueError("not a hashed document frequency file: " + self._addr)
+            self._dfs = array('I')
+            self._dfs.fromfile(df_file, dimension)
+
+    def save(self):
+        if not os.path.exists(os.path.dirname(self._addr)):
+            os.makedirs(os.path.dirname(self._addr), exist_ok=True)
+        with open(self._addr + '.tmp', 'wb') as df_file:
+            df_file.write(DF_HEADER.pack(DF_MAGIC, len(self._dfs), self._doc_count))
+            self._dfs.tofile(df_file)
+        os.replace(self._addr + '.tmp', self._addr)
+
+    def addDocument(self, features: typing.Iterable[int]):
+        for feature in features:
+            self._dfs[feature] += 1
+        self._doc_count += 1
+
+    def getDimension(self) -> int:
+        return len(self._dfs)
+
+    def getDocCount(self) -> int:
+        return self._doc_count
+
+    def getIDF(self, feature: int) -> float:
+        # log(N / df), the idf part of Dictionary.getWeight
+        df: int = self._dfs[feature]
+        return math.log(self._doc_count / df) if df > 0 else 0.0
+
+
+def writeClassSums(addr: str, sums: {int, dict}):
+    """
+    the log tf sums of every class at full precision, its features as uint32 followed by its sums as
+    float64. the model file only holds float32 weights, which rounded again on every save would drift.
+    """
+    with open(addr + '.tmp', 'wb') as sums_file:
+        sums_file.write(SUMS_HEADER.pack(SUMS_MAGIC, len(sums)))
+        for _class, _sum in sorted(sums.items()):
+            features: [int] = sorted(_sum.keys())
+            sums_file.write(SUMS_ROW.pack(_class, len(features)))
+            array('I', features).tofile(sums_file)
+            array('d', [_sum[feature] for feature in features]).tofile(sums_file)
+    os.replace(addr + '.tmp', addr)
+
+
+def readClassSums(addr: str) -> {int, dict}:
+    sums: {int, dict} = {}
+    with open(addr, 'rb') as sums_file:
+        magic, class_count = SUMS_HEADER.unpack(sums_file.read(SUMS_HEADER.size))
+        if magic != SUMS_MAGIC:
+            raise ValueError("not a class sums file: " + addr)
+        for i in range(0, class_count):
+            _class, size = SUMS_ROW.unpack(sums_file.read(SUMS_ROW.size))
+            features = array('I')
+            features.fromfile(sums_file, size)
+            values = array('d')
+            values.fromfile(sums_file, size)
+            sums[_class] = dict(zip(features, values))
+    return sums
+
+
+class HashingIndexer:
+    """
+    trains centroids over hashed features. the weight of a feature factors into its signed log tf times
+    its idf, so every class only keeps the sum of the log tfs of its documents and the centroids are
+    those sums times the idf over the class size, computed when saved. documents can be streamed in
+    with addDocuments at any time without keeping them, and with workers > 1 they are vectorized by a
+    pool of processes. memory is bounded by the dimension times the number of classes.
+    """
+    _vectorizer: HashingVectorizer
+    _dfs: HashedDocFrequencies
+    _sums: {int, dict}
+    _counts: {int, int}
+
+    def __init__(self, vectorizer: HashingVectorizer = None, corpus: Corpus = None, workers: int = 1,
+                 centroid_size: int = None, load=False, dist: str = HASHED_DIST):
+        """
+        with load, training goes on from the saved state, in which case the saved dimension is used.
+        centroid_size prunes the class index like Dictionary does, None keeps the saved one.
+        """
+        self._dist = dist
+        self._corpus = corpus if corpus is not None else DirectoryCorpus(TRAIN_SET_DIR)
+        self._workers = workers
+        self._centroid_size = centroid_size if centroid_size is not None else 0
+        self._tokenizer = Tokenizer()
+        self._stemmer = Stemmer()
+        self._vectorizer = vectorizer if vectorizer is not None else HashingVectorizer()
+        self._dfs = HashedDocFrequencies(self._dist + "df.bin", self._vectorizer.getDimension())
+        self._sums = {}
+        self._counts = {}
+        if load and self._dfs.exists():
+            self._load(keep_centroid_size=centroid_size is None)
+
+    def train(self):
+        if os.path.exists(self._dist):
+            shutil.rmtree(self._dist)
+        self._dfs = HashedDocFrequencies(self._dist + "df.bin", self._vectorizer.getDimension())
+        self._sums = {}
+        self._counts = {}
+        with instruments.stage("hash"):
+            self.addDocuments(self._corpus, total=len(self._corpus) if hasattr(self._corpus, "__len__") else 0)
+        with instruments.stage("centroids"):
+            self.save()
+
+    def addDocuments(self, documents: typing.Iterable[typing.Tuple[int, str or TextSource]], total: int = 0):
+        """
+        adds labelled documents to the class sums and the document frequencies, save writes the centroids.
+        """
+        results: typing.Iterable
+        pool = None
+        if self._workers > 1:
+            pool = multiprocessing.Pool(self._workers, initializer=initCounted,
+                                        initargs=(_initWorker, self._vectorizer))
+            results = imapWindows(pool, _hashDocument, documents, self._workers * 16)
+        else:
+            results = ((_class, hashDocument(doc, self._vectorizer, self._tokenizer, self._stemmer))
+                       for _class, doc in documents)
+        try:
+            done: int = 0
+            for _class, counts in results:
+                self._dfs.addDocument(counts.keys())
+                _sum: dict = self._sums.setdefault(_class, {})
+                for feature, value in self._vectorizer.getLogFrequencies(counts).items():
+                    _sum[feature] = _sum.get(feature, 0.0) + value
+                self._counts[_class] = self._counts.get(_class, 0) + 1
+                done += 1
+                instruments.count("documents")
+                instruments.progress("hash", done, total)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def getCentroids(self) -> [(int, {int, float})]:
+        centroids: [(int, dict)] = []
+        for _class, _sum in sorted(self._sums.items()):
+            count: int = self._counts[_class]
+            centroid: {int, float} = {}
+            for feature, value in _sum.items():
+                weight: float = value * self._dfs.getIDF(feature) / count
+                if weight != 0:
+                    centroid[feature] = weight
+            centroids.append((_class, centroid))
+        return centroids
+
+    def save(self):
+        """
+        writes the document frequencies, the class sums and counts, the centroids and their class index.
+        """
+        self._dfs.save()
+        writeClassSums(self._dist + "sums.bin", self._sums)
+        writer = ModelWriter(self._dist + "model.bin.tmp")
+        centroids: [(int, dict)] = self.getCentroids()
+        for _class, centroid in centroids:
+            writer.addRow(CENTROID, str(_class), centroid)
+        for feature, row in makeClassIndex(centroids, self._centroid_size).items():
+            writer.addRow(CLASS_INDEX, str(feature), row)
+        writer.close()
+        os.replace(self._dist + "model.bin.tmp", self._dist + "model.bin")
+        with open(self._dist + "classes.json", 'w') as outFile:
+            json.dump({"counts": self._counts, "centroid_size": self._centroid_size}, outFile)
+
+    def _load(self, keep_centroid_size=True):
+        self._dfs.load()
+        self._vectorizer = HashingVectorizer(self._dfs.getDimension())
+        with open(self._dist + "classes.json", 'r') as inputFile:
+            stats: dict = json.load(inputFile)
+        self._counts = {int(_class): count for _class, count in stats["counts"].items()}
+        if keep_centroid_size:
+            self._centroid_size = stats.get("centroid_size", 0)
+        if os.path.exists(self._dist + "sums.bin"):
+            self._sums = readClassSums(self._dist + "sums.bin")
+            return
+        # saved before the sums had a file of their own, as float32 rows of the model
+        model = ModelReader(self._dist + "model.bin")
+        self._sums = {int(_class): model.getVector(VECTOR, _class) for _class in model.getKeys(VECTOR)}
+        model.close()
+
+
+class HashedModel:
+    """
+    read side of a trained HashingIndexer: weights query features and looks them up in the class index.
+    """
+    _vectorizer: HashingVectorizer
+    _dfs: HashedDocFrequencies
+    _model: ModelReader
+
+    def __init__(self, dist: str = HASHED_DIST):
+        self._dfs = HashedDocFrequencies(dist + "df.bin", load=True)
+        self._vectorizer = HashingVectorizer(self._dfs.getDimension())
+        self._model = ModelReader(dist + "model.bin")
+
+    def getVectorizer(self) -> HashingVectorizer:
+        return self._vectorizer
+
+    def buildVector(self, tokens: [Token]) -> {int, float}:
+        # the weighted, hashed vector of a document
+        vector: {int, float} = {}
+        for feature, value in self._vectorizer.getLogFrequencies(self._vectorizer.countFeatures(tokens)).items():
+            weight: float = value * self._dfs.getIDF(feature)
+            if weight != 0:
+                vector[feature] = weight
+        return vector
+
+    def getClasses(self) -> [int]:
+        return sorted(int(_class) for _class in self._model.getKeys(CENTROID))
+
+    def getClassWeights(self, feature: int) -> (array, array) or None:
+        return self._model.getRow(CLASS_INDEX, str(feature))
+
+    def close(self):
+        self._model.close()
+
+
+def hashDocument(doc: str or TextSource, vectorizer: HashingVectorizer, tokenizer: Tokenizer,
+                 stemmer: Stemmer) -> {int, int}:
+    with openText(doc) as source:
+        return vectorizer.countFeatures(Token(word, position)
+                                        for word, position in stemmer.iter_normalized(tokenizer.iterWords(source)))
+
+
+_worker_vectorizer: HashingVectorizer or None = None
+_worker_tokenizer: Tokenizer or None = None
+_worker_stemmer: Stemmer or None = None
+
+
+def _initWorker(vectorizer: HashingVectorizer):
+    global _worker_vectorizer, _worker_tokenizer, _worker_stemmer
+    _worker_vectorizer = vectorizer
+    _worker_tokenizer = Tokenizer()
+    _worker_stemmer = Stemmer()
+
+
+def _hashDocument(item: (int, str)) -> (int, {int, int}):
+    return item[0], hashDocument(item[1], _worker_vectorizer, _worker_tokenizer, _worker_stemmer)
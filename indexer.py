@@ -1,37 +1,80 @@
 import errno
+from array import array
+import functools
+import heapq
+import itertools
 import math
 import os
 import pickle
 import shutil
+import sys
 import typing
 import json
+import multiprocessing
 
 from tokenizer import Tokenizer, Token
 from stemmer import Stemmer
+from cache import LRUCache
+from lexicon import Lexicon
+from termstats import TermStats
+from model import ModelWriter, ModelReader, VECTOR, CENTROID, CLASS_INDEX, makeClassIndex
+from instrument import instruments, initCounted, counted
+from corpus import Corpus, DirectoryCorpus, TextSource, openText, readText
+from segment import SegmentWriter, SegmentReader, encodePostings, decodePostings, encodeTiers, writeRunRecord, \
+    readRunRecords, writeForwardRecord, readForwardRecords
 
 DICT_DIST = "./dist/"
+LEXICON_ADDR = "./dist/lexicon.lex"
+TERM_STATS_ADDR = "./dist/terms.stats"
 POSTING_DIST = "./dist/postings-lists/"
-VECTOR_DIST = "./dist/vectors/"
-TRAIN_SIZE = 55
+RUNS_DIST = "./dist/runs/"
+SEGMENT_ADDR = "./dist/index.seg"
+DELTA_ADDR = "./dist/index.delta.seg"
+FORWARD_ADDR = "./dist/forward.idx"
+MODEL_ADDR = "./dist/model.bin"
+MODEL_DELTA_ADDR = "./dist/model.delta.bin"
+STATS_ADDR = "./dist/classes.json"
+VOCABULARY_ADDR = "./dist/vocabulary.sel"
+TRAIN_SET_DIR = "./dataset/train/"
 
 
 class Posting:
+    __slots__ = ('_docId', '_positions')
     _docId: str
-    _positions: [int]
+    _positions: array
 
-    def __init__(self, doc_id):
+    def __init__(self, doc_id, positions: array = None):
         self._docId = doc_id
-        self._positions = []
+        self._positions = positions if positions is not None else array('I')
 
     def addPosition(self, position: int):
-        if not self._positions.__contains__(position):
+        # positions arrive in increasing order while indexing, so the membership test is rarely needed
+        if len(self._positions) == 0 or position > self._positions[-1] or position not in self._positions:
             self._positions.append(position)
 
     def getDocId(self):
         return self._docId
 
     def getPositions(self):
-        return self._positions.copy()
+        return self._positions[:]
+
+    def getPositionArray(self) -> array:
+        # the positions themselves rather than a copy, for callers that only read them
+        return self._positions
+
+    def getTermFrequency(self) -> int:
+        return len(self._positions)
+
+    def getByteSize(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self._docId) + sys.getsizeof(self._positions)
+
+    def __getstate__(self):
+        return {'_docId': self._docId, '_positions': self._positions}
+
+    def __setstate__(self, state: dict):
+        # posting lists pickled before postings had slots keep their positions in a plain list
+        self._docId = state['_docId']
+        self._positions = array('I', state['_positions'])
 
     def __str__(self):
         s: str = ""
@@ -43,6 +86,7 @@ class Posting:
 
 
 class PostingList:
+    __slots__ = ('_id', '_term', '_list')
     _id: int
     _term: str
     _list: [Posting]
@@ -68,6 +112,31 @@ class PostingList:
         self._list.append(p)
         self._save()
 
+    def extendPostings(self, postings: [Posting]):
+        # documents are indexed one after another, so only the last posting can belong to the same document
+        p: Posting
+        for p in postings:
+            if len(self._list) > 0 and self._list[-1].getDocId() == p.getDocId():
+                for position in p.getPositionArray():
+                    self._list[-1].addPosition(position)
+            else:
+                self._list.append(p)
+
+    def removeDocuments(self, doc_ids: typing.Collection[str]):
+        p: Posting
+        self._list = [p for p in self._list if p.getDocId() not in doc_ids]
+
+    def getRecords(self, doc_nums: {str, int}) -> [(int, array)]:
+        # (doc number, positions) pairs as stored in a segment, the positions are those of the postings
+        p: Posting
+        return [(doc_nums[p.getDocId()], p.getPositionArray()) for p in self._list]
+
+    def setRecords(self, records: [(int, array)], docs: [str]):
+        self._list = [Posting(docs[doc], positions) for doc, positions in records]
+
+    def save(self):
+        self._save()
+
     def getFrequency(self) -> int:
         return len(self._list)
 
@@ -77,22 +146,14 @@ class PostingList:
     def getPostings(self):
         return self._list
 
-    def getBestPostings(self, r=5):
+    def getByteSize(self) -> int:
+        # estimate of the resident size, used to bound the posting list cache
         p: Posting
-        max_posting: Posting or None
-        max_tf: int
-        result: [Posting] = []
-        r = r if r < len(self._list) else len(self._list)
-        for i in range(0, r):
-            max_tf = -1
-            max_posting = None
-            for p in self._list:
-                if (not result.__contains__(p)) and len(p.getPositions()) > max_tf:
-                    max_tf = len(p.getPositions())
-                    max_posting = p
-            if max_posting is not None:
-                result.append(max_posting)
-        return result
+        return sys.getsizeof(self) + sys.getsizeof(self._list) + sum(p.getByteSize() for p in self._list)
+
+    def getBestPostings(self, r=5):
+        # the r postings with the highest tf, ties in list order, in one pass with a heap of r postings
+        return heapq.nlargest(r, self._list, key=Posting.getTermFrequency)
 
     def getPosting(self, doc_id: str) -> Posting or None:
         posting: Posting
@@ -119,6 +180,8 @@ class PostingList:
         try:
             with open(pl_addr, 'wb') as pl_file:
                 pickle.dump(self, pl_file)
+                instruments.count("files_opened")
+                instruments.count("pickle_bytes_written", pl_file.tell())
                 pl_file.close()
         except (FileNotFoundError, FileExistsError):
             print("error")
@@ -128,26 +191,509 @@ class PostingList:
             return False
         return True if self._id == other.getId() else False
 
+    def __getstate__(self):
+        return {'_id': self._id, '_term': self._term, '_list': self._list}
+
+    def __setstate__(self, state: dict):
+        self._id = state['_id']
+        self._term = state['_term']
+        self._list = state['_list']
+
 
 class ChampionList(PostingList):
+    """
+    the best postings of a term by tf, in tiers of r postings: the first tier holds the r highest tfs,
+    the second one the next r and so on. getPostings returns every tier, best first.
+    """
+    __slots__ = ('_tier_size',)
     POSTFIX: str = '.cl'
 
-    def __init__(self, term: str, pl_id: int, pl: PostingList):
+    def __init__(self, term: str, pl_id: int, pl: PostingList = None, r=5, tiers=1):
         super().__init__(term, pl_id)
-        self._list = pl.getBestPostings()
+        self._tier_size = 0
+        if pl is not None:
+            self._list = pl.getBestPostings(r * tiers)
+            self._tier_size = r if tiers > 1 else len(self._list)
 
-    def save(self):
-        self._save()
+    def getTiers(self) -> [[Posting]]:
+        # bands of tier size postings, the last one may be shorter
+        if self._tier_size <= 0 or self._tier_size >= len(self._list):
+            return [self._list]
+        return [self._list[i:i + self._tier_size] for i in range(0, len(self._list), self._tier_size)]
+
+    def getTier(self, tier: int) -> [Posting]:
+        tiers: [[Posting]] = self.getTiers()
+        return tiers[tier] if tier < len(tiers) else []
+
+    def setTiers(self, tiers: [[Posting]]):
+        self._list = [p for postings in tiers for p in postings]
+        self._tier_size = len(tiers[0]) if len(tiers) > 0 else 0
+
+    def getTierRecords(self, doc_nums: {str, int}) -> [[(int, array)]]:
+        p: Posting
+        return [[(doc_nums[p.getDocId()], p.getPositionArray()) for p in postings] for postings in self.getTiers()]
+
+    def __getstate__(self):
+        state: dict = super().__getstate__()
+        state['_tier_size'] = self._tier_size
+        return state
+
+    def __setstate__(self, state: dict):
+        super().__setstate__(state)
+        # champion lists pickled before tiers are a single tier, those of two tiers kept the size of the first
+        self._tier_size = state.get('_tier_size', state.get('_high', len(self._list)))
 
 
 class Dictionary:
-    _dict: {str, int}
+    _dict: Lexicon
+    _batch: {str, PostingList} or None
+    _batch_base: set
+    _batch_size: int
+    _batch_start: int
+    _batch_delta: bool
+    _memory_limit: int
+    _runs: [str]
+    _run_count: int
+    _storage: str
+    _segment: SegmentReader or None
+    _delta: SegmentReader or None
+    _segment_docs: [str] or None
+    _docs: [str]
+    _doc_nums: {str, int}
+    _cache: LRUCache or None
+    _forward: typing.BinaryIO or None
+    _stats: TermStats
+    _model: ModelReader or None
+    _model_delta: ModelReader or None
+    _champion_size: typing.Union[int, typing.Callable[[PostingList], int]]
+    _champion_tiers: int
+    _centroid_size: int or None
+    _vocabulary: bytearray or None
+    MERGE_FAN_IN: int = 64
 
-    def __init__(self, load=False):
-        self._dict = {}
+    def __init__(self, load=False, storage="segment", cache_size=1024, cache_bytes=0,
+                 champion_size: typing.Union[int, typing.Callable[[PostingList], int]] = 5, champion_tiers=1,
+                 centroid_size: int = None):
+        """
+        storage is either "segment", a single memory-mapped file holding every posting and champion list,
+        or "pickle", one pickled file per posting list and champion list. documents added to a segment
+        go to a delta segment next to it until merge folds it in, see beginBatch.
+        loaded posting and champion lists are kept in an LRU cache bounded by cache_size entries and/or
+        cache_bytes bytes (0 means no bound on that side, both 0 disables the cache).
+        champion lists hold the champion_size best postings of every term, or champion_size(posting list)
+        of them when it is a function, in champion_tiers tiers of that size.
+        the class index keeps the centroid_size highest weighted terms of every centroid, 0 keeps all of them
+        and None the size the stored class index was built with.
+        """
+        self._dict = Lexicon(LEXICON_ADDR)
+        self._cache = None
+        if cache_size > 0 or cache_bytes > 0:
+            self._cache = LRUCache(max_entries=cache_size, max_bytes=cache_bytes, sizeof=PostingList.getByteSize)
+        self._stats = TermStats(TERM_STATS_ADDR)
+        self._model = None
+        self._model_delta = None
+        self._forward = None
+        self._storage = storage
+        self._segment = None
+        self._delta = None
+        self._segment_docs = None
+        self._docs = []
+        self._doc_nums = {}
+        self._batch = None
+        self._batch_base = set()
+        self._batch_size = 0
+        self._batch_start = 0
+        self._batch_delta = False
+        self._memory_limit = 0
+        self._runs = []
+        self._run_count = 0
+        self._champion_size = champion_size
+        self._champion_tiers = champion_tiers
+        self._centroid_size = centroid_size
+        self._vocabulary = None
+        instruments.gauge("posting_list_cache", self.getCacheStats)
         if load:
             self._load()
 
+    def beginBatch(self, memory_limit: int = 0, delta=False):
+        """
+        starts building the index in memory. posting lists and the dictionary are only written
+        to disk by commitBatch, once per term instead of once per token.
+        if memory_limit is set, buffered postings are spilled to a sorted run on disk whenever
+        more than memory_limit positions are held in memory, and the runs are k-way merged on commit.
+        with delta, the new postings are appended to the delta segment and the new terms to the lexicon
+        log instead, so a commit costs the new documents and not the whole index.
+        """
+        self._batch = {}
+        self._batch_base = set()
+        self._batch_size = 0
+        self._batch_start = len(self._dict)
+        self._batch_delta = delta and self._storage == "segment"
+        self._memory_limit = memory_limit
+        self._runs = []
+        self._run_count = 0
+        self._loadDocs()
+        if not os.path.exists(os.path.dirname(FORWARD_ADDR)):
+            os.makedirs(os.path.dirname(FORWARD_ADDR), exist_ok=True)
+        self._forward = open(FORWARD_ADDR, 'ab')
+
+    def addTokens(self, tokens: [Token], doc_id: str):
+        # all the tokens of a document must be added in a single call while batching
+        if self._batch is None:
+            tfs: {int, int} = {}
+            for token in tokens:
+                self.addToken(token, doc_id)
+                pl_id: int = self.getPostingListId(token.getWord())
+                tfs[pl_id] = tfs.get(pl_id, 0) + 1
+            # the forward index is what documents are later removed and their vectors rebuilt from
+            if not os.path.exists(os.path.dirname(FORWARD_ADDR)):
+                os.makedirs(os.path.dirname(FORWARD_ADDR), exist_ok=True)
+            with open(FORWARD_ADDR, 'ab') as forward_file:
+                writeForwardRecord(forward_file, doc_id, sorted(tfs.items()))
+            return
+        self.addPostings(doc_id, self.groupTokens(tokens))
+
+    @staticmethod
+    def groupTokens(tokens: [Token]) -> {str, array}:
+        return Dictionary.groupWords((token.getWord(), token.getPosition()) for token in tokens)
+
+    @staticmethod
+    def groupWords(words: typing.Iterable[typing.Tuple[str, int]]) -> {str, array}:
+        # the positions of every term of a document, in the order the terms first occur
+        postings: {str, array} = {}
+        positions: array
+        for word, position in words:
+            positions = postings.get(word)
+            if positions is None:
+                positions = array('I')
+                postings[word] = positions
+            positions.append(position)
+        return postings
+
+    def addPostings(self, doc_id: str, postings: {str, array}):
+        # batch indexing of a whole document given as groupTokens output
+        if doc_id not in self._doc_nums:
+            self._doc_nums[doc_id] = len(self._docs)
+            self._docs.append(doc_id)
+            self._stats.addDocCount(1)
+        term: str
+        positions: array
+        pl: PostingList
+        tfs: [(int, int)] = []
+        for term, positions in postings.items():
+            pl = self._batch.get(term)
+            if pl is None:
+                pl_id: int = self.getPostingListId(term)
+                if pl_id < 0:
+                    pl_id = len(self._dict)
+                    self._dict[term] = pl_id
+                elif pl_id < self._batch_start and term not in self._batch_base and self._hasPostingList(term):
+                    # postings already on disk are merged in on commit. a term whose documents were all
+                    # deleted keeps its id and simply gets a new list
+                    self._batch_base.add(term)
+                pl = PostingList(term, pl_id)
+                self._batch[term] = pl
+            pl.extendPostings([Posting(doc_id, positions)])
+            tfs.append((pl.getId(), len(positions)))
+            self._batch_size += len(positions)
+        writeForwardRecord(self._forward, doc_id, sorted(tfs))
+        if 0 < self._memory_limit < self._batch_size:
+            self._spill()
+
+    def commitBatch(self):
+        if self._batch is None:
+            return
+        lists: typing.Iterable[PostingList]
+        if len(self._runs) == 0:
+            lists = self._batch.values()
+        else:
+            self._spill()
+            while len(self._runs) > self.MERGE_FAN_IN:
+                runs = self._runs[:self.MERGE_FAN_IN]
+                self._runs = self._runs[self.MERGE_FAN_IN:]
+                self._runs.insert(0, self._writeRun(self._mergeRuns(runs)))
+            lists = self._mergeRuns(self._runs)
+        pl: PostingList
+        if self._batch_delta:
+            self._writeDelta(lists)
+        elif self._storage == "segment":
+            self._writeSegment(lists)
+        else:
+            for pl in lists:
+                pl = self._withBase(pl)
+                pl.save()
+                self.makeChampionList(pl).save()
+                self._setTermStats(pl)
+        shutil.rmtree(RUNS_DIST, ignore_errors=True)
+        self._forward.close()
+        self._forward = None
+        self.clearCache()
+        if self._batch_delta:
+            self._save()
+        else:
+            self.compact()
+        self._stats.save()
+        self._batch = None
+        self._batch_base = set()
+        self._runs = []
+
+    def _hasPostingList(self, term: str) -> bool:
+        if self._storage == "segment":
+            pl_id: int = self.getPostingListId(term)
+            return any(segment is not None and segment.hasTerm(pl_id)
+                       for segment in (self._getSegment(), self._getDelta()))
+        return os.path.exists(POSTING_DIST + str(self.getPostingListId(term)) + PostingList.POSTFIX)
+
+    def _withBase(self, pl: PostingList) -> PostingList:
+        if pl.getTerm() in self._batch_base:
+            base: PostingList = self.getPostingList(pl.getTerm())
+            base.extendPostings(pl.getPostings())
+            return base
+        return pl
+
+    def _loadDocs(self):
+        self._docs = list(self._getSegmentDocs())
+        self._doc_nums = {doc: num for num, doc in enumerate(self._docs)}
+
+    def deleteDocuments(self, doc_ids: typing.Collection[str]) -> {str, list}:
+        """
+        removes documents from the posting lists, champion lists and forward index. only the posting lists
+        of their own terms are rewritten, the delta segment is merged along with them.
+        returns the (posting list id, tf) pairs of every removed document.
+        """
+        deleted: set = set(doc_ids)
+        removed: {str, list} = {}
+        with open(FORWARD_ADDR, 'rb') as forward_file, open(FORWARD_ADDR + '.tmp', 'wb') as kept_file:
+            for doc_id, tfs in readForwardRecords(forward_file):
+                if doc_id in deleted:
+                    removed[doc_id] = tfs
+                else:
+                    writeForwardRecord(kept_file, doc_id, tfs)
+        os.replace(FORWARD_ADDR + '.tmp', FORWARD_ADDR)
+        terms: [str] = self.getTerms()
+        lists: [PostingList] = []
+        for pl_id in sorted({pl_id for tfs in removed.values() for pl_id, tf in tfs}):
+            pl = self._loadPostingList(terms[pl_id], PostingList.POSTFIX)
+            if pl is not None:
+                pl.removeDocuments(deleted)
+                lists.append(pl)
+        self._stats.addDocCount(-len(removed))
+        if self._storage == "segment":
+            self._loadDocs()
+            self._writeSegment(lists)
+        else:
+            for pl in lists:
+                self._setTermStats(pl)
+                if pl.getFrequency() > 0:
+                    pl.save()
+                    self.makeChampionList(pl).save()
+                else:
+                    for postfix in (PostingList.POSTFIX, ChampionList.POSTFIX):
+                        os.remove(POSTING_DIST + str(pl.getId()) + postfix)
+        self._stats.save()
+        self.clearCache()
+        return removed
+
+    def _writeSegment(self, lists: typing.Iterable[PostingList]):
+        # champion lists are generated in the same pass, so generateChampions has nothing left to do
+        writer = SegmentWriter(SEGMENT_ADDR + '.tmp')
+        pl: PostingList
+        for pl in lists:
+            pl = self._withBase(pl)
+            self._setTermStats(pl)
+            if pl.getFrequency() == 0:
+                writer.addTerm(pl.getId(), b"", b"")  # every document of the term was deleted
+                continue
+            cl = self.makeChampionList(pl)
+            writer.addTerm(pl.getId(), encodePostings(pl.getRecords(self._doc_nums)),
+                           encodeTiers(cl.getTierRecords(self._doc_nums)))
+        old = self._getSegment()
+        delta = self._getDelta()
+        for pl_id in range(0, len(self._dict)):
+            if writer.hasTerm(pl_id):
+                continue
+            if delta is not None and delta.hasTerm(pl_id):
+                writer.addTerm(pl_id, encodePostings(self._getRecords(pl_id)), delta.getRawTerm(pl_id)[1])
+                continue
+            raw = old.getRawTerm(pl_id) if old is not None else None
+            if raw is not None:
+                writer.addTerm(pl_id, raw[0], raw[1])
+        self.close()
+        writer.close(self._docs, len(self._dict))
+        os.replace(SEGMENT_ADDR + '.tmp', SEGMENT_ADDR)
+        if os.path.exists(DELTA_ADDR):
+            os.remove(DELTA_ADDR)
+
+    def _writeDelta(self, lists: typing.Iterable[PostingList]):
+        # the delta holds the postings added to a term since the last merge, behind the ones in the segment,
+        # along with the whole champion list of the term. it is rewritten with every commit, but only
+        # grows with the documents added since the merge
+        old = self._getSegment()
+        delta = self._getDelta()
+        writer = SegmentWriter(DELTA_ADDR + '.tmp')
+        pl: PostingList
+        for pl in lists:
+            cl = self._appendChampions(pl)
+            self._appendTermStats(pl)
+            records: [(int, array)] = pl.getRecords(self._doc_nums)
+            if delta is not None and delta.hasTerm(pl.getId()):
+                records = delta.getPostings(pl.getId()) + records
+            writer.addTerm(pl.getId(), encodePostings(records), encodeTiers(cl.getTierRecords(self._doc_nums)))
+        if delta is not None:
+            for pl_id in range(0, delta.getTermCount()):
+                raw = delta.getRawTerm(pl_id) if not writer.hasTerm(pl_id) else None
+                if raw is not None:
+                    writer.addTerm(pl_id, raw[0], raw[1])
+        base_count: int = len(old.getDocs()) if old is not None else 0
+        self.close()
+        writer.close(self._docs[base_count:], len(self._dict))
+        os.replace(DELTA_ADDR + '.tmp', DELTA_ADDR)
+
+    def _appendChampions(self, pl: PostingList) -> ChampionList:
+        # the champion list of a term once the postings of pl are added to it. the best postings of the
+        # whole list are among its current champions and the new postings, unless their number depends
+        # on the list
+        current: PostingList or None = self.getPostingList(pl.getTerm()) if callable(self._champion_size) \
+            else self.getChampionList(pl.getTerm())
+        if current is None:
+            return self.makeChampionList(pl)
+        merged = PostingList(pl.getTerm(), pl.getId())
+        merged.extendPostings(current.getPostings())
+        merged.extendPostings(pl.getPostings())
+        return self.makeChampionList(merged)
+
+    def _appendTermStats(self, pl: PostingList):
+        pl_id: int = pl.getId()
+        tfs: [int] = [p.getTermFrequency() for p in pl.getPostings()]
+        self._stats.setTerm(pl_id, self._stats.getDocFrequency(pl_id) + len(tfs),
+                            self._stats.getCollectionFrequency(pl_id) + sum(tfs),
+                            max([self._stats.getMaxTermFrequency(pl_id)] + tfs))
+
+    def merge(self):
+        """
+        folds the delta segment and the lexicon log into the segment and the lexicon, see beginBatch.
+        the delta of the model is folded in by the next full updateModel.
+        """
+        if self._storage == "segment" and os.path.exists(DELTA_ADDR):
+            self._loadDocs()
+            self._writeSegment([])
+        self.compact()
+
+    def _getSegment(self) -> SegmentReader or None:
+        if self._storage != "segment":
+            return None
+        if self._segment is None and os.path.exists(SEGMENT_ADDR):
+            self._segment = SegmentReader(SEGMENT_ADDR)
+            instruments.count("files_opened")
+        return self._segment
+
+    def _getDelta(self) -> SegmentReader or None:
+        if self._storage != "segment":
+            return None
+        if self._delta is None and os.path.exists(DELTA_ADDR):
+            self._delta = SegmentReader(DELTA_ADDR)
+            instruments.count("files_opened")
+        return self._delta
+
+    def _getSegmentDocs(self) -> [str]:
+        # documents by number: those of the segment, then those added in the delta
+        if self._segment_docs is None:
+            self._segment_docs = [doc for segment in (self._getSegment(), self._getDelta()) if segment is not None
+                                  for doc in segment.getDocs()]
+        return self._segment_docs
+
+    def _getRecords(self, pl_id: int) -> [(int, array)] or None:
+        # postings of a term in the segment followed by those appended in the delta
+        segment = self._getSegment()
+        delta = self._getDelta()
+        records = segment.getPostings(pl_id) if segment is not None else None
+        appended = delta.getPostings(pl_id) if delta is not None else None
+        if appended is None:
+            return records
+        return (records or []) + appended
+
+    def close(self):
+        for segment in (self._segment, self._delta):
+            if segment is not None:
+                segment.close()
+        self._segment = None
+        self._delta = None
+        self._segment_docs = None
+        self.clearCache()
+        self._closeModel()
+
+    def _closeModel(self):
+        for model in (self._model, self._model_delta):
+            if model is not None:
+                model.close()
+        self._model = None
+        self._model_delta = None
+
+    def reset(self):
+        # forgets every term, for when the index on disk has been deleted
+        self.close()
+        self._dict.close()
+        self._dict = Lexicon(LEXICON_ADDR)
+        self._stats = TermStats(TERM_STATS_ADDR)
+        self._vocabulary = None
+        self._docs = []
+        self._doc_nums = {}
+
+    def clearCache(self):
+        # has to be called whenever posting lists change on disk
+        if self._cache is not None:
+            self._cache.clear()
+
+    def getCacheStats(self) -> dict:
+        return self._cache.getStats() if self._cache is not None else {}
+
+    def _spill(self):
+        if len(self._batch) == 0:
+            return
+        lists = sorted(self._batch.values(), key=lambda x: x.getId())
+        self._runs.append(self._writeRun(lists))
+        self._batch = {}
+        self._batch_size = 0
+
+    def _writeRun(self, lists) -> str:
+        # a run is a sequence of encoded posting lists sorted by posting list id
+        run_addr: str = RUNS_DIST + str(self._run_count) + '.run'
+        self._run_count += 1
+        if not os.path.exists(os.path.dirname(run_addr)):
+            try:
+                os.makedirs(os.path.dirname(run_addr))
+            except OSError as exc:  # Guard against race condition
+                if exc.errno != errno.EEXIST:
+                    raise
+        pl: PostingList
+        with open(run_addr, 'wb') as run_file:
+            for pl in lists:
+                writeRunRecord(run_file, pl.getId(), pl.getTerm(), encodePostings(pl.getRecords(self._doc_nums)))
+        return run_addr
+
+    def _readRun(self, run_addr: str):
+        pl: PostingList
+        with open(run_addr, 'rb') as run_file:
+            for pl_id, term, data in readRunRecords(run_file):
+                pl = PostingList(term, pl_id)
+                pl.setRecords(decodePostings(data), self._docs)
+                yield pl
+        os.remove(run_addr)
+
+    def _mergeRuns(self, runs: [str]):
+        # runs are written in indexing order and heapq.merge is stable, so postings stay in document order
+        current: PostingList or None = None
+        pl: PostingList
+        for pl in heapq.merge(*[self._readRun(run) for run in runs], key=lambda x: x.getId()):
+            if current is not None and current.getId() == pl.getId():
+                current.extendPostings(pl.getPostings())
+                continue
+            if current is not None:
+                yield current
+            current = pl
+        if current is not None:
+            yield current
+
     def addToken(self, token: Token, doc_id: str):
         term = token.getWord()
         pl: PostingList
@@ -163,12 +709,44 @@ class Dictionary:
         pl.addToken(token, doc_id)
 
     def getPostingList(self, term: str, postfix=PostingList.POSTFIX) -> typing.Union[PostingList, None]:
+        if self._cache is None:
+            return self._loadPostingList(term, postfix)
+        key: tuple = (self.getPostingListId(term), postfix)
+        pl: PostingList or None = self._cache.get(key)
+        if pl is None:
+            pl = self._loadPostingList(term, postfix)
+            if pl is not None:
+                self._cache.put(key, pl)
+        return pl
+
+    def _loadPostingList(self, term: str, postfix: str) -> typing.Union[PostingList, None]:
         pl_id: int = self.getPostingListId(term)
         pl: PostingList
+        instruments.count("posting_list_loads")
+        if self._storage == "segment":
+            docs: [str] = self._getSegmentDocs()
+            if postfix == ChampionList.POSTFIX:
+                # the delta holds the whole champion list of the terms it has
+                delta = self._getDelta()
+                segment = delta if delta is not None and delta.hasTerm(pl_id) else self._getSegment()
+                tiers = segment.getChampionTiers(pl_id) if segment is not None else None
+                if tiers is None:
+                    return None
+                cl = ChampionList(term, pl_id)
+                cl.setTiers([[Posting(docs[doc], positions) for doc, positions in records] for records in tiers])
+                return cl
+            records = self._getRecords(pl_id)
+            if records is None:
+                return None
+            pl = PostingList(term, pl_id)
+            pl.setRecords(records, docs)
+            return pl
         pl_addr: str = POSTING_DIST + str(pl_id) + postfix
         if os.path.exists(pl_addr):
             with open(pl_addr, 'rb') as pl_file:
                 pl = pickle.load(pl_file)
+                instruments.count("files_opened")
+                instruments.count("pickle_bytes_read", pl_file.tell())
                 pl_file.close()
             return pl
         else:
@@ -177,20 +755,70 @@ class Dictionary:
     def getChampionList(self, term: str):
         return self.getPostingList(term, postfix=ChampionList.POSTFIX)
 
+    def makeChampionList(self, pl: PostingList) -> ChampionList:
+        r: int = self._champion_size(pl) if callable(self._champion_size) else self._champion_size
+        return ChampionList(pl.getTerm(), pl.getId(), pl, r=r, tiers=self._champion_tiers)
+
     def getPostingListId(self, term: str) -> int:
-        return self._dict.get(term) if self._dict.__contains__(term) else -1
+        return self._dict.get(term, -1)
+
+    def getPrefixTerms(self, prefix: str) -> [(str, int)]:
+        # (term, posting list id) of every term starting with prefix, in term order
+        return list(self._dict.iterPrefix(prefix))
 
     def getIDF(self, term: str) -> float:
-        pl: PostingList
-        pl = self.getPostingList(term)
-        return 1 / len(pl.getPostings()) if pl is not None else 0
+        df: int = self._stats.getDocFrequency(self.getPostingListId(term))
+        return 1 / df if df > 0 else 0
+
+    def getDocFrequency(self, term: str) -> int:
+        return self._stats.getDocFrequency(self.getPostingListId(term))
+
+    def getCollectionFrequency(self, term: str) -> int:
+        return self._stats.getCollectionFrequency(self.getPostingListId(term))
+
+    def getMaxTermFrequency(self, term: str) -> int:
+        return self._stats.getMaxTermFrequency(self.getPostingListId(term))
+
+    def getDocFrequencies(self) -> array:
+        # document frequencies indexed by posting list id
+        return self._stats.getDocFrequencies()
+
+    def getDocCount(self) -> int:
+        # the number of indexed documents, the N of the idf
+        return self._stats.getDocCount()
+
+    def _setTermStats(self, pl: PostingList):
+        cf: int = 0
+        max_tf: int = 0
+        p: Posting
+        for p in pl.getPostings():
+            tf: int = p.getTermFrequency()
+            cf += tf
+            if tf > max_tf:
+                max_tf = tf
+        self._stats.setTerm(pl.getId(), pl.getFrequency(), cf, max_tf)
+
+    def rebuildStats(self):
+        """
+        recomputes the term statistics from the posting lists, for indexes built token by token
+        or before the statistics existed.
+        """
+        self._stats.clear()
+        docs: set = set()
+        for term, pl_id in self._dict.items():
+            pl: PostingList or None = self._loadPostingList(term, PostingList.POSTFIX)
+            if pl is not None:
+                self._setTermStats(pl)
+                docs.update(p.getDocId() for p in pl.getPostings())
+        self._stats.addDocCount(len(docs))
+        self._stats.save()
 
     def getTF(self, term: str, doc_id: str) -> int:
         posting: Posting
         posting = self.getPostingList(term).getPosting(doc_id)
         if posting is None:
             return 0
-        return len(posting.getPositions())
+        return posting.getTermFrequency()
 
     def _getVector(self, doc_id: str):
         vector: dict = {}
@@ -210,40 +838,291 @@ class Dictionary:
         # return self._getVector(doc_id)
         return self.loadVector(doc_id)
 
-    def saveVector(self, doc_id: str):
-        vector = self._getVector(doc_id)
-        vec_addr: str = VECTOR_DIST + str(doc_id) + '.vec'
-        if not os.path.exists(os.path.dirname(vec_addr)):
-            try:
-                os.makedirs(os.path.dirname(vec_addr))
-            except OSError as exc:  # Guard against race condition
-                if exc.errno != errno.EEXIST:
-                    raise
-        try:
-            with open(vec_addr, 'w') as outFile:
-                json.dump(vector, outFile)
-        except (FileNotFoundError, FileExistsError):
-            print("error")
+    def saveVector(self, doc_id: str, vector: dict = None):
+        # vector is keyed by term like loadVector returns it
+        vector = vector if vector is not None else self._getVector(doc_id)
+        self.updateModel(vectors=[(doc_id, self.selectTerms(self.toIds(vector)))])
 
-    @staticmethod
-    def loadVector(doc_id: str):
-        vec_addr: str = VECTOR_DIST + str(doc_id) + '.vec'
-        vector: dict
-        if not os.path.exists(os.path.dirname(vec_addr)):
-            try:
-                os.makedirs(os.path.dirname(vec_addr))
-            except OSError as exc:  # Guard against race condition
-                if exc.errno != errno.EEXIST:
-                    raise
-        try:
-            with open(vec_addr, 'r') as inputFile:
-                vector = json.load(inputFile)
+    def saveScannedVectors(self, doc_ids: typing.Iterable[str]):
+        # saves the vectors of documents indexed token by token, which have no forward index
+        self.updateModel(vectors=((doc_id, self.selectTerms(self.toIds(self._getVector(doc_id))))
+                                  for doc_id in doc_ids))
+
+    def makeVector(self, tfs: {str, int}) -> {int, float}:
+        # the vector of a document given its term frequencies, keyed by posting list id like the model rows
+        vector: {int, float} = {}
+        for term, tf in tfs.items():
+            weight = self.getWeight(tf, self.getIDF(term))
+            if weight > 0:
+                vector[self.getPostingListId(term)] = weight
+        return self.selectTerms(vector)
+
+    def setVocabulary(self, pl_ids: typing.Iterable[int] or None):
+        """
+        restricts the saved vectors, and the centroids made from them, to the given terms. None brings
+        back the whole vocabulary. terms added to the index later are left out until a new selection.
+        """
+        if pl_ids is None:
+            self._vocabulary = None
+            if os.path.exists(VOCABULARY_ADDR):
+                os.remove(VOCABULARY_ADDR)
+            return
+        selected = array('I', sorted(set(pl_ids)))
+        self._vocabulary = bytearray(len(self._dict))
+        for pl_id in selected:
+            self._vocabulary[pl_id] = 1
+        if not os.path.exists(os.path.dirname(VOCABULARY_ADDR)):
+            os.makedirs(os.path.dirname(VOCABULARY_ADDR), exist_ok=True)
+        with open(VOCABULARY_ADDR, 'wb') as vocabulary_file:
+            selected.tofile(vocabulary_file)
+
+    def _loadVocabulary(self):
+        if not os.path.exists(VOCABULARY_ADDR):
+            self._vocabulary = None
+            return
+        selected = array('I')
+        with open(VOCABULARY_ADDR, 'rb') as vocabulary_file:
+            selected.frombytes(vocabulary_file.read())
+        self._vocabulary = bytearray(max(len(self._dict), max(selected, default=-1) + 1))
+        for pl_id in selected:
+            self._vocabulary[pl_id] = 1
+
+    def isSelected(self, pl_id: int) -> bool:
+        if self._vocabulary is None:
+            return pl_id >= 0
+        return 0 <= pl_id < len(self._vocabulary) and self._vocabulary[pl_id] == 1
+
+    def getVocabularySize(self) -> int:
+        # terms vectors are made of, every term unless a vocabulary was selected
+        return sum(self._vocabulary) if self._vocabulary is not None else self._dict.getTermCount()
+
+    def selectTerms(self, vector: {int, float}) -> {int, float}:
+        if self._vocabulary is None:
             return vector
-        except (FileNotFoundError, FileExistsError):
-            print("error")
+        return {pl_id: weight for pl_id, weight in vector.items() if self.isSelected(pl_id)}
+
+    def getClassFrequencies(self) -> ({int, dict}, {int, int}):
+        """
+        the document frequency of every term within every class, as class -> {posting list id: df},
+        and the number of documents of every class. read from the forward index when there is one,
+        from the posting lists otherwise.
+        """
+        class_dfs: {int, dict} = {}
+        class_sizes: {int, int} = {}
+        if self.hasForwardIndex():
+            for doc_id, tfs in self.getForwardIndex():
+                _class: int = self.getDocClass(doc_id)
+                class_sizes[_class] = class_sizes.get(_class, 0) + 1
+                dfs: dict = class_dfs.setdefault(_class, {})
+                for pl_id, tf in tfs:
+                    dfs[pl_id] = dfs.get(pl_id, 0) + 1
+            return class_dfs, class_sizes
+        docs: set = set()
+        for term, pl_id in self._dict.items():
+            pl: PostingList or None = self.getPostingList(term)
+            if pl is None:
+                continue
+            for posting in pl.getPostings():
+                _class: int = self.getDocClass(posting.getDocId())
+                dfs: dict = class_dfs.setdefault(_class, {})
+                dfs[pl_id] = dfs.get(pl_id, 0) + 1
+                docs.add(posting.getDocId())
+        for doc_id in docs:
+            _class: int = self.getDocClass(doc_id)
+            class_sizes[_class] = class_sizes.get(_class, 0) + 1
+        return class_dfs, class_sizes
+
+    def deleteVector(self, doc_id: str):
+        self.updateModel(deleted=[doc_id])
+
+    def hasForwardIndex(self) -> bool:
+        return os.path.exists(FORWARD_ADDR)
+
+    def saveVectors(self):
+        """
+        saves the vector of every document in the forward index built while batch indexing.
+        a document only costs its own distinct terms instead of a scan of the whole dictionary.
+        """
+        self.updateModel(vectors=self._iterVectors())
+
+    def _iterVectors(self) -> typing.Iterator[typing.Tuple[str, dict]]:
+        for doc_id, tfs in self.getForwardIndex():
+            vector: {int, float} = {}
+            for pl_id, tf in tfs:
+                df: int = self._stats.getDocFrequency(pl_id)
+                weight = self.getWeight(tf, 1 / df if df > 0 else 0)
+                if weight > 0 and self.isSelected(pl_id):
+                    vector[pl_id] = weight
+            yield doc_id, vector
+
+    def updateModel(self, vectors: typing.Iterable[typing.Tuple[str, dict]] = (),
+                    centroids: typing.Iterable[typing.Tuple[int, dict]] = (), deleted: typing.Iterable[str] = (),
+                    delta=False):
+        """
+        writes a new model file with the given document vectors and class centroids, keyed by posting
+        list id, in place of the old ones. the other rows are copied over from the old model as they are,
+        except for the vectors of the deleted documents. the class index is rebuilt when a centroid changed.
+        with delta, only the given rows go to the delta of the model, along with the class index rows of
+        the terms of the changed centroids. the next full update folds the delta in.
+        """
+        if delta and len(deleted) == 0 and self._getModel() is not None and self.hasClassIndex():
+            self._writeModelDelta(vectors, centroids)
+            return
+        writer = ModelWriter(MODEL_ADDR + '.tmp')
+        for doc_id, vector in vectors:
+            writer.addRow(VECTOR, doc_id, vector)
+        changed: [(int, dict)] = []
+        for _class, vector in centroids:
+            writer.addRow(CENTROID, str(_class), vector)
+            changed.append((_class, vector))
+        deleted = set(deleted)
+        old = self._getModel()
+        old_delta = self._getModelDelta()
+        for model in (old_delta, old):
+            if model is None:
+                continue
+            for kind in (VECTOR, CENTROID):
+                for key in model.getKeys(kind):
+                    if not writer.hasRow(kind, key) and not (kind == VECTOR and key in deleted):
+                        writer.addRawRow(kind, key, *model.getRawRow(kind, key))
+        if len(changed) > 0 or (old is not None and not self.hasClassIndex()):
+            changed_classes: set = {_class for _class, vector in changed}
+            unchanged = ((_class, self.getCentroidRow(_class)) for _class in self.getCentroidClasses()
+                         if _class not in changed_classes)
+            for pl_id, row in self.makeClassIndex(itertools.chain(changed, unchanged)).items():
+                writer.addRow(CLASS_INDEX, str(pl_id), row)
+        else:
+            for model in (old_delta, old):
+                if model is None:
+                    continue
+                for key in model.getKeys(CLASS_INDEX):
+                    raw = model.getRawRow(CLASS_INDEX, key)
+                    if not writer.hasRow(CLASS_INDEX, key) and raw[1] > 0:
+                        writer.addRawRow(CLASS_INDEX, key, *raw)
+        self._closeModel()
+        writer.close()
+        os.replace(MODEL_ADDR + '.tmp', MODEL_ADDR)
+        if os.path.exists(MODEL_DELTA_ADDR):
+            os.remove(MODEL_DELTA_ADDR)
+
+    def _writeModelDelta(self, vectors: typing.Iterable[typing.Tuple[str, dict]],
+                         centroids: typing.Iterable[typing.Tuple[int, dict]]):
+        # a class index row holds the weight of a term in every class, so a changed centroid only changes
+        # the rows of the terms it had or has now. those rows are patched and the others are left alone,
+        # an empty row takes a term out of the index
+        writer = ModelWriter(MODEL_DELTA_ADDR + '.tmp')
+        for doc_id, vector in vectors:
+            writer.addRow(VECTOR, doc_id, vector)
+        changed: [(int, dict)] = list(centroids)
+        pl_ids: set = set()
+        for _class, vector in changed:
+            writer.addRow(CENTROID, str(_class), vector)
+            pl_ids.update((self.getCentroidRow(_class) or {}).keys())
+        changed_classes: set = {_class for _class, vector in changed}
+        index: {int, dict} = self.makeClassIndex(changed)
+        pl_ids.update(index.keys())
+        for pl_id in sorted(pl_ids):
+            row = self.getClassWeights(pl_id)
+            weights: {int, float} = {_class: weight for _class, weight in zip(*row) if _class not in changed_classes} \
+                if row is not None else {}
+            weights.update(index.get(pl_id, {}))
+            writer.addRow(CLASS_INDEX, str(pl_id), weights)
+        old_delta = self._getModelDelta()
+        if old_delta is not None:
+            for kind in (VECTOR, CENTROID, CLASS_INDEX):
+                for key in old_delta.getKeys(kind):
+                    if not writer.hasRow(kind, key):
+                        writer.addRawRow(kind, key, *old_delta.getRawRow(kind, key))
+            old_delta.close()
+            self._model_delta = None
+        writer.close()
+        os.replace(MODEL_DELTA_ADDR + '.tmp', MODEL_DELTA_ADDR)
+
+    def getCentroidSize(self) -> int:
+        return self._centroid_size if self._centroid_size is not None else loadCentroidSize()
+
+    def makeClassIndex(self, centroids: typing.Iterable[typing.Tuple[int, dict]]) -> {int, dict}:
+        # the posting list id -> {class: weight} index of the centroids pruned to centroid_size terms
+        return makeClassIndex(centroids, self.getCentroidSize())
+
+    def _getModel(self) -> ModelReader or None:
+        if self._model is None and os.path.exists(MODEL_ADDR):
+            self._model = ModelReader(MODEL_ADDR)
+            instruments.count("files_opened")
+        return self._model
+
+    def _getModelDelta(self) -> ModelReader or None:
+        if self._model_delta is None and os.path.exists(MODEL_DELTA_ADDR):
+            self._model_delta = ModelReader(MODEL_DELTA_ADDR)
+            instruments.count("files_opened")
+        return self._model_delta
+
+    def _getModelFor(self, kind: int, key: str) -> ModelReader or None:
+        # the delta of the model when it has the row, the model otherwise
+        delta = self._getModelDelta()
+        if delta is not None and delta.hasRow(kind, key):
+            return delta
+        return self._getModel()
+
+    def getVectorRow(self, doc_id: str) -> {int, float} or None:
+        # the vector of a document keyed by posting list id, as stored
+        model = self._getModelFor(VECTOR, doc_id)
+        return model.getVector(VECTOR, doc_id) if model is not None else None
+
+    def getCentroidRow(self, _class: int) -> {int, float} or None:
+        model = self._getModelFor(CENTROID, str(_class))
+        return model.getVector(CENTROID, str(_class)) if model is not None else None
+
+    def getCentroidNorm(self, _class: int) -> float:
+        model = self._getModelFor(CENTROID, str(_class))
+        return model.getNorm(CENTROID, str(_class)) if model is not None else 0.0
+
+    def getCentroidClasses(self) -> [int]:
+        return sorted({int(_class) for model in (self._getModel(), self._getModelDelta()) if model is not None
+                       for _class in model.getKeys(CENTROID)})
+
+    def hasClassIndex(self) -> bool:
+        model = self._getModel()
+        return model is not None and len(model.getKeys(CLASS_INDEX)) > 0
+
+    def getClassWeights(self, pl_id: int) -> (array, array) or None:
+        # (class ids, weights) of a term in the class index, see makeClassIndex
+        model = self._getModelFor(CLASS_INDEX, str(pl_id))
+        row = model.getRow(CLASS_INDEX, str(pl_id)) if model is not None else None
+        return row if row is not None and len(row[0]) > 0 else None
+
+    def toIds(self, vector: {str, float}) -> {int, float}:
+        return {self.getPostingListId(term): weight for term, weight in vector.items()}
+
+    def toTerms(self, vector: {int, float}) -> {str, float}:
+        return {self._dict.getTerm(pl_id): weight for pl_id, weight in vector.items()}
+
+    @staticmethod
+    def getForwardIndex():
+        # yields (doc id, [(posting list id, tf)]) for every indexed document
+        with open(FORWARD_ADDR, 'rb') as forward_file:
+            for doc_id, tfs in readForwardRecords(forward_file):
+                yield doc_id, tfs
+
+    def getTerms(self) -> [str]:
+        # terms indexed by their posting list id
+        return self._dict.getTerms()
+
+    def getSize(self) -> int:
+        return len(self._dict)
 
     @staticmethod
-    def getWeight(tf: int, idf: float = None) -> float:
+    def getDocClass(doc_id: str) -> int:
+        return int(doc_id.split("-")[0])
+
+    def loadVector(self, doc_id: str):
+        vector: {int, float} or None = self.getVectorRow(doc_id)
+        if vector is None:
+            print("error")
+            return None
+        return self.toTerms(vector)
+
+    def getWeight(self, tf: int, idf: float = None) -> float:
         if tf == 0 or idf == 0:
             return 0
         weight: float
@@ -251,18 +1130,23 @@ class Dictionary:
             weight = (1 + math.log(tf))
         else:
             pass
-            weight = (1 + math.log(tf)) * math.log(TRAIN_SIZE * idf)
+            weight = (1 + math.log(tf)) * math.log(self._stats.getDocCount() * idf)
         return weight
 
     def generateChampions(self):
-        _size = len(self._dict.items())
+        """
+        writes the champion list of every term. only needed after indexing token by token, commitBatch
+        writes champion lists along with the posting lists.
+        """
+        if self._storage == "segment":
+            return  # champion lists are written along with the segment
         term: str
         pl_id: int
         pl: PostingList
         for term, pl_id in self._dict.items():
-            pl = self.getPostingList(term)
-            cl = ChampionList(term, pl_id, pl)
-            cl.save()
+            pl = self._loadPostingList(term, PostingList.POSTFIX)
+            if pl is not None:
+                self.makeChampionList(pl).save()
 
     @staticmethod
     def addVectors(vec1: dict, vec2: dict) -> dict:
@@ -279,52 +1163,55 @@ class Dictionary:
 
     def getCentroids(self):
         result: list = []
-        for _class in range(1, 6):
-            _centroid_dir = "./dist/centroids/" + str(_class) + ".vec"
-            import pickle
-            vector: dict
-            if not os.path.exists(os.path.dirname(_centroid_dir)):
-                try:
-                    os.makedirs(os.path.dirname(_centroid_dir))
-                except OSError as exc:  # Guard against race condition
-                    if exc.errno != errno.EEXIST:
-                        raise
-            try:
-                with open(_centroid_dir, 'r') as inputFile:
-                    vector = json.load(inputFile)
-                    inputFile.close()
+        for _class in self.getCentroidClasses():
+            vector = self.loadCentroid(_class)
+            if vector is not None:
                 result.append((_class, vector))
-            except (FileNotFoundError, FileExistsError):
-                print("error")
         return result
 
+    def loadCentroid(self, _class: int) -> dict or None:
+        vector: {int, float} or None = self.getCentroidRow(_class)
+        if vector is None:
+            print("error")
+            return None
+        return self.toTerms(vector)
+
+    def saveCentroid(self, _class: int, vector: dict):
+        # vector is keyed by term like loadCentroid returns it
+        self.updateModel(centroids=[(_class, self.toIds(vector))])
+
     def _load(self):
+        self._dict.load()
+        if self._dict.getTermCount() > 0:
+            self._loadStats()
+            self._loadVocabulary()
+            return
+        # indexes built before the lexicon have their terms in dictionary.json
         dic_addr: str = DICT_DIST + 'dictionary.json'
-        if not os.path.exists(os.path.dirname(dic_addr)):
-            try:
-                os.makedirs(os.path.dirname(dic_addr))
-            except OSError as exc:  # Guard against race condition
-                if exc.errno != errno.EEXIST:
-                    raise
         try:
             with open(dic_addr, 'r') as inputFile:
-                self._dict = json.load(inputFile)
+                terms: {str, int} = json.load(inputFile)
         except (FileNotFoundError, FileExistsError):
             print("error")
+            return
+        for term, pl_id in terms.items():
+            self._dict[term] = pl_id
+        self.compact()
+        self._loadStats()
+
+    def _loadStats(self):
+        if self._stats.exists():
+            self._stats.load()
+        else:
+            self.rebuildStats()
 
     def _save(self):
-        dic_addr: str = DICT_DIST + 'dictionary.json'
-        if not os.path.exists(os.path.dirname(dic_addr)):
-            try:
-                os.makedirs(os.path.dirname(dic_addr))
-            except OSError as exc:  # Guard against race condition
-                if exc.errno != errno.EEXIST:
-                    raise
-        try:
-            with open(dic_addr, 'w') as outFile:
-                json.dump(self._dict, outFile)
-        except (FileNotFoundError, FileExistsError):
-            print("error")
+        # only appends the new terms, see Lexicon.save
+        self._dict.save()
+
+    def compact(self):
+        # writes the lexicon as a single file sorted by term, done once an index build is over
+        self._dict.compact()
 
     def __str__(self):
         return str(self._dict)
@@ -333,76 +1220,292 @@ class Dictionary:
 class Indexer:
     _docs_size: int
     _docs_dir: str
+    _class_counts: {int, int}
+    _indexed: int
 
-    def __init__(self, dictionary_load=False):
+    def __init__(self, dictionary_load=False, batch=True, memory_limit=0, storage="segment", workers=1,
+                 corpus: Corpus = None, refresh_ratio=0.1, champion_size=5, champion_tiers=1, centroid_size=None,
+                 selector=None, hashing=None):
+        """
+        corpus is the labelled training set, the directories under TRAIN_SET_DIR by default.
+        with workers > 1, documents are tokenized and normalized by a pool of processes while this process
+        merges their postings in the serial order, so the index is the same as the one of a serial run.
+        refresh_ratio is the share of documents added or removed by addDocuments/removeDocuments after
+        which every vector is reweighted with the new idf values.
+        champion_size, champion_tiers and centroid_size are handed to the Dictionary, a centroid_size of None
+        keeps the one the index was trained with.
+        selector is an optional selection.FeatureSelector picking the vocabulary of the vectors once the
+        corpus is indexed.
+        hashing is an optional hashing.HashingVectorizer. with it, train and addDocuments build hashed
+        centroids under HASHED_DIST instead of an index, see hashing.HashingIndexer.
+        """
         self._tokenizer = Tokenizer()
         self._stemmer = Stemmer()
-        self._dictionary = Dictionary(load=dictionary_load)
+        # the per token indexing path only knows how to update pickled posting lists
+        self._dictionary = Dictionary(load=dictionary_load, storage=storage if batch else "pickle",
+                                      champion_size=champion_size, champion_tiers=champion_tiers,
+                                      centroid_size=centroid_size)
+        self._batch = batch
+        self._memory_limit = memory_limit
+        self._workers = workers if batch else 1
+        self._pool = None
+        self._corpus = corpus if corpus is not None else DirectoryCorpus(TRAIN_SET_DIR)
+        self._refresh_ratio = refresh_ratio
+        self._selector = selector
+        self._hashing = hashing
+        self._centroid_size = centroid_size
+        self._class_counts = {}
+        self._indexed = 0
 
     def train(self):
+        if self._hashing is not None:
+            self._getHashingIndexer(load=False).train()
+            return
+        self._dictionary.close()
         self._clean()
+        self._dictionary.reset()
         self.makeVectors()
         self.makeCentroids()
 
     def makeVectors(self):
-        self._index("./dataset/train/history/", 1)
-        self._index("./dataset/train/hygin/", 2)
-        self._index("./dataset/train/math/", 3)
-        self._index("./dataset/train/physics/", 4)
-        self._index("./dataset/train/technology/", 5)
-        print("generating champions list")
-        self._dictionary.generateChampions()
-        print("caching vectors")
-        for _class in range(1, 6):
-            for cnt in range(1, TRAIN_SIZE + 1):
-                print(f"progress: {round((cnt / TRAIN_SIZE) * (_class / 5) * 100, 2)} %")
-                doc_id = str(_class) + "-" + str(cnt)
-                self._dictionary.saveVector(doc_id)
+        self.indexCorpus()
+        if self._selector is not None:
+            self.selectVocabulary()
+        self.cacheVectors()
+
+    def selectVocabulary(self):
+        with instruments.stage("select"):
+            self._dictionary.setVocabulary(self._selector.select(self._dictionary))
+        instruments.message(f"selected {self._dictionary.getVocabularySize()} terms")
+
+    def getDictionary(self) -> Dictionary:
+        return self._dictionary
+
+    def _getHashingIndexer(self, load=False):
+        from hashing import HashingIndexer
+        return HashingIndexer(self._hashing, corpus=self._corpus, workers=self._workers,
+                              centroid_size=self._centroid_size, load=load)
+
+    def indexCorpus(self):
+        # builds the index of the training corpus, posting and champion lists included
+        with instruments.stage("index"):
+            if self._batch:
+                self._dictionary.beginBatch(memory_limit=self._memory_limit)
+            if self._workers > 1:
+                self._pool = multiprocessing.Pool(self._workers, initializer=initCounted, initargs=(_initWorker,))
+            try:
+                self._index(self._corpus)
+            finally:
+                if self._pool is not None:
+                    self._pool.close()
+                    self._pool.join()
+                    self._pool = None
+        with instruments.stage("commit"):
+            if self._batch:
+                instruments.message("writing index")
+                self._dictionary.commitBatch()
+            else:
+                self._dictionary.compact()
+                self._dictionary.rebuildStats()
+                instruments.message("generating champions list")
+                self._dictionary.generateChampions()
+
+    def cacheVectors(self):
+        # saves the vector of every indexed document
+        instruments.message("caching vectors")
+        with instruments.stage("vectors"):
+            if self._dictionary.hasForwardIndex():
+                self._dictionary.saveVectors()
+            else:
+                self._dictionary.saveScannedVectors(self._iterDocIds())
+
+    def _iterDocIds(self) -> typing.Iterator[str]:
+        class_docs: [(int, [str])] = self._getClassDocs()
+        total: int = sum(len(doc_ids) for _class, doc_ids in class_docs)
+        done: int = 0
+        for _class, doc_ids in class_docs:
+            for doc_id in doc_ids:
+                done += 1
+                instruments.progress("vectors", done, total)
+                yield doc_id
 
     def makeCentroids(self):
         _class: int
         _cnt: int
-        for _class in range(1, 6):
-            _sum: dict = {}
-            _result: dict = {}
-            for _cnt in range(1, TRAIN_SIZE + 1):
-                doc_id: str = str(_class) + "-" + str(_cnt)
-                vec = self._dictionary.getVector(doc_id)
-                _sum = self._dictionary.addVectors(_sum, vec)
-            for key, val in _sum.items():
-                _result[key] = val / TRAIN_SIZE
-
-            vec_addr: str = "./dist/centroids/" + str(_class) + '.vec'
-            if not os.path.exists(os.path.dirname(vec_addr)):
-                try:
-                    os.makedirs(os.path.dirname(vec_addr))
-                except OSError as exc:  # Guard against race condition
-                    if exc.errno != errno.EEXIST:
-                        raise
-            try:
-                with open(vec_addr, 'w') as outFile:
-                    json.dump(_result, outFile)
-            except (FileNotFoundError, FileExistsError):
-                print("error")
-
-    def _index(self, _dir: str, _class: int):
-        from os import listdir
-        from os.path import isfile, join
-        only_files = [f for f in listdir(_dir) if isfile(join(_dir, f))]
-        doc: str
-        cnt: int = 0
-        print(f"indexing class {_class}")
-        for _filename in only_files:
-            print(f"progress: {round((cnt / TRAIN_SIZE) * 100, 2)}%")
-            cnt += 1
-            doc_id = str(_class) + "-" + str(cnt)
-            with open(_dir + _filename, "r", encoding='utf-8') as file:
-                doc = file.read()
-                file.close()
-            tokens = self._tokenizer.tokenizeDoc(doc)
-            normalized = self._stemmer.normalize_list(tokens)
-            for token in normalized:
-                self._dictionary.addToken(token, doc_id)
+        with instruments.stage("centroids"):
+            centroids: [(int, dict)] = []
+            for _class, doc_ids in self._getClassDocs():
+                _sum: dict = {}
+                for doc_id in doc_ids:
+                    # summed in place, a copy of the sum for every document is quadratic in the class size
+                    for key, val in (self._dictionary.getVectorRow(doc_id) or {}).items():
+                        _sum[key] = _sum.get(key, 0) + val
+                centroids.append((_class, {key: val / len(doc_ids) for key, val in _sum.items()}))
+            self._dictionary.updateModel(centroids=centroids)
+            self._saveStats(self._makeStats())
+
+    def addDocuments(self, documents: typing.Iterable[typing.Tuple[int, str or TextSource]]) -> [str]:
+        """
+        indexes new labelled documents into the existing index instead of retraining from scratch.
+        the centroid of every class is kept as a running mean, so a document only costs its own terms.
+        the weights of older documents drift as their idf changes; they are recomputed all at once
+        by refresh, which runs by itself once more than refresh_ratio of the documents changed.
+        returns the ids given to the new documents, none with hashing.
+        """
+        if self._hashing is not None:
+            hashing_indexer = self._getHashingIndexer(load=True)
+            hashing_indexer.addDocuments(documents)
+            hashing_indexer.save()
+            return []
+        self._checkForwardIndex()
+        stats: dict = self._loadStats()
+        added: [(int, str, {str, int})] = []
+        self._dictionary.beginBatch(memory_limit=self._memory_limit, delta=True)
+        for _class, doc in documents:
+            postings = indexDocument(doc, self._tokenizer, self._stemmer)
+            class_stats: dict = stats["classes"].setdefault(str(_class), {"count": 0, "next": 1})
+            doc_id: str = str(_class) + "-" + str(class_stats["next"])
+            class_stats["next"] += 1
+            self._dictionary.addPostings(doc_id, postings)
+            added.append((_class, doc_id, {term: len(positions) for term, positions in postings.items()}))
+        self._dictionary.commitBatch()
+        vectors: [(str, dict)] = []
+        centroids: {int, dict} = {}
+        for _class, doc_id, tfs in added:
+            vector: dict = self._dictionary.makeVector(tfs)
+            vectors.append((doc_id, vector))
+            self._updateCentroid(stats, centroids, _class, vector, 1)
+        self._dictionary.updateModel(vectors=vectors, centroids=centroids.items(), delta=True)
+        self._commitStats(stats, len(added))
+        return [doc_id for _class, doc_id, tfs in added]
+
+    def removeDocuments(self, doc_ids: [str]):
+        """
+        removes documents from the index and takes their vectors out of the class centroids.
+        """
+        self._checkForwardIndex()
+        stats: dict = self._loadStats()
+        removed: {str, list} = self._dictionary.deleteDocuments(doc_ids)
+        centroids: {int, dict} = {}
+        for doc_id in removed.keys():
+            vector: dict = self._dictionary.getVectorRow(doc_id) or {}
+            self._updateCentroid(stats, centroids, self._dictionary.getDocClass(doc_id), vector, -1)
+        self._dictionary.updateModel(centroids=centroids.items(), deleted=removed.keys())
+        self._commitStats(stats, len(removed))
+
+    def _checkForwardIndex(self):
+        # the documents of an index built without a forward index can't be told apart from the added ones
+        if self._dictionary.getDocCount() > 0 and not self._dictionary.hasForwardIndex():
+            raise ValueError("the index has no forward index, retrain it to add or remove documents")
+
+    def refresh(self):
+        # merges the deltas, reweights every document with the current idf and rebuilds the centroids from them
+        instruments.message("caching vectors")
+        self._dictionary.merge()
+        self._dictionary.saveVectors()
+        self.makeCentroids()
+
+    def _updateCentroid(self, stats: dict, centroids: {int, dict}, _class: int, vector: dict, sign: int):
+        # adds a vector to or takes it out of the running mean of its class, kept in centroids until saved
+        class_stats: dict = stats["classes"].setdefault(str(_class), {"count": 0, "next": 1})
+        count: int = class_stats["count"]
+        centroid: dict = {}
+        if count > 0:
+            centroid = centroids.get(_class) or self._dictionary.getCentroidRow(_class) or {}
+        class_stats["count"] = count + sign
+        if class_stats["count"] <= 0:
+            class_stats["count"] = 0
+            centroids[_class] = {}
+            return
+        _sum: dict = {key: val * count for key, val in centroid.items()}
+        for key, val in vector.items():
+            _sum[key] = _sum.get(key, 0) + sign * val
+        centroids[_class] = {key: val / class_stats["count"] for key, val in _sum.items() if abs(val) > 1e-12}
+
+    def _commitStats(self, stats: dict, changes: int):
+        stats["changes"] += changes
+        size: int = sum(class_stats["count"] for class_stats in stats["classes"].values())
+        if stats["changes"] > self._refresh_ratio * size:
+            self.refresh()
+        else:
+            self._saveStats(stats)
+
+    def _makeStats(self) -> dict:
+        # document count and next free document number of every class, and changes since the last refresh.
+        # the next numbers already given out are kept, numbers of removed documents are never handed out again
+        previous: dict = self._loadStats() if os.path.exists(STATS_ADDR) else {"classes": {}}
+        stats: dict = {"classes": {}, "changes": 0, "names": previous.get("names", self._corpus.getClasses()),
+                       "centroid_size": self._dictionary.getCentroidSize()}
+        for _class, class_stats in previous["classes"].items():
+            stats["classes"][_class] = {"count": 0, "next": class_stats["next"]}
+        for _class, doc_ids in self._getClassDocs():
+            class_stats: dict = stats["classes"].setdefault(str(_class), {"count": 0, "next": 1})
+            class_stats["count"] = len(doc_ids)
+            class_stats["next"] = max([class_stats["next"]] + [int(doc_id.split("-")[1]) + 1 for doc_id in doc_ids])
+        return stats
+
+    def _loadStats(self) -> dict:
+        if not os.path.exists(STATS_ADDR):
+            return self._makeStats()
+        with open(STATS_ADDR, 'r') as inputFile:
+            return json.load(inputFile)
+
+    @staticmethod
+    def _saveStats(stats: dict):
+        if not os.path.exists(os.path.dirname(STATS_ADDR)):
+            os.makedirs(os.path.dirname(STATS_ADDR), exist_ok=True)
+        with open(STATS_ADDR, 'w') as outFile:
+            json.dump(stats, outFile)
+
+    def _getClassDocs(self) -> [(int, [str])]:
+        # the documents of every class in indexing order
+        if not self._dictionary.hasForwardIndex():
+            counts: {int, int} = self._class_counts
+            if len(counts) == 0 and os.path.exists(STATS_ADDR):
+                counts = {int(_class): class_stats["next"] - 1
+                          for _class, class_stats in self._loadStats()["classes"].items()}
+            return [(_class, [str(_class) + "-" + str(_cnt) for _cnt in range(1, count + 1)])
+                    for _class, count in counts.items()]
+        class_docs: {int, list} = {}
+        for doc_id, tfs in self._dictionary.getForwardIndex():
+            class_docs.setdefault(self._dictionary.getDocClass(doc_id), []).append(doc_id)
+        return list(class_docs.items())
+
+    def _index(self, corpus: Corpus):
+        _class: int
+        self._class_counts = {}
+        self._indexed = 0
+        total: int = len(corpus) if hasattr(corpus, "__len__") else 0
+        if not self._batch:
+            for _class, doc in corpus:
+                doc_id = self._nextDocId(_class, total)
+                tokens = self._tokenizer.tokenizeDoc(readText(doc))
+                normalized = self._stemmer.normalize_list(tokens)
+                instruments.count("tokens", len(normalized))
+                self._dictionary.addTokens(normalized, doc_id)
+            return
+        results: typing.Iterable
+        if self._pool is not None:
+            results = self._parallelIndex(corpus)
+        else:
+            results = ((_class, indexDocument(doc, self._tokenizer, self._stemmer)) for _class, doc in corpus)
+        for _class, postings in results:
+            instruments.count("tokens", sum(len(positions) for positions in postings.values()))
+            self._dictionary.addPostings(self._nextDocId(_class, total), postings)
+
+    def _parallelIndex(self, corpus: Corpus):
+        # imap keeps the order of the documents, which keeps posting list ids the same as a serial run
+        return imapWindows(self._pool, _indexDocument, corpus, self._workers * 16)
+
+    def _nextDocId(self, _class: int, total: int = 0) -> str:
+        if _class not in self._class_counts:
+            instruments.message(f"indexing class {_class}")
+            self._class_counts[_class] = 0
+        self._class_counts[_class] += 1
+        self._indexed += 1
+        instruments.count("documents")
+        instruments.progress("index", self._indexed, total)
+        return str(_class) + "-" + str(self._class_counts[_class])
 
     @staticmethod
     def _clean():
@@ -411,3 +1514,61 @@ class Indexer:
                 shutil.rmtree("./dist")
             except (FileNotFoundError, FileExistsError):
                 print("clean error")
+
+
+def loadTrainedClasses() -> [(int, str)] or None:
+    # (class id, class name) of the training corpus the index was built from
+    if not os.path.exists(STATS_ADDR):
+        return None
+    with open(STATS_ADDR, 'r') as inputFile:
+        names: list or None = json.load(inputFile).get("names")
+    return [(_class, _name) for _class, _name in names] if names is not None else None
+
+
+def loadCentroidSize() -> int:
+    # the size the centroids of the class index were pruned to when the index was trained
+    if not os.path.exists(STATS_ADDR):
+        return 0
+    with open(STATS_ADDR, 'r') as inputFile:
+        return json.load(inputFile).get("centroid_size", 0)
+
+
+def indexDocument(doc: typing.Union[str, TextSource], tokenizer: Tokenizer, stemmer: Stemmer) -> {str, array}:
+    # the normalized postings of a single document, ready for Dictionary.addPostings. a text source is
+    # read a chunk at a time
+    with openText(doc) as source:
+        return Dictionary.groupWords(stemmer.iter_normalized(tokenizer.iterWords(source)))
+
+
+def imapWindows(pool, function, items: typing.Iterable, window_size: int, chunksize: int = 4):
+    # pool.imap over items handed over a window at a time, imap would otherwise read all of them at once.
+    # the counters the workers record come back with their results and are added to the instruments here,
+    # for which the pool has to start its workers with instrument.initCounted
+    window: list = []
+    for item in items:
+        window.append(item)
+        if len(window) == window_size:
+            yield from _imapCounted(pool, function, window, chunksize)
+            window = []
+    if len(window) > 0:
+        yield from _imapCounted(pool, function, window, chunksize)
+
+
+def _imapCounted(pool, function, items: list, chunksize: int):
+    for result, counters in pool.imap(functools.partial(counted, function), items, chunksize=chunksize):
+        instruments.addCounters(counters)
+        yield result
+
+
+_worker_tokenizer: Tokenizer or None = None
+_worker_stemmer: Stemmer or None = None
+
+
+def _initWorker():
+    global _worker_tokenizer, _worker_stemmer
+    _worker_tokenizer = Tokenizer()
+    _worker_stemmer = Stemmer()
+
+
+def _indexDocument(item: (int, typing.Union[str, TextSource])) -> (int, {str, array}):
+    return item[0], indexDocument(item[1], _worker_tokenizer, _worker_stemmer)
@@ -0,0 +1,339 @@
+"""
+stage timers, counters and progress reporting shared by the indexer, the stemmer and the tester.
+everything goes through the module level instruments object, configured from the environment so a
+slow run can be looked into without touching the code:
+
+IR_INSTRUMENT            comma separated sinks: "stdout" prints a summary at the end, "json:<path>"
+                         appends every event to a json lines log, "none" disables progress and message
+                         output. progress and messages are printed to stdout when unset
+IR_PROFILE               comma separated stage names, or "*", to run under cProfile. the stats are
+                         written to IR_PROFILE_DIR (./profiles/ by default) and summarized
+IR_SAMPLE                interval in seconds of a sampling profiler running along every stage
+IR_PROGRESS_INTERVAL     least number of seconds between two progress reports, 1 by default
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import typing
+import weakref
+
+
+class Sink:
+    # receives the events of Instruments
+    def progress(self, record: dict):
+        pass
+
+    def message(self, record: dict):
+        pass
+
+    def emit(self, record: dict):
+        pass
+
+    def summary(self, summary: dict):
+        pass
+
+    def close(self):
+        pass
+
+
+class StdoutSink(Sink):
+    _summary: bool
+
+    def __init__(self, summary=True):
+        self._summary = summary
+
+    def progress(self, record: dict):
+        s: str = f"progress: {record['name']} {record['done']}"
+        if record.get("total", 0) > 0:
+            s += f"/{record['total']} ({round(record['done'] / record['total'] * 100, 2)}%)"
+        s += f", {round(record['rate'], 2)}/sec"
+        print(s)
+
+    def message(self, record: dict):
+        print(record["text"])
+
+    def summary(self, summary: dict):
+        if not self._summary:
+            return
+        print("stage | calls | seconds | counters")
+        for name, stage in summary["stages"].items():
+            counters: str = ", ".join(f"{key}: {value} ({round(stage['rates'][key], 2)}/sec)"
+                                      for key, value in stage["counters"].items())
+            print(f"{name} | {stage['calls']} | {round(stage['seconds'], 3)} | {counters}")
+        for key, value in summary["counters"].items():
+            print(f"{key}: {value}")
+        for key, value in summary["gauges"].items():
+            print(f"{key}: {value}")
+        for name, lines in summary["profiles"].items():
+            print(f"profile of {name}:")
+            for line in lines:
+                print("  " + line)
+
+
+class JsonLogSink(Sink):
+    # one json object per line and per event
+    _file: typing.TextIO
+
+    def __init__(self, path: str):
+        if os.path.dirname(path) != "" and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def progress(self, record: dict):
+        self.emit(record)
+
+    def message(self, record: dict):
+        self.emit(record)
+
+    def emit(self, record: dict):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def summary(self, summary: dict):
+        self.emit(dict(summary, event="summary", time=time.time()))
+
+    def close(self):
+        self._file.close()
+
+
+class Sampler:
+    """
+    sampling profiler: a thread that records the function the profiled thread is running every
+    interval seconds. cheaper than cProfile on long stages, at the cost of precision.
+    """
+    _interval: float
+    _counts: {str, int}
+
+    def __init__(self, interval: float):
+        self._interval = interval
+        self._counts = {}
+        self._thread_id = threading.get_ident()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> {str, int}:
+        self._stopped.set()
+        self._thread.join()
+        return self._counts
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                key: str = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+                self._counts[key] = self._counts.get(key, 0) + 1
+
+
+class Stage:
+    # context manager timing one run of a stage, see Instruments.stage
+    def __init__(self, instruments, name: str):
+        self._instruments = instruments
+        self._name = name
+
+    def __enter__(self):
+        self._instruments.enterStage(self._name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._instruments.exitStage(self._name)
+        return False
+
+
+class Instruments:
+    """
+    per stage timers and counters, gauges read at summary time, rate limited progress reports and
+    optional per stage profiling. counters are kept in total and for every active stage, so their
+    rate over a stage can be reported.
+    """
+    _sinks: [Sink]
+    _profile: typing.Set[str]
+    _sample_interval: float
+    _progress_interval: float
+    _stages: {str, dict}
+    _counters: {str, int}
+    _gauges: {str, typing.Callable}
+    _active: [(str, float)]
+    _profiles: {str, list}
+    _last_progress: {str, float}
+    _progress_start: {str, float}
+
+    def __init__(self, sinks: [Sink] = None, profile: typing.Iterable[str] = (), profile_dir: str = "./profiles/",
+                 sample_interval: float = 0.0, progress_interval: float = 1.0):
+        self._sinks = list(sinks) if sinks is not None else [StdoutSink(summary=False)]
+        self._profile = set(profile)
+        self._profile_dir = profile_dir
+        self._sample_interval = sample_interval
+        self._progress_interval = progress_interval
+        self._gauges = {}
+        self._profiler = None
+        self._sampler = None
+        self.reset()
+
+    @classmethod
+    def fromEnvironment(cls, environ: {str, str} = None):
+        environ = environ if environ is not None else os.environ
+        sinks: [Sink] or None = None
+        if environ.get("IR_INSTRUMENT"):
+            sinks = []
+            for spec in environ["IR_INSTRUMENT"].split(","):
+                spec = spec.strip()
+                if spec == "stdout":
+                    sinks.append(StdoutSink())
+                elif spec.startswith("json:"):
+                    sinks.append(JsonLogSink(spec[len("json:"):]))
+        profile: [str] = [name.strip() for name in environ.get("IR_PROFILE", "").split(",") if name.strip()]
+        return cls(sinks=sinks, profile=profile, profile_dir=environ.get("IR_PROFILE_DIR", "./profiles/"),
+                   sample_interval=float(environ.get("IR_SAMPLE", 0)),
+                   progress_interval=float(environ.get("IR_PROGRESS_INTERVAL", 1)))
+
+    def reset(self):
+        self._stages = {}
+        self._counters = {}
+        self._active = []
+        self._profiles = {}
+        self._last_progress = {}
+        self._progress_start = {}
+
+    def addSink(self, sink: Sink):
+        self._sinks.append(sink)
+
+    def stage(self, name: str) -> Stage:
+        return Stage(self, name)
+
+    def enterStage(self, name: str):
+        stage: dict = self._stages.setdefault(name, {"calls": 0, "seconds": 0.0, "counters": {}})
+        stage["calls"] += 1
+        if self._profiler is None and ("*" in self._profile or name in self._profile):
+            self._profiler = (name, cProfile.Profile())
+            self._profiler[1].enable()
+        if self._sampler is None and self._sample_interval > 0:
+            self._sampler = (name, Sampler(self._sample_interval))
+            self._sampler[1].start()
+        self._active.append((name, time.perf_counter()))
+        self._emit({"event": "stage_start", "stage": name})
+
+    def exitStage(self, name: str):
+        _name, start = self._active.pop()
+        seconds: float = time.perf_counter() - start
+        self._stages[name]["seconds"] += seconds
+        if self._profiler is not None and self._profiler[0] == name:
+            self._profiler[1].disable()
+            self._saveProfile(name, self._profiler[1])
+            self._profiler = None
+        if self._sampler is not None and self._sampler[0] == name:
+            samples: {str, int} = self._sampler[1].stop()
+            self._profiles[name + " (sampled)"] = [f"{count} {key}" for key, count in
+                                                   sorted(samples.items(), key=lambda item: -item[1])[:15]]
+            self._sampler = None
+        self._emit({"event": "stage_end", "stage": name, "seconds": seconds})
+
+    def _saveProfile(self, name: str, profiler: cProfile.Profile):
+        os.makedirs(self._profile_dir, exist_ok=True)
+        profiler.dump_stats(os.path.join(self._profile_dir, name + ".prof"))
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(15)
+        self._profiles[name] = [line for line in out.getvalue().splitlines() if line.strip()]
+
+    def count(self, name: str, n: int = 1):
+        self._counters[name] = self._counters.get(name, 0) + n
+        for stage_name, start in self._active:
+            counters: dict = self._stages[stage_name]["counters"]
+            counters[name] = counters.get(name, 0) + n
+
+    def takeCounters(self) -> {str, int}:
+        # the counters recorded since the last call, which start over
+        counters: {str, int} = self._counters
+        self._counters = {}
+        return counters
+
+    def addCounters(self, counters: {str, int}):
+        # counters recorded somewhere else, by a worker process, counted as if they were recorded here
+        for name, n in counters.items():
+            self.count(name, n)
+
+    def gauge(self, name: str, read: typing.Callable):
+        # read() is called for the summary, e.g. the statistics of a cache. bound methods are held
+        # weakly so a gauge doesn't keep its object alive
+        self._gauges[name] = weakref.WeakMethod(read) if hasattr(read, "__self__") else (lambda: read)
+
+    def progress(self, name: str, done: int, total: int = 0):
+        """
+        reports the progress of a long loop, at most once every progress_interval seconds
+        and always when done reaches total.
+        """
+        now: float = time.perf_counter()
+        start: float = self._progress_start.setdefault(name, now)
+        if now - self._last_progress.get(name, start) < self._progress_interval and (total == 0 or done < total):
+            return
+        self._last_progress[name] = now
+        record: dict = {"event": "progress", "name": name, "done": done, "total": total,
+                        "rate": done / (now - start) if now > start else 0.0, "time": time.time()}
+        for sink in self._sinks:
+            sink.progress(record)
+
+    def message(self, text: str):
+        # a line about what a long run is doing, printed by the stdout sink
+        record: dict = {"event": "message", "text": text, "time": time.time()}
+        for sink in self._sinks:
+            sink.message(record)
+
+    def getSummary(self) -> dict:
+        stages: dict = {}
+        for name, stage in self._stages.items():
+            seconds: float = stage["seconds"]
+            stages[name] = {
+                "calls": stage["calls"],
+                "seconds": seconds,
+                "counters": dict(stage["counters"]),
+                "rates": {key: value / seconds if seconds > 0 else 0.0 for key, value in stage["counters"].items()},
+            }
+        return {
+            "stages": stages,
+            "counters": dict(self._counters),
+            "gauges": {name: ref()() for name, ref in self._gauges.items() if ref() is not None},
+            "profiles": dict(self._profiles),
+        }
+
+    def report(self):
+        # hands the summary to every sink
+        summary: dict = self.getSummary()
+        for sink in self._sinks:
+            sink.summary(summary)
+
+    def _emit(self, record: dict):
+        record["time"] = time.time()
+        for sink in self._sinks:
+            sink.emit(record)
+
+    def close(self):
+        for sink in self._sinks:
+            sink.close()
+
+
+instruments: Instruments = Instruments.fromEnvironment()
+
+
+def initCounted(initializer: typing.Callable = None, *args):
+    # pool initializer for counted workers: the state a forked worker inherits from the parent is dropped
+    # so only what the worker records is handed back
+    instruments.reset()
+    if initializer is not None:
+        initializer(*args)
+
+
+def counted(function: typing.Callable, item) -> (typing.Any, {str, int}):
+    """
+    calls function(item) in a worker process started with initCounted and returns its result along
+    with the counters recorded since the last call, which the parent hands to Instruments.addCounters.
+    a pool takes it through functools.partial.
+    """
+    result = function(item)
+    return result, instruments.takeCounters()
@@ -0,0 +1,319 @@
+import bisect
+import heapq
+import mmap
+import os
+import struct
+import typing
+from array import array
+
+from cache import LRUCache
+from segment import writeVarint, readVarint
+
+MAGIC: bytes = b'IRLEX001'
+HEADER = struct.Struct('<8sIIIQQ')  # magic, term count, id count, block count, block index offset, id table offset
+BLOCK_ENTRY = struct.Struct('<QI')  # block offset, length of the first term of the block
+U32 = struct.Struct('<I')
+NO_BLOCK: int = 0xffffffff
+BLOCK_SIZE: int = 32
+
+
+def writeLexicon(addr: str, items: typing.Iterable[typing.Tuple[str, int]], id_count: int,
+                 block_size: int = BLOCK_SIZE):
+    """
+    writes (term, id) pairs given in term order as front coded blocks of block_size terms. every term of
+    a block is stored as the length of the prefix it shares with the previous one, the rest of its
+    utf-8 bytes and its id. the blocks are followed by the first term of every block and an
+    id -> block table, so a lookup only decodes a single block.
+    """
+    if not os.path.exists(os.path.dirname(addr)):
+        os.makedirs(os.path.dirname(addr), exist_ok=True)
+    blocks: [(int, bytes)] = []
+    id_blocks = array('I', [NO_BLOCK]) * id_count
+    term_count: int = 0
+    with open(addr, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, 0, 0, 0, 0, 0))
+        out = bytearray()
+        previous: bytes = b""
+        for term, term_id in items:
+            term_bytes: bytes = term.encode('utf-8')
+            if term_count % block_size == 0:
+                file.write(out)
+                out = bytearray()
+                blocks.append((file.tell(), term_bytes))
+                previous = b""
+            shared: int = 0
+            limit: int = min(len(previous), len(term_bytes))
+            while shared < limit and previous[shared] == term_bytes[shared]:
+                shared += 1
+            writeVarint(out, shared)
+            writeVarint(out, len(term_bytes) - shared)
+            out += term_bytes[shared:]
+            writeVarint(out, term_id)
+            id_blocks[term_id] = len(blocks) - 1
+            previous = term_bytes
+            term_count += 1
+        file.write(out)
+        index_offset: int = file.tell()
+        for offset, first in blocks:
+            file.write(BLOCK_ENTRY.pack(offset, len(first)))
+            file.write(first)
+        table_offset: int = file.tell()
+        file.write(id_blocks.tobytes())
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, term_count, id_count, len(blocks), index_offset, table_offset))
+
+
+class LexiconReader:
+    """
+    read-only, memory-mapped view of a lexicon file. only the first term of every block is held in
+    memory, lookups bisect them and decode one block of the mapped file.
+    """
+    _term_count: int
+    _id_count: int
+    _block_offsets: array
+    _block_terms: [bytes]
+    _table_offset: int
+    _index_offset: int
+
+    def __init__(self, addr: str):
+        self._file = open(addr, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._term_count, self._id_count, block_count, self._index_offset, self._table_offset = \
+            HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("not a lexicon file: " + addr)
+        self._block_offsets = array('Q')
+        self._block_terms = []
+        offset: int = self._index_offset
+        for i in range(0, block_count):
+            block_offset, size = BLOCK_ENTRY.unpack_from(self._mm, offset)
+            offset += BLOCK_ENTRY.size
+            self._block_offsets.append(block_offset)
+            self._block_terms.append(self._mm[offset:offset + size])
+            offset += size
+
+    def getTermCount(self) -> int:
+        return self._term_count
+
+    def getIdCount(self) -> int:
+        return self._id_count
+
+    def readBlock(self, block: int) -> [(bytes, int)]:
+        end: int = self._block_offsets[block + 1] if block + 1 < len(self._block_offsets) else self._index_offset
+        offset: int = self._block_offsets[block]
+        result: list = []
+        term: bytes = b""
+        while offset < end:
+            shared, offset = readVarint(self._mm, offset)
+            size, offset = readVarint(self._mm, offset)
+            term = term[:shared] + self._mm[offset:offset + size]
+            offset += size
+            term_id, offset = readVarint(self._mm, offset)
+            result.append((term, term_id))
+        return result
+
+    def get(self, term: str) -> int or None:
+        key: bytes = term.encode('utf-8')
+        block: int = bisect.bisect_right(self._block_terms, key) - 1
+        if block < 0:
+            return None
+        for _term, term_id in self.readBlock(block):
+            if _term == key:
+                return term_id
+            if _term > key:
+                break
+        return None
+
+    def getTerm(self, term_id: int) -> str or None:
+        if term_id < 0 or term_id >= self._id_count:
+            return None
+        block: int = U32.unpack_from(self._mm, self._table_offset + term_id * U32.size)[0]
+        if block == NO_BLOCK:
+            return None
+        for term, _term_id in self.readBlock(block):
+            if _term_id == term_id:
+                return term.decode('utf-8')
+        return None
+
+    def iterPrefix(self, prefix: str = "") -> typing.Iterator[typing.Tuple[str, int]]:
+        # (term, id) pairs of every term starting with prefix, in term order
+        key: bytes = prefix.encode('utf-8')
+        block: int = max(bisect.bisect_left(self._block_terms, key) - 1, 0)
+        while block < len(self._block_offsets):
+            for term, term_id in self.readBlock(block):
+                if term.startswith(key):
+                    yield term.decode('utf-8'), term_id
+                elif term > key:
+                    return
+            block += 1
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+class Lexicon:
+    """
+    the term -> posting list id map. terms of the last compaction are read from the memory-mapped
+    lexicon file and terms added since are kept in memory, by term and by id. save appends those to a
+    log next to the lexicon, so adding a term costs its own bytes, and compact merges everything into a
+    new lexicon file. recently looked up terms are cached.
+    """
+    _addr: str
+    _reader: LexiconReader or None
+    _added: {str, int}
+    _added_terms: {int, str}
+    _pending: [(str, int)]
+    _size: int
+    _cache: LRUCache
+
+    def __init__(self, addr: str, load=False, cache_size=1 << 16):
+        self._addr = addr
+        self._reader = None
+        self._added = {}
+        self._added_terms = {}
+        self._pending = []
+        self._size = 0
+        self._cache = LRUCache(max_entries=cache_size)
+        if load:
+            self.load()
+
+    def load(self):
+        self.close()
+        self._added = {}
+        self._added_terms = {}
+        if os.path.exists(self._addr):
+            self._reader = LexiconReader(self._addr)
+            self._size = self._reader.getIdCount()
+        else:
+            self._size = 0
+        if os.path.exists(self.getLogAddr()):
+            with open(self.getLogAddr(), 'rb') as log_file:
+                buffer: bytes = log_file.read()
+            offset: int = 0
+            while offset < len(buffer):
+                term_id, offset = readVarint(buffer, offset)
+                size, offset = readVarint(buffer, offset)
+                term: str = buffer[offset:offset + size].decode('utf-8')
+                self._added[term] = term_id
+                self._added_terms[term_id] = term
+                offset += size
+                self._size = max(self._size, term_id + 1)
+        self._pending = []
+
+    def getLogAddr(self) -> str:
+        return self._addr + '.log'
+
+    def get(self, term: str, default=None) -> int or None:
+        term_id: int or None = self._added.get(term)
+        if term_id is not None:
+            return term_id
+        if self._reader is None:
+            return default
+        term_id = self._cache.get(term)
+        if term_id is None:
+            term_id = self._reader.get(term)
+            self._cache.put(term, -1 if term_id is None else term_id)
+        return default if term_id is None or term_id < 0 else term_id
+
+    def __getitem__(self, term: str) -> int:
+        term_id: int or None = self.get(term)
+        if term_id is None:
+            raise KeyError(term)
+        return term_id
+
+    def __setitem__(self, term: str, term_id: int):
+        # only new terms are added, a term keeps its id once it has one
+        current: int or None = self.get(term)
+        if current is not None:
+            if current != term_id:
+                raise KeyError(f"{term} already has the id {current}")
+            return
+        self._added[term] = term_id
+        self._added_terms[term_id] = term
+        self._pending.append((term, term_id))
+        self._cache.remove(term)
+        self._size = max(self._size, term_id + 1)
+
+    def __contains__(self, term: str) -> bool:
+        return self.get(term) is not None
+
+    def __len__(self):
+        # ids are handed out in order, so this is also the next free id
+        return self._size
+
+    def getTermCount(self) -> int:
+        return (self._reader.getTermCount() if self._reader is not None else 0) + len(self._added)
+
+    def getTerm(self, term_id: int) -> str or None:
+        term: str or None = self._added_terms.get(term_id)
+        if term is None and self._reader is not None:
+            term = self._reader.getTerm(term_id)
+        return term
+
+    def getTerms(self) -> [str]:
+        # terms indexed by their id
+        terms: [str] = [""] * self._size
+        for term, term_id in self.iterPrefix():
+            terms[term_id] = term
+        return terms
+
+    def items(self) -> typing.Iterator[typing.Tuple[str, int]]:
+        # (term, id) pairs in id order, the order terms were added in
+        for term_id, term in enumerate(self.getTerms()):
+            if term != "":
+                yield term, term_id
+
+    def values(self) -> typing.Iterator[int]:
+        return (term_id for term, term_id in self.items())
+
+    def iterPrefix(self, prefix: str = "") -> typing.Iterator[typing.Tuple[str, int]]:
+        """
+        (term, id) pairs of every term starting with prefix, in term order.
+        """
+        added: list = sorted((term, term_id) for term, term_id in self._added.items() if term.startswith(prefix))
+        if self._reader is None:
+            return iter(added)
+        return heapq.merge(self._reader.iterPrefix(prefix), added)
+
+    def save(self):
+        # appends the terms added since the last save to the log
+        if len(self._pending) == 0:
+            return
+        out = bytearray()
+        for term, term_id in self._pending:
+            term_bytes: bytes = term.encode('utf-8')
+            writeVarint(out, term_id)
+            writeVarint(out, len(term_bytes))
+            out += term_bytes
+        if not os.path.exists(os.path.dirname(self._addr)):
+            os.makedirs(os.path.dirname(self._addr), exist_ok=True)
+        with open(self.getLogAddr(), 'ab') as log_file:
+            log_file.write(out)
+        self._pending = []
+
+    def compact(self):
+        """
+        merges the added terms into a new lexicon file and drops the log.
+        """
+        if len(self._added) == 0 and self._reader is not None:
+            return
+        writeLexicon(self._addr + '.tmp', self.iterPrefix(), self._size)
+        self.close()
+        os.replace(self._addr + '.tmp', self._addr)
+        if os.path.exists(self.getLogAddr()):
+            os.remove(self.getLogAddr())
+        self._added = {}
+        self._added_terms = {}
+        self._pending = []
+        self._reader = LexiconReader(self._addr)
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        self._cache.clear()
+
+    def __str__(self):
+        return str(dict(self.items()))
@@ -0,0 +1,140 @@
+import heapq
+import math
+import mmap
+import os
+import struct
+import typing
+from array import array
+
+MAGIC: bytes = b'IRMOD001'
+HEADER = struct.Struct('<8sIQ')  # magic, row count, row table offset
+ROW = struct.Struct('<BQId')  # kind, data offset, term count, norm
+U32 = struct.Struct('<I')
+
+VECTOR: int = 0
+CENTROID: int = 1
+CLASS_INDEX: int = 2  # rows keyed by posting list id, holding class ids and centroid weights
+
+
+def makeClassIndex(centroids: typing.Iterable[typing.Tuple[int, dict]], size: int = 0) -> {int, dict}:
+    """
+    the feature id -> {class: weight} index of the centroids. every centroid is pruned to its size
+    largest weights by absolute value (0 keeps all, ties keep the lower feature id) and divided by the
+    norm of what is left, so a dot product against the index is the cosine with the pruned centroid.
+    """
+    index: {int, dict} = {}
+    for _class, vector in centroids:
+        items: typing.Iterable[typing.Tuple[int, float]] = vector.items()
+        if 0 < size < len(vector):
+            items = heapq.nlargest(size, items, key=lambda item: (abs(item[1]), -item[0]))
+        items = [(feature, weight) for feature, weight in items if weight != 0]
+        norm: float = math.sqrt(sum(weight * weight for feature, weight in items))
+        for feature, weight in items:
+            index.setdefault(feature, {})[_class] = weight / norm
+    return index
+
+
+class ModelWriter:
+    """
+    writes the document vectors and class centroids as sparse rows in a single file. a row is its
+    posting list ids as uint32 followed by its weights as float32, the csr layout of one matrix row,
+    and the table at the end maps (kind, key) to the offset, length and l2 norm of every row.
+    the class index is the transposed centroid matrix, its rows hold class ids in place of posting
+    list ids.
+    """
+    _addr: str
+    _rows: {typing.Tuple[int, str], tuple}
+
+    def __init__(self, addr: str):
+        self._addr = addr
+        if not os.path.exists(os.path.dirname(addr)):
+            os.makedirs(os.path.dirname(addr), exist_ok=True)
+        self._file = open(addr, 'wb')
+        self._file.write(HEADER.pack(MAGIC, 0, 0))
+        self._rows = {}
+
+    def addRow(self, kind: int, key: str, vector: {int, float}):
+        pl_ids: [int] = sorted(vector.keys())
+        norm: float = math.sqrt(sum(weight * weight for weight in vector.values()))
+        data: bytes = array('I', pl_ids).tobytes() + array('f', [vector[pl_id] for pl_id in pl_ids]).tobytes()
+        self.addRawRow(kind, key, data, len(pl_ids), norm)
+
+    def addRawRow(self, kind: int, key: str, data: bytes, size: int, norm: float):
+        self._rows[(kind, key)] = (self._file.tell(), size, norm)
+        self._file.write(data)
+
+    def hasRow(self, kind: int, key: str) -> bool:
+        return (kind, key) in self._rows
+
+    def close(self):
+        table_offset: int = self._file.tell()
+        for (kind, key), (offset, size, norm) in self._rows.items():
+            key_bytes: bytes = key.encode('utf-8')
+            self._file.write(ROW.pack(kind, offset, size, norm))
+            self._file.write(U32.pack(len(key_bytes)))
+            self._file.write(key_bytes)
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, len(self._rows), table_offset))
+        self._file.close()
+
+
+class ModelReader:
+    """
+    read-only, memory-mapped view of a model file. only the row table is read up front, a row is
+    read from the mapped file when it is asked for.
+    """
+    _rows: [{str, tuple}]
+
+    def __init__(self, addr: str):
+        self._file = open(addr, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, row_count, offset = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("not a model file: " + addr)
+        self._rows = [{}, {}, {}]
+        for i in range(0, row_count):
+            kind, data_offset, size, norm = ROW.unpack_from(self._mm, offset)
+            offset += ROW.size
+            key_size: int = U32.unpack_from(self._mm, offset)[0]
+            offset += U32.size
+            self._rows[kind][self._mm[offset:offset + key_size].decode('utf-8')] = (data_offset, size, norm)
+            offset += key_size
+
+    def getKeys(self, kind: int) -> [str]:
+        return list(self._rows[kind].keys())
+
+    def hasRow(self, kind: int, key: str) -> bool:
+        return key in self._rows[kind]
+
+    def getRow(self, kind: int, key: str) -> (array, array) or None:
+        # (posting list ids, weights) of a row, ids ascending
+        row: tuple or None = self._rows[kind].get(key)
+        if row is None:
+            return None
+        offset, size, norm = row
+        pl_ids = array('I')
+        pl_ids.frombytes(self._mm[offset:offset + size * 4])
+        weights = array('f')
+        weights.frombytes(self._mm[offset + size * 4:offset + size * 8])
+        return pl_ids, weights
+
+    def getVector(self, kind: int, key: str) -> {int, float} or None:
+        row = self.getRow(kind, key)
+        return dict(zip(row[0], row[1])) if row is not None else None
+
+    def getNorm(self, kind: int, key: str) -> float:
+        row: tuple or None = self._rows[kind].get(key)
+        return row[2] if row is not None else 0.0
+
+    def getRawRow(self, kind: int, key: str) -> (bytes, int, float) or None:
+        # the stored bytes of a row, used to carry unchanged rows over to a new model file
+        row: tuple or None = self._rows[kind].get(key)
+        if row is None:
+            return None
+        offset, size, norm = row
+        return self._mm[offset:offset + size * 8], size, norm
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
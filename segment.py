@@ -0,0 +1,252 @@
+import mmap
+import os
+import struct
+from array import array
+
+MAGIC: bytes = b'IRSEG002'
+HEADER = struct.Struct('<8sIIQQ')  # magic, term count, doc count, docs offset, term table offset
+ENTRY = struct.Struct('<QIQI')  # postings offset, postings length, champions offset, champions length
+U32 = struct.Struct('<I')
+U32_PAIR = struct.Struct('<II')
+
+
+def writeVarint(out: bytearray, value: int):
+    if value < 0:
+        raise ValueError("varints must not be negative: " + str(value))
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def readVarint(buffer, offset: int) -> (int, int):
+    # returns the value and the offset right after it
+    result: int = 0
+    shift: int = 0
+    while True:
+        byte: int = buffer[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+
+def encodePostings(records: [(int, array)]) -> bytes:
+    """
+    encodes a posting list given as (doc number, positions) pairs with ascending positions.
+    everything is stored as varints: the posting count, then for every posting the zigzag coded
+    gap to the previous doc number (champion lists are not in doc order), the position count
+    and the gaps between positions.
+    """
+    out = bytearray()
+    writeVarint(out, len(records))
+    last_doc: int = 0
+    doc: int
+    for doc, positions in records:
+        gap: int = doc - last_doc
+        writeVarint(out, gap << 1 if gap >= 0 else ((-gap) << 1) - 1)
+        last_doc = doc
+        writeVarint(out, len(positions))
+        last_position: int = 0
+        for position in positions:
+            writeVarint(out, position - last_position)
+            last_position = position
+    return bytes(out)
+
+
+def decodePostings(buffer, offset: int = 0) -> [(int, array)]:
+    return decodePostingsAt(buffer, offset)[0]
+
+
+def decodePostingsAt(buffer, offset: int) -> ([(int, array)], int):
+    # decodes the posting list at offset, returns it with the offset right after it
+    result: list = []
+    count, offset = readVarint(buffer, offset)
+    doc: int = 0
+    for i in range(0, count):
+        gap, offset = readVarint(buffer, offset)
+        doc += gap >> 1 if gap & 1 == 0 else -((gap + 1) >> 1)
+        size, offset = readVarint(buffer, offset)
+        positions = array('I')
+        position: int = 0
+        for j in range(0, size):
+            gap, offset = readVarint(buffer, offset)
+            position += gap
+            positions.append(position)
+        result.append((doc, positions))
+    return result, offset
+
+
+def encodeTiers(tiers: [[(int, array)]]) -> bytes:
+    # tiers of a champion list, best first, stored one encoded posting list after the other
+    return b"".join(encodePostings(records) for records in tiers)
+
+
+def writeRunRecord(run_file, pl_id: int, term: str, data: bytes):
+    term_bytes: bytes = term.encode('utf-8')
+    run_file.write(U32_PAIR.pack(pl_id, len(term_bytes)))
+    run_file.write(term_bytes)
+    run_file.write(U32.pack(len(data)))
+    run_file.write(data)
+
+
+def readRunRecords(run_file):
+    # yields (posting list id, term, encoded postings) until the end of the run
+    while True:
+        head: bytes = run_file.read(U32_PAIR.size)
+        if len(head) < U32_PAIR.size:
+            return
+        pl_id, term_size = U32_PAIR.unpack(head)
+        term: str = run_file.read(term_size).decode('utf-8')
+        size: int = U32.unpack(run_file.read(U32.size))[0]
+        yield pl_id, term, run_file.read(size)
+
+
+def writeForwardRecord(forward_file, doc_id: str, tfs: [(int, int)]):
+    # one record of the forward index: a document and its (posting list id, tf) pairs in id order
+    doc_bytes: bytes = doc_id.encode('utf-8')
+    out = bytearray()
+    writeVarint(out, len(doc_bytes))
+    out += doc_bytes
+    writeVarint(out, len(tfs))
+    last_id: int = 0
+    for pl_id, tf in tfs:
+        writeVarint(out, pl_id - last_id)
+        writeVarint(out, tf)
+        last_id = pl_id
+    forward_file.write(U32.pack(len(out)))
+    forward_file.write(out)
+
+
+def readForwardRecords(forward_file):
+    # yields (doc id, [(posting list id, tf)]) until the end of the forward index
+    while True:
+        head: bytes = forward_file.read(U32.size)
+        if len(head) < U32.size:
+            return
+        buffer: bytes = forward_file.read(U32.unpack(head)[0])
+        size, offset = readVarint(buffer, 0)
+        doc_id: str = buffer[offset:offset + size].decode('utf-8')
+        offset += size
+        count, offset = readVarint(buffer, offset)
+        tfs: list = []
+        pl_id: int = 0
+        for i in range(0, count):
+            gap, offset = readVarint(buffer, offset)
+            tf, offset = readVarint(buffer, offset)
+            pl_id += gap
+            tfs.append((pl_id, tf))
+        yield doc_id, tfs
+
+
+class SegmentWriter:
+    """
+    writes a single file segment: the encoded posting and champion lists of every term,
+    followed by the table of document ids and a term id -> (offset, length) table.
+    """
+    _addr: str
+    _entries: {int, tuple}
+
+    def __init__(self, addr: str):
+        self._addr = addr
+        if not os.path.exists(os.path.dirname(addr)):
+            os.makedirs(os.path.dirname(addr), exist_ok=True)
+        self._file = open(addr, 'wb')
+        self._file.write(HEADER.pack(MAGIC, 0, 0, 0, 0))
+        self._entries = {}
+
+    def addTerm(self, pl_id: int, postings: bytes, champions: bytes):
+        pl_offset: int = self._file.tell()
+        self._file.write(postings)
+        cl_offset: int = self._file.tell()
+        self._file.write(champions)
+        self._entries[pl_id] = (pl_offset, len(postings), cl_offset, len(champions))
+
+    def hasTerm(self, pl_id: int) -> bool:
+        return pl_id in self._entries
+
+    def close(self, docs: [str], term_count: int):
+        docs_offset: int = self._file.tell()
+        doc: str
+        for doc in docs:
+            doc_bytes: bytes = doc.encode('utf-8')
+            self._file.write(U32.pack(len(doc_bytes)))
+            self._file.write(doc_bytes)
+        table_offset: int = self._file.tell()
+        empty: tuple = (0, 0, 0, 0)
+        for pl_id in range(0, term_count):
+            self._file.write(ENTRY.pack(*self._entries.get(pl_id, empty)))
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, term_count, len(docs), docs_offset, table_offset))
+        self._file.close()
+
+
+class SegmentReader:
+    """
+    read-only, memory-mapped view of a segment. a lookup is a table read plus a decode of the
+    mapped bytes, no file is opened per call.
+    """
+    _term_count: int
+    _docs: [str]
+    _table_offset: int
+
+    def __init__(self, addr: str):
+        self._file = open(addr, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._term_count, doc_count, docs_offset, self._table_offset = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("not a segment file: " + addr)
+        self._docs = []
+        offset: int = docs_offset
+        for i in range(0, doc_count):
+            size: int = U32.unpack_from(self._mm, offset)[0]
+            offset += U32.size
+            self._docs.append(self._mm[offset:offset + size].decode('utf-8'))
+            offset += size
+
+    def getDocs(self) -> [str]:
+        return self._docs
+
+    def getTermCount(self) -> int:
+        return self._term_count
+
+    def _entry(self, pl_id: int) -> tuple or None:
+        if pl_id < 0 or pl_id >= self._term_count:
+            return None
+        entry = ENTRY.unpack_from(self._mm, self._table_offset + pl_id * ENTRY.size)
+        return entry if entry[1] > 0 else None
+
+    def hasTerm(self, pl_id: int) -> bool:
+        return self._entry(pl_id) is not None
+
+    def getPostings(self, pl_id: int) -> [(int, array)] or None:
+        entry = self._entry(pl_id)
+        return decodePostings(self._mm, entry[0]) if entry is not None else None
+
+    def getChampions(self, pl_id: int) -> [(int, array)] or None:
+        tiers = self.getChampionTiers(pl_id)
+        return [record for records in tiers for record in records] if tiers is not None else None
+
+    def getChampionTiers(self, pl_id: int) -> [[(int, array)]] or None:
+        entry = self._entry(pl_id)
+        if entry is None:
+            return None
+        tiers: list = []
+        offset: int = entry[2]
+        while offset < entry[2] + entry[3]:
+            records, offset = decodePostingsAt(self._mm, offset)
+            tiers.append(records)
+        return tiers
+
+    def getRawTerm(self, pl_id: int) -> (bytes, bytes) or None:
+        # encoded posting and champion lists, used to carry unchanged terms over to a new segment
+        entry = self._entry(pl_id)
+        if entry is None:
+            return None
+        return self._mm[entry[0]:entry[0] + entry[1]], self._mm[entry[2]:entry[2] + entry[3]]
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
@@ -0,0 +1,165 @@
+"""
+vocabulary selection run between indexing and caching the vectors. terms are first cut by document
+frequency, then optionally ranked by how much they say about the classes, chi-square or information
+gain computed from the postings and the class labels, and the best of them become the vocabulary
+of the document vectors and centroids. run as a script on a trained index, it reports the accuracy
+on the test set against the size of the vocabulary and of the model:
+
+    python selection.py --method chi2 --sizes 500,1000,2000,5000,0 --min-df 2
+"""
+import argparse
+import heapq
+import math
+import os
+import typing
+
+from indexer import Dictionary, Indexer, MODEL_ADDR
+from instrument import instruments
+
+METHODS: [str] = ["chi2", "ig"]
+
+
+def chiSquare(df: int, class_df: int, class_size: int, doc_count: int) -> float:
+    # chi-square of the 2x2 table of a term and a class: in the class or not, with the term or not
+    a: int = class_df
+    b: int = df - class_df
+    c: int = class_size - class_df
+    d: int = doc_count - df - c
+    denominator: int = (a + c) * (b + d) * (a + b) * (c + d)
+    return doc_count * (a * d - c * b) ** 2 / denominator if denominator > 0 else 0.0
+
+
+def _xlogx(x: float) -> float:
+    return x * math.log(x) if x > 0 else 0.0
+
+
+class FeatureSelector:
+    """
+    min_df and max_df bound the document frequency of a kept term, as a number of documents for an int
+    or a share of them for a float, which is below 1.0 for min_df and up to 1.0 for max_df. with a method, the terms left are scored and the size best kept
+    (size 0 keeps all of them): chi2 scores a term by its best chi-square over the classes it occurs
+    in, ig by the information gain of its presence on the class of a document. both only visit the
+    classes a term occurs in, so scoring costs the (term, class) pairs of the index.
+    """
+    _min_df: float
+    _max_df: float
+    _method: str or None
+    _size: int
+
+    def __init__(self, min_df: float = 1, max_df: float = 1.0, method: str = None, size: int = 0):
+        if method is not None and method not in METHODS:
+            raise ValueError("unknown feature selection method: " + method)
+        # min_df=1.0 would keep the terms of every document only, when one document is meant
+        if isinstance(min_df, float) and not 0.0 <= min_df < 1.0:
+            raise ValueError(f"min_df {min_df} is a share of the documents, an int is a number of them")
+        if isinstance(max_df, float) and not 0.0 < max_df <= 1.0:
+            raise ValueError(f"max_df {max_df} is a share of the documents, an int is a number of them")
+        self._min_df = min_df
+        self._max_df = max_df
+        self._method = method
+        self._size = size
+
+    def select(self, dictionary: Dictionary) -> [int]:
+        """
+        the posting list ids of the selected terms.
+        """
+        doc_count: int = dictionary.getDocCount()
+        min_df: float = self._min_df * doc_count if isinstance(self._min_df, float) else self._min_df
+        max_df: float = self._max_df * doc_count if isinstance(self._max_df, float) else self._max_df
+        dfs = dictionary.getDocFrequencies()
+        candidates: [int] = [pl_id for pl_id, df in enumerate(dfs) if df > 0 and min_df <= df <= max_df]
+        if self._method is None:
+            return candidates
+        scores: {int, float} = self.getScores(dictionary, candidates)
+        if 0 < self._size < len(candidates):
+            return heapq.nlargest(self._size, candidates, key=lambda pl_id: scores.get(pl_id, 0.0))
+        return candidates
+
+    def getScores(self, dictionary: Dictionary, candidates: typing.Iterable[int]) -> {int, float}:
+        class_dfs, class_sizes = dictionary.getClassFrequencies()
+        doc_count: int = sum(class_sizes.values())
+        dfs = dictionary.getDocFrequencies()
+        candidates = set(candidates)
+        scores: {int, float} = {}
+        if self._method == "chi2":
+            for _class, class_df in class_dfs.items():
+                for pl_id, df in class_df.items():
+                    if pl_id in candidates:
+                        score: float = chiSquare(dfs[pl_id], df, class_sizes[_class], doc_count)
+                        if score > scores.get(pl_id, 0.0):
+                            scores[pl_id] = score
+            return scores
+        # information gain: H(C) - P(t) H(C|t) - P(not t) H(C|not t), where the sum over the classes
+        # without the term is the sum over every class corrected for the classes with it
+        n_log_n: float = sum(_xlogx(size) for size in class_sizes.values())
+        with_term: {int, float} = {}
+        without_term: {int, float} = {}
+        for _class, class_df in class_dfs.items():
+            size: int = class_sizes[_class]
+            for pl_id, df in class_df.items():
+                if pl_id in candidates:
+                    with_term[pl_id] = with_term.get(pl_id, 0.0) + _xlogx(df)
+                    without_term[pl_id] = without_term.get(pl_id, 0.0) + _xlogx(size - df) - _xlogx(size)
+        entropy: float = math.log(doc_count) - n_log_n / doc_count
+        for pl_id in with_term.keys():
+            df: int = min(dfs[pl_id], doc_count)
+            rest: int = doc_count - df
+            conditional: float = (_xlogx(df) - with_term[pl_id]) / doc_count
+            conditional += (_xlogx(rest) - (n_log_n + without_term[pl_id])) / doc_count
+            scores[pl_id] = entropy - conditional
+        return scores
+
+
+def selectVocabulary(indexer: Indexer, selector: FeatureSelector or None):
+    """
+    applies a selection to a trained index: reweights the vectors on the new vocabulary and rebuilds
+    the centroids. None brings back the whole vocabulary.
+    """
+    dictionary: Dictionary = indexer.getDictionary()
+    with instruments.stage("select"):
+        dictionary.setVocabulary(selector.select(dictionary) if selector is not None else None)
+    indexer.refresh()
+
+
+def report(method: str or None, sizes: [int], min_df: float = 1, max_df: float = 1.0, workers: int = 1) -> [dict]:
+    """
+    accuracy on the test set for every vocabulary size, along with the size of the model. the index
+    is left with the last selection.
+    """
+    from tester import evaluate
+    indexer = Indexer(dictionary_load=True)
+    dictionary: Dictionary = indexer.getDictionary()
+    rows: [dict] = []
+    for size in sizes:
+        selectVocabulary(indexer, FeatureSelector(min_df=min_df, max_df=max_df, method=method, size=size))
+        evaluation = evaluate(workers=workers)
+        rows.append({
+            "size": size,
+            "vocabulary": dictionary.getVocabularySize(),
+            "model_bytes": os.path.getsize(MODEL_ADDR),
+            "accuracy": evaluation.getAccuracy(),
+            "docs_per_second": evaluation.getThroughput(),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="reports accuracy against vocabulary size on a trained index")
+    parser.add_argument("--method", default="chi2", choices=METHODS + ["none"])
+    parser.add_argument("--sizes", default="500,1000,2000,5000,0", help="terms to keep, 0 keeps every term")
+    parser.add_argument("--min-df", type=float, default=1, help="a number of documents, or a share below 1.0")
+    parser.add_argument("--max-df", type=float, default=1.0, help="a number of documents, or a share up to 1.0")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    min_df: float = int(args.min_df) if args.min_df >= 1 else args.min_df
+    max_df: float = int(args.max_df) if args.max_df > 1 else args.max_df
+    rows: [dict] = report(None if args.method == "none" else args.method,
+                          [int(size) for size in args.sizes.split(",")], min_df, max_df, args.workers)
+    print("size | vocabulary | model bytes | accuracy | docs/sec")
+    for row in rows:
+        print(f"{row['size']} | {row['vocabulary']} | {row['model_bytes']} | {round(row['accuracy'] * 100, 2)}% | "
+              f"{round(row['docs_per_second'], 2)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,402 @@
+"""
+long running classification service. the lexicon, the term statistics and the centroids are loaded
+once, and documents sent concurrently are gathered into micro batches scored with one
+Classifier.classify_batch call. served as a small http/1.1 api over tcp or a unix socket:
+
+POST /classify    a raw document as the body, or json {"docs": [...]} for several at once
+GET  /metrics     latency percentiles, throughput and batch sizes
+GET  /health      200 once the model is loaded
+
+    python service.py --unix ./dist/service.sock
+    python service.py --host 127.0.0.1 --port 8080
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import logging
+import math
+import os
+import time
+import typing
+
+from classifier import Classifier, KnnClassifier
+from instrument import instruments
+
+log = logging.getLogger("service")
+
+MAX_BODY_SIZE: int = 16 << 20
+STATUS_TEXT: {int, str} = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class ServiceMetrics:
+    """
+    latencies of the most recent requests, from the moment a document is queued until its result is
+    ready, and the sizes of the batches they were scored in.
+    """
+    _latencies: typing.Deque[float]
+    _batch_sizes: typing.Deque[int]
+    _requests: int
+    _errors: int
+    _batches: int
+    _start: float
+
+    def __init__(self, window: int = 10000):
+        self._latencies = collections.deque(maxlen=window)
+        self._batch_sizes = collections.deque(maxlen=window)
+        self._requests = 0
+        self._errors = 0
+        self._batches = 0
+        self._start = time.perf_counter()
+
+    def addBatch(self, latencies: [float], errors: int = 0):
+        self._latencies.extend(latencies)
+        self._batch_sizes.append(len(latencies))
+        self._requests += len(latencies)
+        self._errors += errors
+        self._batches += 1
+
+    def getPercentile(self, p: float) -> float:
+        # nearest rank percentile of the recent latencies, in seconds
+        if len(self._latencies) == 0:
+            return 0.0
+        latencies: [float] = sorted(self._latencies)
+        return latencies[min(max(math.ceil(p / 100 * len(latencies)) - 1, 0), len(latencies) - 1)]
+
+    def toDict(self) -> dict:
+        uptime: float = time.perf_counter() - self._start
+        return {
+            "requests": self._requests,
+            "errors": self._errors,
+            "batches": self._batches,
+            "uptime_seconds": uptime,
+            "docs_per_second": self._requests / uptime if uptime > 0 else 0.0,
+            "mean_batch_size": sum(self._batch_sizes) / len(self._batch_sizes) if len(self._batch_sizes) > 0 else 0.0,
+            "latency_ms": {f"p{p}": self.getPercentile(p) * 1000 for p in (50, 90, 99, 99.9)},
+        }
+
+
+class ClassificationService:
+    """
+    micro batching in front of a classifier. a document waits at most max_wait seconds for others to
+    join its batch, and a batch is scored as soon as it holds max_batch documents. batches are scored
+    one at a time on a single worker thread, so the event loop keeps accepting requests meanwhile and
+    the dictionary is never used from two threads.
+    """
+    _classifier: Classifier
+    _max_batch: int
+    _max_wait: float
+    _metrics: ServiceMetrics
+    _queue: asyncio.Queue or None
+
+    def __init__(self, classifier: Classifier = None, max_batch: int = 32, max_wait: float = 0.002):
+        self._classifier = classifier if classifier is not None else Classifier()
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        self._metrics = ServiceMetrics()
+        self._queue = None
+        self._task = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        instruments.gauge("service", self.getMetrics)
+
+    async def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def classify(self, doc: str) -> ([int], {int, float}):
+        """
+        the guessed classes and the score of every class, like Classifier.classify.
+        """
+        await self.start()
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        await self._queue.put((doc, time.perf_counter(), future))
+        return await future
+
+    async def classifyMany(self, docs: [str]) -> [([int], {int, float})]:
+        return list(await asyncio.gather(*(self.classify(doc) for doc in docs)))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch: [tuple] = [await self._queue.get()]
+            deadline: float = loop.time() + self._max_wait
+            while len(batch) < self._max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout: float = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._score(batch)
+
+    async def _score(self, batch: [tuple]):
+        docs: [str] = [doc for doc, queued, future in batch]
+        try:
+            results: list = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._classifier.classify_batch, docs)
+        except Exception as e:
+            for doc, queued, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            self._metrics.addBatch([time.perf_counter() - queued for doc, queued, future in batch], errors=len(batch))
+            return
+        now: float = time.perf_counter()
+        for (doc, queued, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+        self._metrics.addBatch([now - queued for doc, queued, future in batch])
+        instruments.count("documents_classified", len(batch))
+
+    def getMetrics(self) -> dict:
+        metrics: dict = self._metrics.toDict()
+        metrics["queued"] = self._queue.qsize() if self._queue is not None else 0
+        metrics["max_batch"] = self._max_batch
+        metrics["max_wait_ms"] = self._max_wait * 1000
+        return metrics
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=True)
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+async def readMessage(reader: asyncio.StreamReader) -> (str, {str, str}, bytes) or None:
+    """
+    the start line, the headers (lower case names) and the body of one http message, None at the end
+    of the connection. only bodies with a content-length are supported.
+    """
+    start_line: bytes = await reader.readline()
+    if start_line == b"":
+        return None
+    headers: {str, str} = {}
+    while True:
+        line: bytes = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    size: int = int(headers.get("content-length", "0"))
+    if size > MAX_BODY_SIZE:
+        raise HttpError(413, "body is larger than " + str(MAX_BODY_SIZE) + " bytes")
+    body: bytes = await reader.readexactly(size) if size > 0 else b""
+    return start_line.decode("latin-1").strip(), headers, body
+
+
+def writeMessage(writer: asyncio.StreamWriter, start_line: str, body: bytes, headers: {str, str} = None):
+    head: str = start_line + "\r\n"
+    for name, value in dict(headers or {}, **{"Content-Length": str(len(body))}).items():
+        head += f"{name}: {value}\r\n"
+    writer.write(head.encode("latin-1") + b"\r\n" + body)
+
+
+class ServiceServer:
+    """
+    the http front of a ClassificationService. connections are kept alive, so a client pays for the
+    connection once and not on every document.
+    """
+    _service: ClassificationService
+
+    def __init__(self, service: ClassificationService):
+        self._service = service
+        self._server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080, path: str = None):
+        """
+        listens on a unix socket when path is given, on host:port otherwise.
+        """
+        await self._service.start()
+        if path is not None:
+            if os.path.exists(path):
+                os.remove(path)
+            self._server = await asyncio.start_unix_server(self._handle, path=path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host=host, port=port)
+        return self._server
+
+    async def serveForever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await self._service.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    message = await readMessage(reader)
+                except (HttpError, ValueError) as e:
+                    # the rest of the stream can't be trusted after a bad message
+                    message = None
+                    status = getattr(e, "status", 400)
+                    writeMessage(writer, f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+                                 json.dumps({"error": str(e)}).encode("utf-8"), {"Connection": "close"})
+                    await writer.drain()
+                if message is None:
+                    break
+                start_line, headers, body = message
+                try:
+                    status, response = await self._route(start_line, headers, body)
+                except HttpError as e:
+                    status, response = e.status, {"error": str(e)}
+                except Exception:
+                    # a failure of the service itself, the request was fine and the connection is kept
+                    log.exception("error serving " + start_line)
+                    status, response = 500, {"error": "internal server error"}
+                writeMessage(writer, f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+                             json.dumps(response, ensure_ascii=False).encode("utf-8"),
+                             {"Content-Type": "application/json; charset=utf-8"})
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, start_line: str, headers: {str, str}, body: bytes) -> (int, dict):
+        parts: [str] = start_line.split()
+        if len(parts) != 3:
+            raise HttpError(400, "malformed request line")
+        method, path = parts[0], parts[1].split("?")[0]
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/metrics":
+            return 200, self._service.getMetrics()
+        if path != "/classify":
+            raise HttpError(404, "no such path: " + path)
+        if method != "POST":
+            raise HttpError(405, "use POST to classify")
+        if headers.get("content-type", "").startswith("application/json"):
+            results = await self._service.classifyMany(parseDocs(body))
+            return 200, {"results": [toResponse(classes, scores) for classes, scores in results]}
+        try:
+            doc: str = body.decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise HttpError(400, "body is not utf-8: " + str(e))
+        classes, scores = await self._service.classify(doc)
+        return 200, toResponse(classes, scores)
+
+
+def parseDocs(body: bytes) -> [str]:
+    # the documents of a json request, {"docs": [...]} or {"doc": "..."}
+    try:
+        request = json.loads(body.decode("utf-8"))
+    except ValueError as e:
+        raise HttpError(400, "malformed json: " + str(e))
+    if not isinstance(request, dict) or ("docs" not in request and "doc" not in request):
+        raise HttpError(400, 'expected a json object with "docs" or "doc"')
+    docs = request["docs"] if "docs" in request else [request["doc"]]
+    if not isinstance(docs, list) or not all(isinstance(doc, str) for doc in docs):
+        raise HttpError(400, '"docs" has to be a list of strings and "doc" a string')
+    return docs
+
+
+def toResponse(classes: [int], scores: {int, float}) -> dict:
+    return {"classes": classes, "scores": {str(_class): score for _class, score in scores.items()}}
+
+
+class ServiceClient:
+    """
+    keep-alive client of a ServiceServer over tcp or a unix socket. one request at a time per client,
+    open one client per concurrent caller.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8080, path: str = None):
+        self._host = host
+        self._port = port
+        self._path = path
+        self._reader = None
+        self._writer = None
+
+    async def connect(self):
+        if self._path is not None:
+            self._reader, self._writer = await asyncio.open_unix_connection(self._path)
+        else:
+            self._reader, self._writer = await asyncio.open_connection(self._host, self._port)
+
+    async def request(self, method: str, path: str, body: bytes = b"", content_type: str = "text/plain") -> (int, dict):
+        if self._writer is None:
+            await self.connect()
+        writeMessage(self._writer, f"{method} {path} HTTP/1.1", body,
+                     {"Host": self._host, "Content-Type": content_type + "; charset=utf-8"})
+        await self._writer.drain()
+        message = await readMessage(self._reader)
+        if message is None:
+            raise ConnectionError("connection closed by the service")
+        start_line, headers, response = message
+        return int(start_line.split()[1]), json.loads(response.decode("utf-8"))
+
+    async def classify(self, doc: str) -> dict:
+        status, response = await self.request("POST", "/classify", doc.encode("utf-8"))
+        if status != 200:
+            raise RuntimeError(f"classification failed with {status}: {response.get('error')}")
+        return response
+
+    async def classifyMany(self, docs: [str]) -> [dict]:
+        status, response = await self.request("POST", "/classify", json.dumps({"docs": docs}).encode("utf-8"),
+                                              content_type="application/json")
+        if status != 200:
+            raise RuntimeError(f"classification failed with {status}: {response.get('error')}")
+        return response["results"]
+
+    async def getMetrics(self) -> dict:
+        return (await self.request("GET", "/metrics"))[1]
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._reader = None
+
+
+async def serve(args):
+    classifier: Classifier = KnnClassifier(k=args.knn) if args.knn > 0 else Classifier()
+    server = ServiceServer(ClassificationService(classifier, max_batch=args.max_batch,
+                                                 max_wait=args.max_wait_ms / 1000))
+    await server.start(host=args.host, port=args.port, path=args.unix)
+    print("listening on " + (args.unix if args.unix is not None else f"{args.host}:{args.port}"))
+    try:
+        await server.serveForever()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serves the trained classifier over http")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix", default=None, help="path of a unix socket to listen on instead of host:port")
+    parser.add_argument("--max-batch", type=int, default=32, help="most documents scored together")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="longest a document waits for its batch")
+    parser.add_argument("--knn", type=int, default=0, help="classify by the k nearest training documents")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,52 +1,106 @@
+import functools
 import typing
 import re
 from tokenizer import Token
+from instrument import instruments
+
+# correct_invalid_chars as a translation table: persian digits to ascii, arabic letters to their
+# persian forms, zero width non-joiner / rtl mark to space, and harakat dropped
+INVALID_CHARS = str.maketrans({
+    "۱": "1", "۲": "2", "۳": "3", "۴": "4", "۵": "5",
+    "۶": "6", "۷": "7", "۸": "8", "۹": "9", "۰": "0",
+    'ي': 'ی',
+    'ة': 'ه', 'ۀ': 'ه',
+    '\u200c': ' ', '\u200f': ' ',
+    'ك': 'ک',
+    'ؤ': 'و',
+    'إ': 'ا', 'أ': 'ا',
+    '\u064B': None,  # تنوین فتحه
+    '\u064C': None,  # تنوین ضمه
+    '\u064D': None,  # تنوین کسره
+    '\u064E': None,  # فتحه
+    '\u064F': None,  # ضمه
+    '\u0650': None,  # کسره
+    '\u0651': None,  #
+    '\u0652': None,  # سکون
+})
+REDUNDANT_NOTATIONS = str.maketrans({"،": None, "؟": None, ":": None, "/": None, "\\": None})
+ZAMIR_RULE = re.compile("^(?P<stem>.+?)((?<=(ا|و))ی)?(ها)?(ی)?((ات)?( تان|تان| مان|مان| شان|شان)|ی|م|ت|ش|ء)$")
+ZAMIR_STATE_RULE = re.compile("^(?P<stem>.+?)((?<=(ا|و))ی)?(ها)?(ی)?(ات|ی|م|ت|ش| تان|تان| مان|مان| شان|شان|ء)$")
 
 
 class Stemmer:
-    _stop_words: [str]
+    _stop_words: typing.FrozenSet[str]
 
-    def __init__(self):
+    def __init__(self, cache_size: int = 1 << 16):
+        """
+        persian wikipedia repeats words a lot, so normalized words are memoized in a bounded
+        lru cache of cache_size words (0 disables it).
+        """
         with open("./stopwords/stopwords.txt", encoding="utf-8") as file:
-            self._stop_words = file.read().strip().split()
+            self._stop_words = frozenset(file.read().strip().split())
+        self.normalize_word = self._normalize_word
+        if cache_size > 0:
+            self.normalize_word = functools.lru_cache(maxsize=cache_size)(self._normalize_word)
+        instruments.gauge("stemmer_cache", self.getCacheInfo)
+
+    def getCacheInfo(self) -> dict:
+        # hits, misses, maxsize and currsize of the word cache
+        cache_info = getattr(self.normalize_word, "cache_info", None)
+        return cache_info()._asdict() if cache_info is not None else {}
 
     def normalize_list(self, tokens_list: [Token]) -> list:
         result: list = []
+        normalize_word = self.normalize_word
         token: Token
         for token in tokens_list:
-            nw = self._normalize_word(token.getWord())
+            nw = normalize_word(token.getWord())
             if nw != "":
-                if nw == "است":
-                    print("shit")
                 result.append(Token(nw, token.getPosition()))
-                del token
-        del tokens_list
         return result
 
+    def normalize_words(self, words: typing.Iterable[str], start: int = 1) -> [(str, int)]:
+        """
+        normalize_list over plain words, numbered from start like Tokenizer.tokenizeDoc does.
+        returns (normalized word, position) pairs without building a Token per word.
+        """
+        return list(self.iter_normalized(words, start))
+
+    def iter_normalized(self, words: typing.Iterable[str], start: int = 1) -> typing.Iterator[typing.Tuple[str, int]]:
+        # lazy normalize_words, for words streamed by Tokenizer.iterWords
+        normalize_word = self.normalize_word
+        position: int = start
+        for word in words:
+            nw = normalize_word(word)
+            if nw != "":
+                yield nw, position
+            position += 1
+
     def _normalize_word(self, word: str) -> str:
         result: str = word.strip()
 
-        result = self.correct_invalid_chars(result)
+        result = result.translate(INVALID_CHARS)
         if result == "":
             return ""
         result = self.remove_redundant_notations(result)
         if result == "":
             return ""
-        if self._stop_words.__contains__(result):  # checking stop words
+        if result in self._stop_words:  # checking stop words
             return ""
-        result = self.removeZamir(result, False)
+        result = ZAMIR_RULE.sub(r"\g<stem>", result).strip()
         if result == "":
             return ""
         result = self.removeHa(result)
         if result == "":
             return ""
-        if self._stop_words.__contains__(result):  # checking stop words
+        if result in self._stop_words:  # checking stop words
             return ""
         return result
 
     @staticmethod
     def hasNumbers(word: str):
-        return any(char.isdigit() for char in word)
+        # letters are never digits, so most words are settled by isalpha alone
+        return not word.isalpha() and any(char.isdigit() for char in word)
 
     @staticmethod
     def removeHa(word: str):
@@ -57,7 +111,7 @@ class Stemmer:
         return word
 
     def remove_redundant_notations(self, word: str) -> str:
-        word = word.replace("،", "").replace("؟", "").replace(":", "").replace("/", "").replace("\\", "")
+        word = word.translate(REDUNDANT_NOTATIONS)
 
         if self.hasNumbers(word):
             return word
@@ -65,67 +119,13 @@ class Stemmer:
             return word.replace(".", "")
 
     def removeZamir(self, sInput, bState):
-        ln = 0
-        s_rule = "^(?P<stem>.+?)((?<=(ا|و))ی)?(ها)?(ی)?((ات)?( تان|تان| مان|مان| شان|شان)|ی|م|ت|ش|ء)$"
-        ln += 1
-        if bState:
-            ln += 2
-            s_rule = "^(?P<stem>.+?)((?<=(ا|و))ی)?(ها)?(ی)?(ات|ی|م|ت|ش| تان|تان| مان|مان| شان|شان|ء)$"
-        ln += 1
-        return self.extractStem(sInput, s_rule)
+        return self.extractStem(sInput, ZAMIR_STATE_RULE if bState else ZAMIR_RULE)
 
     @staticmethod
-    def extractStem(s_input, s_rule, s_replacement="\g<stem>"):
-        r = 0
+    def extractStem(s_input, s_rule, s_replacement=r"\g<stem>"):
+        # s_rule is a pattern string or a compiled pattern
         return re.sub(s_rule, s_replacement, s_input).strip()
-        r += 1
 
     @staticmethod
     def correct_invalid_chars(word: str) -> str:
-        new_string: [str] = []
-        for char in word:
-            if char == "۱":
-                new_string.append("1")
-            elif char == "۲":
-                new_string.append("2")
-            elif char == "۳":
-                new_string.append("3")
-            elif char == "۴":
-                new_string.append("4")
-            elif char == "۵":
-                new_string.append("5")
-            elif char == "۶":
-                new_string.append("6")
-            elif char == "۷":
-                new_string.append("7")
-            elif char == "۸":
-                new_string.append("8")
-            elif char == "۹":
-                new_string.append("9")
-            elif char == "۰":
-                new_string.append("0")
-            elif char == 'ي':
-                new_string.append('ی')
-            elif char in ['ة', 'ۀ']:
-                new_string.append('ه')
-            elif char in ['‌', '‏']:
-                new_string.append(' ')
-            elif char == 'ك':
-                new_string.append('ک')
-            elif char == 'ؤ':
-                new_string.append('و')
-            elif char in ['إ', 'أ']:
-                new_string.append('ا')
-            elif char in ['\u064B',  # تنوین فتحه
-                          '\u064C',  # تنوین ضمه
-                          '\u064D',  # تنوین کسره
-                          '\u064E',  # فتحه
-                          '\u064F',  # ضمه
-                          '\u0650',  # کسره
-                          '\u0651',  #
-                          '\u0652']:  # سکون
-                pass
-            else:
-                new_string.append(char)
-
-        return ''.join(new_string)
+        return word.translate(INVALID_CHARS)
@@ -0,0 +1,84 @@
+import os
+import struct
+from array import array
+
+MAGIC: bytes = b'IRSTAT01'
+HEADER = struct.Struct('<8sII')  # magic, term count, document count
+
+
+class TermStats:
+    """
+    per term statistics indexed by posting list id: document frequency, collection frequency and the
+    highest tf of any document, along with the number of documents in the index. kept in memory as
+    three arrays and saved as one file, so weights never need a posting list.
+    """
+    _addr: str
+    _dfs: array
+    _cfs: array
+    _max_tfs: array
+    _doc_count: int
+
+    def __init__(self, addr: str, load=False):
+        self._addr = addr
+        self._dfs = array('I')
+        self._cfs = array('I')
+        self._max_tfs = array('I')
+        self._doc_count = 0
+        if load:
+            self.load()
+
+    def exists(self) -> bool:
+        return os.path.exists(self._addr)
+
+    def load(self):
+        with open(self._addr, 'rb') as stats_file:
+            magic, term_count, self._doc_count = HEADER.unpack(stats_file.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("not a term statistics file: " + self._addr)
+            for values in (self._dfs, self._cfs, self._max_tfs):
+                del values[:]
+                values.fromfile(stats_file, term_count)
+
+    def save(self):
+        if not os.path.exists(os.path.dirname(self._addr)):
+            os.makedirs(os.path.dirname(self._addr), exist_ok=True)
+        with open(self._addr + '.tmp', 'wb') as stats_file:
+            stats_file.write(HEADER.pack(MAGIC, len(self._dfs), self._doc_count))
+            for values in (self._dfs, self._cfs, self._max_tfs):
+                values.tofile(stats_file)
+        os.replace(self._addr + '.tmp', self._addr)
+
+    def setTerm(self, pl_id: int, df: int, cf: int, max_tf: int):
+        if pl_id >= len(self._dfs):
+            grow = array('I', [0]) * (pl_id + 1 - len(self._dfs))
+            for values in (self._dfs, self._cfs, self._max_tfs):
+                values.extend(grow)
+        self._dfs[pl_id] = df
+        self._cfs[pl_id] = cf
+        self._max_tfs[pl_id] = max_tf
+
+    def getDocFrequency(self, pl_id: int) -> int:
+        return self._dfs[pl_id] if 0 <= pl_id < len(self._dfs) else 0
+
+    def getCollectionFrequency(self, pl_id: int) -> int:
+        return self._cfs[pl_id] if 0 <= pl_id < len(self._cfs) else 0
+
+    def getMaxTermFrequency(self, pl_id: int) -> int:
+        return self._max_tfs[pl_id] if 0 <= pl_id < len(self._max_tfs) else 0
+
+    def getDocFrequencies(self) -> array:
+        return self._dfs
+
+    def getTermCount(self) -> int:
+        return len(self._dfs)
+
+    def getDocCount(self) -> int:
+        return self._doc_count
+
+    def addDocCount(self, count: int):
+        self._doc_count = max(self._doc_count + count, 0)
+
+    def clear(self):
+        for values in (self._dfs, self._cfs, self._max_tfs):
+            del values[:]
+        self._doc_count = 0
@@ -1,10 +1,15 @@
 import math
-from indexer import Dictionary, PostingList, Posting, DICT_DIST, POSTING_DIST
+import multiprocessing
+import time
+from indexer import Dictionary, PostingList, Posting, DICT_DIST, POSTING_DIST, loadTrainedClasses, imapWindows
 import os
 import pickle
 
 from tokenizer import Token, Tokenizer
 from stemmer import Stemmer
+from classifier import Classifier, KnnClassifier, HashingClassifier
+from corpus import Corpus, DirectoryCorpus, discoverClasses
+from instrument import instruments, initCounted
 
 CENTROIDS_DIR = "./dist/centroids/"
 TEST_SET_DIR = "./dataset/test/"
@@ -14,27 +19,32 @@ class Tester:
     _dictionary: Dictionary
     _tokenizer: Tokenizer
     _stemmer: Stemmer
+    _classifier: Classifier
 
-    def __init__(self):
-        self._dictionary = Dictionary(load=True)
+    def __init__(self, engine=False, knn: int = 0, hashing=False):
+        """
+        with knn > 0, documents are classified by their knn nearest training documents instead of the centroids.
+        with hashing, by the hashed centroids, without loading the dictionary.
+        """
         self._tokenizer = Tokenizer()
         self._stemmer = Stemmer()
-        print(self._dictionary)
+        self._engine = None
+        if hashing:
+            self._dictionary = None
+            self._classifier = HashingClassifier()
+            return
+        self._dictionary = Dictionary(load=True)
+        if engine:
+            from engine import SparseEngine  # needs numpy and scipy
+            self._engine = SparseEngine(self._dictionary)
+            self._engine.fit()
+        if knn > 0:
+            self._classifier = KnnClassifier(self._dictionary, k=knn)
+        else:
+            self._classifier = Classifier(self._dictionary, engine=self._engine)
 
     def test_doc(self, doc: str, real_class: int) -> bool:
-        query_tokens = self._tokenizer.tokenizeDoc(doc)
-        normalized_query_tokens = self._stemmer.normalize_list(query_tokens)
-        test_vector = self.buildVector(normalized_query_tokens)
-        centroids = self._dictionary.getCentroids()
-        compare_result: dict = {}
-        for _class, c_vector in centroids:
-            _score = self.cosine(test_vector, c_vector)
-            compare_result[_class] = _score
-        _max_score = max(*compare_result.values())
-        _guessed_classes: list = []
-        for key, val in compare_result.items():
-            if val == _max_score:
-                _guessed_classes.append(key)
+        _guessed_classes, compare_result = self._classifier.classify(doc)
 
         if real_class in _guessed_classes:
             print(f"Guessed Right. class: {real_class}")
@@ -44,6 +54,9 @@ class Tester:
             return False
 
     def buildVector(self, query_tokens: [Token]) -> dict:
+        if self._dictionary is None:
+            # hashed features in place of terms
+            return self._classifier.buildVector(query_tokens)
         idfs: dict = {}
         tfs: dict = {}
         t: Token
@@ -86,23 +99,146 @@ class Tester:
         print(vec)
 
 
+class Evaluation:
+    """
+    running confusion matrix of an evaluation. like Tester.test_doc, a document counts as guessed right
+    when its class is among the best scoring ones; otherwise the first guessed class is the prediction.
+    """
+    _classes: [int]
+    _confusion: {int, dict}
+    _size: int
+    _correct: int
+    _start: float
+    _elapsed: float
+
+    def __init__(self, classes: [int]):
+        self._classes = list(classes)
+        self._confusion = {real: {guessed: 0 for guessed in self._classes} for real in self._classes}
+        self._size = 0
+        self._correct = 0
+        self._start = time.perf_counter()
+        self._elapsed = 0.0
+
+    def add(self, real_class: int, guessed_classes: [int]):
+        if len(guessed_classes) == 0:
+            # nothing to compare against, only counts against the accuracy
+            self._size += 1
+            return
+        predicted: int = real_class if real_class in guessed_classes else guessed_classes[0]
+        self._confusion[real_class][predicted] += 1
+        self._size += 1
+        if predicted == real_class:
+            self._correct += 1
+        self._elapsed = time.perf_counter() - self._start
+
+    def getSize(self) -> int:
+        return self._size
+
+    def getAccuracy(self) -> float:
+        return self._correct / self._size if self._size > 0 else 0.0
+
+    def getPrecision(self, _class: int) -> float:
+        predicted: int = sum(self._confusion[real][_class] for real in self._classes)
+        return self._confusion[_class][_class] / predicted if predicted > 0 else 0.0
+
+    def getRecall(self, _class: int) -> float:
+        real: int = sum(self._confusion[_class].values())
+        return self._confusion[_class][_class] / real if real > 0 else 0.0
+
+    def getConfusionMatrix(self) -> [[int]]:
+        # rows are real classes, columns are predicted classes, both in the order of the classes
+        return [[self._confusion[real][guessed] for guessed in self._classes] for real in self._classes]
+
+    def getThroughput(self) -> float:
+        return self._size / self._elapsed if self._elapsed > 0 else 0.0
+
+    def toDict(self) -> dict:
+        return {
+            "size": self._size,
+            "accuracy": self.getAccuracy(),
+            "precision": {_class: self.getPrecision(_class) for _class in self._classes},
+            "recall": {_class: self.getRecall(_class) for _class in self._classes},
+            "confusion_matrix": self.getConfusionMatrix(),
+            "docs_per_second": self.getThroughput(),
+        }
+
+    def __str__(self):
+        s: str = f"documents: {self._size}\n"
+        s += f"accuracy: {self.getAccuracy() * 100}%\n"
+        s += f"throughput: {round(self.getThroughput(), 2)} docs/sec\n"
+        s += "class | precision | recall\n"
+        for _class in self._classes:
+            s += f"{_class} | {round(self.getPrecision(_class) * 100, 2)}% | {round(self.getRecall(_class) * 100, 2)}%\n"
+        s += "confusion matrix (rows: real class, columns: guessed class)\n"
+        for _class, row in zip(self._classes, self.getConfusionMatrix()):
+            s += str(_class) + " | " + " ".join(str(cnt) for cnt in row) + "\n"
+        return s
+
+
+def evaluate(workers: int = 1, batch_size: int = 8, corpus: Corpus = None, knn: int = 0,
+             hashing=False) -> Evaluation:
+    """
+    classifies the test set with a pool of worker processes, each with its own Classifier. documents are
+    streamed from the corpus in batches, so the test set never has to fit in memory.
+    corpus is the labelled test set, the directories under TEST_SET_DIR numbered like the training set by default.
+    with knn > 0 the workers use a KnnClassifier with k = knn, with hashing a HashingClassifier.
+    """
+    if corpus is None:
+        corpus = DirectoryCorpus(TEST_SET_DIR, classes=discoverClasses(TEST_SET_DIR, loadTrainedClasses()))
+    evaluation = Evaluation([_class for _class, _name in corpus.getClasses()])
+    batches = _batches(corpus.iterDocuments(), batch_size)
+    total: int = len(corpus) if hasattr(corpus, "__len__") else 0
+    with instruments.stage("classify"):
+        if workers > 1:
+            with multiprocessing.Pool(workers, initializer=initCounted,
+                                      initargs=(_initWorker, knn, hashing)) as pool:
+                for results in imapWindows(pool, _classifyDocs, batches, workers * 4, chunksize=1):
+                    _addResults(evaluation, results, total)
+        else:
+            _initWorker(knn, hashing)
+            for batch in batches:
+                _addResults(evaluation, _classifyDocs(batch), total)
+    return evaluation
+
+
+def _addResults(evaluation: Evaluation, results: [(int, [int])], total: int):
+    for real_class, guessed_classes in results:
+        evaluation.add(real_class, guessed_classes)
+    instruments.count("documents", len(results))
+    instruments.progress("classify", evaluation.getSize(), total)
+
+
 def main():
-    tester = Tester()
-    test_set: list = []
-    test_set.append((1, getTestDocs("history")))
-    test_set.append((2, getTestDocs("hygin")))
-    test_set.append((3, getTestDocs("math")))
-    test_set.append((4, getTestDocs("physics")))
-    test_set.append((5, getTestDocs("technology")))
-    accuracy: float = 0.0
-    for real_class, docs in test_set:
-        for doc in docs:
-            result = tester.test_doc(doc, real_class)
-            if result:
-                accuracy += 1
-    accuracy /= 25
-    print(f"accuracy: {accuracy * 100}%")
-    # se.tmp()
+    evaluation = evaluate(workers=multiprocessing.cpu_count())
+    print(evaluation)
+    instruments.report()
+
+
+def _batches(items, batch_size: int):
+    batch: list = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+_worker_classifier: Classifier or None = None
+
+
+def _initWorker(knn: int = 0, hashing=False):
+    global _worker_classifier
+    if hashing:
+        _worker_classifier = HashingClassifier()
+    else:
+        _worker_classifier = KnnClassifier(k=knn) if knn > 0 else Classifier()
+
+
+def _classifyDocs(batch: [(int, str)]) -> [(int, [int])]:
+    results = _worker_classifier.classify_batch([doc for real_class, doc in batch])
+    return [(real_class, guessed_classes) for (real_class, doc), (guessed_classes, scores) in zip(batch, results)]
 
 
 def getTestDocs(_class_name: str) -> list:
@@ -0,0 +1,32 @@
+import os
+import shutil
+import sys
+import typing
+
+import pytest
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import Corpus  # noqa: E402
+
+
+class ListCorpus(Corpus):
+    # a corpus of (class id, text) pairs held in memory
+    def __init__(self, documents: [(int, str)], classes: [(int, str)] = None):
+        super().__init__(classes)
+        self._documents = list(documents)
+
+    def __len__(self):
+        return len(self._documents)
+
+    def iterDocuments(self) -> typing.Iterator[typing.Tuple[int, str]]:
+        return iter(self._documents)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # every module writes under ./dist, so each test runs in a directory of its own with the stop words
+    shutil.copytree(os.path.join(ROOT, "stopwords"), tmp_path / "stopwords")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from classifier import Classifier, HashingClassifier, KnnClassifier
+from conftest import ListCorpus
+from hashing import HashingIndexer, HashedModel
+from indexer import Indexer, Dictionary, FORWARD_ADDR
+
+DOCS = [
+    (1, "کتاب تاریخ ایران باستان شاه جنگ"),
+    (1, "شاه ایران تاریخ سلسله"),
+    (2, "ریاضی جبر هندسه عدد کتاب"),
+    (2, "ریاضی هندسه مثلث عدد"),
+    (3, "فیزیک نیرو حرکت انرژی"),
+    (3, "انرژی نور فیزیک عدد"),
+]
+QUERIES = ["تاریخ جنگ شاه", "هندسه عدد ریاضی", "نیرو انرژی"]
+
+
+def _train() -> Dictionary:
+    Indexer(corpus=ListCorpus(DOCS, [(1, "history"), (2, "math"), (3, "physics")])).train()
+    return Dictionary(load=True)
+
+
+def test_knn_classifier_votes_with_the_nearest_documents(workdir):
+    dictionary: Dictionary = _train()
+    for use_postings in (False, True):
+        classifier = KnnClassifier(dictionary, k=1, use_postings=use_postings)
+        assert classifier._classes == [1, 2, 3]
+        assert [classes for classes, scores in classifier.classify_batch(QUERIES)] == [[1], [2], [3]]
+        # the centroid classifier makes no guess without a known term either
+        assert classifier.classify("زرافه") == ([], {})
+        assert Classifier(dictionary).classify("زرافه") == ([], {})
+
+
+def test_knn_classifier_needs_a_forward_index(workdir):
+    dictionary: Dictionary = _train()
+    os.remove(FORWARD_ADDR)
+    with pytest.raises(ValueError, match="forward index"):
+        KnnClassifier(dictionary)
+
+
+def test_classifier_builds_the_class_index_of_an_old_model(workdir):
+    dictionary: Dictionary = _train()
+    expected = Classifier(dictionary).classify_batch(QUERIES)
+    assert [classes for classes, scores in expected] == [[1], [2], [3]]
+    dictionary.hasClassIndex = lambda: False
+    classifier = Classifier(dictionary)
+    assert classifier._index is not None
+    for (classes, scores), (expected_classes, expected_scores) in zip(classifier.classify_batch(QUERIES), expected):
+        assert classes == expected_classes
+        assert scores == pytest.approx(expected_scores, rel=1e-5)
+
+
+def test_hashing_classifier_needs_no_dictionary(workdir):
+    HashingIndexer(corpus=ListCorpus(DOCS)).train()
+    classifier = HashingClassifier(HashedModel())
+    assert classifier._dictionary is None
+    assert classifier._classes == [1, 2, 3]
+    assert [classes for classes, scores in classifier.classify_batch(QUERIES)] == [[1], [2], [3]]
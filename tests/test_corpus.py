@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+from corpus import DirectoryCorpus, JsonlCorpus, TextSource, readText, readJsonField
+from indexer import indexDocument
+from stemmer import Stemmer
+from tokenizer import Tokenizer
+
+TEXTS = {"history": "کتاب تاریخ ایران (باستان)", "math": "ریاضی » هندسه و مثلث"}
+
+
+def test_directory_corpus_yields_sources_read_in_chunks(workdir):
+    for name, text in TEXTS.items():
+        os.makedirs(f"docs/{name}")
+        with open(f"docs/{name}/1.txt", "w", encoding="utf-8") as file:
+            file.write(text)
+    documents = list(DirectoryCorpus("docs", classes=[(1, "history"), (2, "math")]).iterDocuments())
+    assert [_class for _class, doc in documents] == [1, 2]
+    assert all(isinstance(doc, TextSource) for _class, doc in documents)
+    assert [readText(doc) for _class, doc in documents] == list(TEXTS.values())
+    tokenizer, stemmer = Tokenizer(), Stemmer()
+    for (_class, doc), text in zip(documents, TEXTS.values()):
+        with doc.open() as source:
+            assert list(tokenizer.iterWords(source, chunk_size=3)) == tokenizer.splitDoc(text)
+        assert indexDocument(doc, tokenizer, stemmer) == indexDocument(text, tokenizer, stemmer)
+
+
+def test_jsonl_corpus_leaves_the_text_in_the_dump(workdir):
+    with open("dump.jsonl", "w", encoding="utf-8") as file:
+        for name, text in TEXTS.items():
+            file.write(json.dumps({"label": name, "text": text}) + "\n")
+        file.write("\n" + json.dumps({"label": "unknown", "text": "x"}) + "\n")
+        file.write(json.dumps({"text": "\"math\": 1", "meta": {"label": "math"}, "label": "history"},
+                              ensure_ascii=False) + "\n")
+    documents = list(JsonlCorpus("dump.jsonl", classes=[(1, "history"), (2, "math")]).iterDocuments())
+    assert [_class for _class, doc in documents] == [1, 2, 1]
+    assert [readText(doc) for _class, doc in documents] == list(TEXTS.values()) + ['"math": 1']
+
+
+@pytest.mark.parametrize("record", [
+    {"label": "math", "text": "a \"label\": \"x\" \\"},
+    {"text": "ends with \\", "meta": {"label": "no", "list": [1, {"b": "]}\""}]}, "label": "history"},
+    {"n": None, "t": True, "f": -1.5e3, "label": ["a", {"b": 2}]},
+    {"la\"bel": 1, "label": 3},
+    {"text": "no label"},
+    {},
+])
+def test_json_fields_are_read_without_the_rest_of_the_record(record):
+    for line in (json.dumps(record), json.dumps(record, ensure_ascii=False, separators=(",", ":")),
+                 json.dumps(record, indent=2)):
+        assert readJsonField(line.encode("utf-8"), "label") == record.get("label")
+
+
+def test_broken_json_records_are_rejected():
+    for line in (b"[1]", b'{"label" 1}', b'{"text": "abc', b'{"text": "abc\\"', b'{"text": [1, "a"'):
+        with pytest.raises(ValueError):
+            readJsonField(line, "label")
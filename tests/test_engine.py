@@ -0,0 +1,44 @@
+import pytest
+
+from classifier import Classifier
+from conftest import ListCorpus
+from indexer import Indexer, Dictionary
+from selection import FeatureSelector
+
+pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+from engine import SparseEngine  # noqa: E402
+
+DOCS = [
+    (1, "کتاب تاریخ ایران باستان شاه جنگ"),
+    (1, "تاریخ یونان باستان جنگ کتاب"),
+    (1, "شاه ایران تاریخ سلسله"),
+    (2, "ریاضی جبر هندسه عدد کتاب"),
+    (2, "ریاضی هندسه مثلث عدد"),
+    (2, "جبر معادله عدد ریاضی تاریخ"),
+    (3, "فیزیک نیرو حرکت انرژی"),
+    (3, "انرژی نور فیزیک عدد"),
+    (3, "حرکت نیرو جرم فیزیک کتاب"),
+]
+QUERIES = ["تاریخ جنگ عدد", "کتاب هندسه", "نیرو عدد ریاضی", "انرژی شاه کتاب", "سلسله معادله نور", "کتاب"]
+
+
+@pytest.mark.parametrize("centroid_size, selector", [
+    (0, None),
+    (2, None),
+    (0, FeatureSelector(method="chi2", size=6)),
+    (3, FeatureSelector(min_df=2)),
+])
+def test_engine_scores_like_the_class_index(workdir, centroid_size, selector):
+    Indexer(corpus=ListCorpus(DOCS, [(1, "history"), (2, "math"), (3, "physics")]), centroid_size=centroid_size,
+            selector=selector).train()
+    # the centroid size the index was trained with is read back
+    dictionary = Dictionary(load=True)
+    assert dictionary.getCentroidSize() == centroid_size
+    engine = SparseEngine(dictionary)
+    engine.fit()
+    expected = Classifier(dictionary).classify_batch(QUERIES)
+    actual = Classifier(dictionary, engine=engine).classify_batch(QUERIES)
+    assert [classes for classes, scores in actual] == [classes for classes, scores in expected]
+    for (classes, scores), (expected_classes, expected_scores) in zip(actual, expected):
+        assert scores == pytest.approx(expected_scores, rel=1e-5)
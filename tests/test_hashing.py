@@ -0,0 +1,28 @@
+import pytest
+
+from conftest import ListCorpus
+from hashing import HashingIndexer, HashingVectorizer, HASHED_DIST, readClassSums, writeClassSums
+from test_classifier import DOCS
+
+
+def test_class_sums_round_trip(tmp_path):
+    sums: {int, dict} = {2: {0: 0.1, (1 << 32) - 1: -1e-300}, 1: {}, -3: {7: 1 / 3}}
+    writeClassSums(str(tmp_path / "sums.bin"), sums)
+    assert readClassSums(str(tmp_path / "sums.bin")) == sums
+    with open(tmp_path / "sums.bin", 'r+b') as file:
+        file.write(b"IRHDF001")
+    with pytest.raises(ValueError, match="not a class sums file"):
+        readClassSums(str(tmp_path / "sums.bin"))
+
+
+def test_saves_in_between_do_not_round_the_class_sums(workdir):
+    vectorizer = HashingVectorizer(1 << 10)
+    trained = HashingIndexer(vectorizer, corpus=ListCorpus(DOCS))
+    trained.train()
+    HashingIndexer(vectorizer, corpus=ListCorpus(DOCS[:1])).train()
+    for document in DOCS[1:]:
+        indexer = HashingIndexer(load=True)
+        indexer.addDocuments([document])
+        indexer.save()
+    assert HashingIndexer(load=True)._sums == trained._sums
+    assert readClassSums(HASHED_DIST + "sums.bin") == trained._sums
@@ -0,0 +1,135 @@
+from conftest import ListCorpus
+import os
+
+import pytest
+
+from indexer import Indexer, Dictionary, FORWARD_ADDR, SEGMENT_ADDR, DELTA_ADDR, MODEL_ADDR, MODEL_DELTA_ADDR
+from stemmer import Stemmer
+
+DOCS = [
+    (1, "کتاب تاریخ ایران باستان زرافه"),
+    (1, "کتاب تاریخ یونان باستان"),
+    (2, "ریاضی جبر هندسه عدد"),
+    (2, "ریاضی هندسه مثلث عدد"),
+]
+
+
+def _term(word: str) -> str:
+    return Stemmer().normalize_word(word)
+
+
+def test_term_deleted_and_added_again_keeps_its_id(workdir):
+    indexer = Indexer(corpus=ListCorpus(DOCS), refresh_ratio=100)
+    indexer.train()
+    dictionary: Dictionary = indexer.getDictionary()
+    term: str = _term("زرافه")
+    pl_id: int = dictionary.getPostingListId(term)
+    assert pl_id >= 0
+
+    indexer.removeDocuments(["1-1"])
+    assert dictionary.getDocFrequency(term) == 0
+    indexer.addDocuments([(2, "زرافه عدد")])
+
+    reloaded = Dictionary(load=True)
+    assert [t for t, i in reloaded.getPrefixTerms(term) if t == term] == [term]
+    assert reloaded.getPostingListId(term) == pl_id
+    assert reloaded.getDocFrequency(term) == 1
+    assert [p.getDocId() for p in reloaded.getPostingList(term).getPostings()] == ["2-3"]
+
+
+def test_lexicon_rejects_a_second_id_for_a_term(workdir):
+    from lexicon import Lexicon
+    lexicon = Lexicon("./dist/lexicon.lex")
+    lexicon["a"] = 0
+    lexicon["a"] = 0
+    try:
+        lexicon["a"] = 1
+        assert False, "a term can't get a second id"
+    except KeyError:
+        pass
+    lexicon.compact()
+    assert list(lexicon.iterPrefix()) == [("a", 0)]
+
+
+def test_refresh_keeps_document_numbers_of_removed_documents(workdir):
+    indexer = Indexer(corpus=ListCorpus(DOCS), refresh_ratio=100)
+    indexer.train()
+    indexer.removeDocuments(["2-2"])
+    indexer.refresh()
+    assert indexer.addDocuments([(2, "ریاضی عدد")]) == ["2-3"]
+    assert indexer.getDictionary().getDocCount() == 4
+    assert Dictionary(load=True).getDocCount() == 4
+
+
+def test_added_documents_go_to_the_deltas_until_refresh(workdir):
+    indexer = Indexer(corpus=ListCorpus(DOCS), refresh_ratio=100)
+    indexer.train()
+    with open(SEGMENT_ADDR, 'rb') as segment_file, open(MODEL_ADDR, 'rb') as model_file:
+        segment, model = segment_file.read(), model_file.read()
+    indexer.addDocuments([(1, "کتاب هندسه ایران"), (2, "مثلث زرافه")])
+    with open(SEGMENT_ADDR, 'rb') as segment_file, open(MODEL_ADDR, 'rb') as model_file:
+        assert (segment_file.read(), model_file.read()) == (segment, model)
+    assert os.path.exists(DELTA_ADDR) and os.path.exists(MODEL_DELTA_ADDR)
+
+    def state() -> dict:
+        dictionary = Dictionary(load=True)
+        result: dict = {"N": dictionary.getDocCount()}
+        for term, pl_id in dictionary.getPrefixTerms(""):
+            weights = dictionary.getClassWeights(pl_id)
+            result[term] = ([p.getDocId() for p in dictionary.getPostingList(term).getPostings()],
+                            [p.getDocId() for p in dictionary.getChampionList(term).getPostings()],
+                            dictionary.getDocFrequency(term),
+                            sorted((_class, round(weight, 5)) for _class, weight in zip(*weights)) if weights else None)
+        dictionary.close()
+        return result
+
+    added: dict = state()
+    assert added["N"] == 6
+    assert added[_term("هندسه")][0] == ["2-1", "2-2", "1-3"]
+    assert added[_term("زرافه")][0] == ["1-1", "2-3"]
+    indexer.refresh()
+    assert not os.path.exists(DELTA_ADDR) and not os.path.exists(MODEL_DELTA_ADDR)
+    # refresh reweights the documents, the postings stay as they are
+    assert {term: value[:3] for term, value in state().items() if term != "N"} == \
+           {term: value[:3] for term, value in added.items() if term != "N"}
+
+
+def test_added_documents_keep_the_trained_centroid_size(workdir):
+    Indexer(corpus=ListCorpus(DOCS), centroid_size=2, refresh_ratio=100).train()
+    indexer = Indexer(dictionary_load=True, refresh_ratio=100)
+    assert indexer.getDictionary().getCentroidSize() == 2
+    indexer.addDocuments([(1, "کتاب شاه سلسله قاجار"), (2, "جبر معادله")])
+    dictionary = Dictionary(load=True)
+    terms: {int, int} = {}
+    for term, pl_id in dictionary.getPrefixTerms(""):
+        row = dictionary.getClassWeights(pl_id)
+        for _class in (row[0] if row is not None else []):
+            terms[_class] = terms.get(_class, 0) + 1
+    assert terms == {1: 2, 2: 2}
+
+
+def test_token_by_token_index_can_be_updated(workdir):
+    indexer = Indexer(corpus=ListCorpus(DOCS), batch=False, refresh_ratio=100)
+    indexer.train()
+    assert os.path.exists(FORWARD_ADDR)
+    indexer.removeDocuments(["1-1"])
+    assert indexer.addDocuments([(2, "زرافه عدد")]) == ["2-3"]
+    indexer.removeDocuments(["2-1"])
+    indexer.refresh()
+    dictionary = Dictionary(load=True, storage="pickle")
+    assert sorted(doc_id for doc_id, tfs in dictionary.getForwardIndex()) == ["1-2", "2-2", "2-3"]
+    assert [p.getDocId() for p in dictionary.getPostingList(_term("عدد")).getPostings()] == ["2-2", "2-3"]
+    assert dictionary.getDocCount() == 3
+    for doc_id in ("1-2", "2-2", "2-3"):
+        assert dictionary.getVectorRow(doc_id)
+    assert dictionary.getVectorRow("1-1") is None and dictionary.getVectorRow("2-1") is None
+
+
+def test_index_without_a_forward_index_is_not_updated(workdir):
+    indexer = Indexer(corpus=ListCorpus(DOCS), refresh_ratio=100)
+    indexer.train()
+    os.remove(FORWARD_ADDR)
+    with pytest.raises(ValueError, match="forward index"):
+        indexer.addDocuments([(2, "زرافه عدد")])
+    with pytest.raises(ValueError, match="forward index"):
+        indexer.removeDocuments(["1-1"])
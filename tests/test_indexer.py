@@ -0,0 +1,67 @@
+from array import array
+import multiprocessing
+
+from conftest import ListCorpus
+from indexer import Indexer, Dictionary, PostingList, ChampionList, Posting, imapWindows
+from instrument import instruments, initCounted
+from test_incremental import DOCS, _term
+
+
+def test_token_by_token_indexing_generates_champion_lists(workdir):
+    Indexer(corpus=ListCorpus(DOCS), batch=False).train()
+    dictionary = Dictionary(load=True, storage="pickle")
+    terms: [str] = [term for term, pl_id in dictionary.getPrefixTerms("")]
+    assert len(terms) > 0
+    for term in terms:
+        postings: [str] = [p.getDocId() for p in dictionary.getPostingList(term).getPostings()]
+        assert [p.getDocId() for p in dictionary.getChampionList(term).getPostings()] == postings
+
+
+def test_champion_list_splits_the_best_postings_into_tiers(workdir):
+    pl = PostingList("a", 0)
+    for doc in range(0, 8):
+        pl.extendPostings([Posting(str(doc), array('I', range(0, doc + 1)))])
+    cl = ChampionList("a", 0, pl, r=3, tiers=3)
+    assert [[p.getDocId() for p in tier] for tier in cl.getTiers()] == [["7", "6", "5"], ["4", "3", "2"], ["1", "0"]]
+    assert [p.getDocId() for p in cl.getTier(2)] == ["1", "0"]
+    assert cl.getTier(3) == []
+    assert [len(tier) for tier in ChampionList("a", 0, pl, r=3, tiers=2).getTiers()] == [3, 3]
+    assert [len(tier) for tier in ChampionList("a", 0, pl, r=3).getTiers()] == [3]
+
+
+def test_champion_tiers_are_kept_in_the_segment(workdir):
+    Indexer(corpus=ListCorpus(DOCS + [(1, "کتاب کتاب"), (1, "کتاب کتاب کتاب")]), champion_size=1,
+            champion_tiers=3).train()
+    cl = Dictionary(load=True).getChampionList(_term("کتاب"))
+    assert [[p.getDocId() for p in tier] for tier in cl.getTiers()] == [["1-4"], ["1-3"], ["1-1"]]
+
+
+def _initCounting():
+    instruments.count("test_workers")
+
+
+def _countWords(text: str) -> int:
+    instruments.count("test_words", len(text.split()))
+    return len(text)
+
+
+def test_counters_of_the_workers_reach_the_parent():
+    before: {str, int} = instruments.getSummary()["counters"]
+    with multiprocessing.Pool(2, initializer=initCounted, initargs=(_initCounting,)) as pool:
+        assert list(imapWindows(pool, _countWords, ["a b", "c", "d e f", "g"], 3, chunksize=1)) == [3, 1, 5, 1]
+    counters: {str, int} = instruments.getSummary()["counters"]
+    assert counters["test_words"] - before.get("test_words", 0) == 7
+    assert 0 < counters["test_workers"] - before.get("test_workers", 0) <= 2
+
+
+def test_records_share_the_positions_of_the_postings():
+    pl = PostingList("کتاب", 0)
+    pl.extendPostings([Posting("1-1", array('I', [1, 4])), Posting("1-2", array('I', [2]))])
+    pl.extendPostings([Posting("1-2", array('I', [5]))])
+    records = pl.getRecords({"1-1": 0, "1-2": 1})
+    assert records == [(0, array('I', [1, 4])), (1, array('I', [2, 5]))]
+    assert all(positions is posting.getPositionArray() for (doc, positions), posting in zip(records, pl.getPostings()))
+    # callers outside the index still get a copy they can change
+    positions = pl.getPostings()[0].getPositions()
+    positions.append(9)
+    assert pl.getPostings()[0].getPositionArray() == array('I', [1, 4])
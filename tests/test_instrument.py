@@ -0,0 +1,29 @@
+import json
+import os
+
+import indexer
+from conftest import ListCorpus
+from instrument import Instruments, JsonLogSink, StdoutSink
+from test_incremental import DOCS
+
+
+def test_messages_go_through_the_sinks(tmp_path, capsys):
+    Instruments(sinks=[]).message("writing index")
+    assert capsys.readouterr().out == ""
+    Instruments().message("writing index")
+    assert capsys.readouterr().out == "writing index\n"
+    log = JsonLogSink(str(tmp_path / "events.jsonl"))
+    instruments = Instruments(sinks=[log, StdoutSink(summary=False)])
+    instruments.message("caching vectors")
+    log.close()
+    assert capsys.readouterr().out == "caching vectors\n"
+    with open(tmp_path / "events.jsonl", encoding="utf-8") as file:
+        records: [dict] = [json.loads(line) for line in file]
+    assert [(record["event"], record["text"]) for record in records] == [("message", "caching vectors")]
+
+
+def test_none_silences_the_indexer(workdir, capsys, monkeypatch):
+    os.makedirs("dist")
+    monkeypatch.setattr(indexer, "instruments", Instruments.fromEnvironment({"IR_INSTRUMENT": "none"}))
+    indexer.Indexer(corpus=ListCorpus(DOCS)).train()
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,133 @@
+import os
+
+import pytest
+
+from lexicon import Lexicon, LexiconReader, writeLexicon
+
+# terms sharing prefixes across block boundaries, in persian and ascii
+TERMS: [str] = sorted({prefix + suffix for prefix in ("کتاب", "کتابخانه", "ک", "abc", "ab", "z")
+                       for suffix in ("", "ها", "ی", "x", "xy", "ان")})
+
+
+def _readLog(lexicon: Lexicon) -> bytes:
+    with open(lexicon.getLogAddr(), 'rb') as log_file:
+        return log_file.read()
+
+
+def test_save_appends_only_the_terms_added_since_the_last_save(workdir):
+    lexicon = Lexicon("./dist/lexicon.lex")
+    lexicon["b"] = 0
+    lexicon["a"] = 1
+    lexicon.save()
+    first: bytes = _readLog(lexicon)
+    lexicon.save()
+    assert _readLog(lexicon) == first
+    lexicon["c"] = 2
+    lexicon.save()
+    assert _readLog(lexicon).startswith(first)
+    assert len(_readLog(lexicon)) == len(first) + 3
+    loaded = Lexicon("./dist/lexicon.lex", load=True)
+    assert list(loaded.items()) == [("b", 0), ("a", 1), ("c", 2)]
+    loaded["d"] = 3
+    loaded.save()
+    assert list(Lexicon("./dist/lexicon.lex", load=True).items()) == [("b", 0), ("a", 1), ("c", 2), ("d", 3)]
+
+
+def _write(addr: str, items: [(str, int)], id_count: int, block_size: int = 4) -> LexiconReader:
+    writeLexicon(addr, sorted(items), id_count, block_size)
+    return LexiconReader(addr)
+
+
+def test_lexicon_file_round_trip(tmp_path):
+    # every third id is left without a term, and the last ids are never handed out
+    items: [(str, int)] = [(term, i * 3) for i, term in enumerate(TERMS)]
+    id_count: int = len(TERMS) * 3 + 5
+    for block_size in (1, 4, 32):
+        reader = _write(str(tmp_path / "dist" / "lexicon.lex"), items, id_count, block_size)
+        assert reader.getTermCount() == len(TERMS)
+        assert reader.getIdCount() == id_count
+        for term, term_id in items:
+            assert reader.get(term) == term_id
+            assert reader.getTerm(term_id) == term
+        for term_id in (1, 2, id_count - 1, id_count, -1):
+            assert reader.getTerm(term_id) is None
+        for term in ("", "a", "کتابخ", "zz", "\uffff"):
+            assert reader.get(term) is None
+        assert list(reader.iterPrefix()) == items
+        for prefix in ("ک", "کتاب", "کتابخانه", "ab", "abcx", "z", "zx", "y", "\uffff"):
+            assert list(reader.iterPrefix(prefix)) == [(term, term_id) for term, term_id in items
+                                                       if term.startswith(prefix)]
+        reader.close()
+
+
+def test_empty_lexicon_file(tmp_path):
+    reader = _write(str(tmp_path / "lexicon.lex"), [], 3)
+    assert reader.getTermCount() == 0 and reader.getIdCount() == 3
+    assert reader.get("کتاب") is None and reader.getTerm(0) is None
+    assert list(reader.iterPrefix()) == []
+    reader.close()
+
+
+def test_corrupt_lexicon_is_rejected(tmp_path):
+    addr: str = str(tmp_path / "lexicon.lex")
+    _write(addr, [("a", 0)], 1).close()
+    with open(addr, 'r+b') as file:
+        file.write(b"IRMOD001")
+    with pytest.raises(ValueError, match="not a lexicon file"):
+        LexiconReader(addr)
+    open(addr, 'wb').close()
+    with pytest.raises(ValueError):
+        LexiconReader(addr)
+
+
+def test_compaction_keeps_every_term(workdir):
+    addr: str = "./dist/lexicon.lex"
+    lexicon = Lexicon(addr)
+    compacted: [str] = TERMS[::2]
+    for term_id, term in enumerate(compacted):
+        lexicon[term] = term_id
+    lexicon.compact()
+    assert not os.path.exists(lexicon.getLogAddr())
+    # terms added after a compaction go to the log, skipping an id and ending with a large one, and are
+    # merged with the terms of the lexicon file in term order
+    logged: [(str, int)] = [(term, len(compacted) + 1 + i) for i, term in enumerate(TERMS[1::2])]
+    logged[-1] = (logged[-1][0], 1 << 20)
+    for term, term_id in logged:
+        lexicon[term] = term_id
+    lexicon.save()
+    expected: [(str, int)] = sorted([(term, term_id) for term_id, term in enumerate(compacted)] + logged)
+    for loaded in (lexicon, Lexicon(addr, load=True)):
+        assert list(loaded.iterPrefix()) == expected
+        assert list(loaded.iterPrefix("کتاب")) == [item for item in expected if item[0].startswith("کتاب")]
+        assert len(loaded) == (1 << 20) + 1
+        assert loaded.getTermCount() == len(TERMS)
+        assert loaded.getTerm(len(compacted)) is None
+    loaded = Lexicon(addr, load=True)
+    loaded.compact()
+    assert not os.path.exists(loaded.getLogAddr())
+    loaded.close()
+    loaded = Lexicon(addr, load=True)
+    assert list(loaded.iterPrefix()) == expected
+    assert all(loaded.get(term) == term_id and loaded.getTerm(term_id) == term for term, term_id in expected)
+    assert len(loaded) == (1 << 20) + 1
+    # a compaction without added terms leaves the file as it is
+    modified: float = os.path.getmtime(addr)
+    loaded.compact()
+    assert os.path.getmtime(addr) == modified
+
+
+def test_terms_added_since_the_compaction_are_found_by_id(workdir):
+    lexicon = Lexicon("./dist/lexicon.lex")
+    lexicon["a"] = 0
+    lexicon.compact()
+    for term_id, term in enumerate(TERMS, start=1):
+        lexicon[term] = term_id
+    lexicon.save()
+    for loaded in (lexicon, Lexicon("./dist/lexicon.lex", load=True)):
+        assert loaded.getTerm(0) == "a"
+        assert [loaded.getTerm(term_id) for term_id in range(1, len(TERMS) + 1)] == TERMS
+        assert loaded.getTerm(len(TERMS) + 1) is None
+        assert loaded._added_terms == dict(enumerate(TERMS, start=1))
+    lexicon.compact()
+    assert lexicon._added_terms == {}
+    assert lexicon.getTerm(len(TERMS)) == TERMS[-1]
@@ -0,0 +1,98 @@
+import math
+
+import pytest
+
+from model import ModelWriter, ModelReader, VECTOR, CENTROID, CLASS_INDEX, makeClassIndex
+
+MAX_ID: int = (1 << 32) - 1
+
+
+def _write(addr: str, rows: [(int, str, dict)]):
+    writer = ModelWriter(addr)
+    for kind, key, vector in rows:
+        writer.addRow(kind, key, vector)
+    writer.close()
+
+
+def test_model_round_trip(tmp_path):
+    addr: str = str(tmp_path / "dist" / "model.bin")
+    rows: [(int, str, dict)] = [
+        (VECTOR, "1-1", {MAX_ID: 0.5, 0: -2.0, 7: 1.25}),
+        (VECTOR, "۲-۱", {}),
+        (CENTROID, "1", {3: 0.75}),
+        (CLASS_INDEX, "1", {1: 0.1, 2: 0.2}),
+        (CLASS_INDEX, "4", {}),
+    ]
+    _write(addr, rows)
+    reader = ModelReader(addr)
+    assert sorted(reader.getKeys(VECTOR)) == ["1-1", "۲-۱"]
+    assert reader.getKeys(CENTROID) == ["1"]
+    assert sorted(reader.getKeys(CLASS_INDEX)) == ["1", "4"]
+    for kind, key, vector in rows:
+        assert reader.hasRow(kind, key)
+        pl_ids, weights = reader.getRow(kind, key)
+        assert list(pl_ids) == sorted(vector.keys())
+        assert list(weights) == pytest.approx([vector[pl_id] for pl_id in pl_ids], rel=1e-6)
+        assert reader.getVector(kind, key) == pytest.approx(vector, rel=1e-6)
+        assert reader.getNorm(kind, key) == math.sqrt(sum(weight * weight for weight in vector.values()))
+    # the same key under another kind is another row
+    assert not reader.hasRow(CENTROID, "1-1") and reader.getRow(CENTROID, "1-1") is None
+    assert reader.getVector(VECTOR, "missing") is None
+    assert reader.getNorm(VECTOR, "missing") == 0.0
+    assert reader.getRawRow(VECTOR, "missing") is None
+    reader.close()
+
+
+def test_raw_rows_carry_over(tmp_path):
+    _write(str(tmp_path / "old.bin"), [(VECTOR, "1-1", {5: 3.0, 1 << 20: -4.0}), (CLASS_INDEX, "0", {})])
+    old = ModelReader(str(tmp_path / "old.bin"))
+    writer = ModelWriter(str(tmp_path / "new.bin"))
+    for kind, key in ((VECTOR, "1-1"), (CLASS_INDEX, "0")):
+        writer.addRawRow(kind, key, *old.getRawRow(kind, key))
+        assert writer.hasRow(kind, key)
+    writer.close()
+    new = ModelReader(str(tmp_path / "new.bin"))
+    for kind, key in ((VECTOR, "1-1"), (CLASS_INDEX, "0")):
+        assert new.getRawRow(kind, key) == old.getRawRow(kind, key)
+        assert new.getVector(kind, key) == old.getVector(kind, key)
+    assert new.getNorm(VECTOR, "1-1") == 5.0
+    old.close()
+    new.close()
+
+
+def test_empty_model(tmp_path):
+    _write(str(tmp_path / "model.bin"), [])
+    reader = ModelReader(str(tmp_path / "model.bin"))
+    assert reader.getKeys(VECTOR) == [] and reader.getKeys(CENTROID) == [] and reader.getKeys(CLASS_INDEX) == []
+    reader.close()
+
+
+def test_corrupt_model_is_rejected(tmp_path):
+    addr: str = str(tmp_path / "model.bin")
+    _write(addr, [(VECTOR, "1-1", {1: 1.0})])
+    with open(addr, 'r+b') as file:
+        file.write(b"IRSEG002")
+    with pytest.raises(ValueError, match="not a model file"):
+        ModelReader(addr)
+    open(addr, 'wb').close()
+    with pytest.raises(ValueError):
+        ModelReader(addr)
+
+
+def test_class_index_is_the_normalized_transposed_centroids():
+    index: {int, dict} = makeClassIndex([(1, {0: 3.0, 2: 4.0}), (2, {2: -1.0, 5: 0.0}), (3, {})])
+    assert index == {0: {1: 0.6}, 2: {1: 0.8, 2: -1.0}}
+
+
+def test_class_index_pruning_keeps_the_largest_weights():
+    centroids: [(int, dict)] = [(1, {0: 1.0, 1: -3.0, 2: 2.0, 3: 0.5}), (2, {4: 1.0})]
+    index: {int, dict} = makeClassIndex(centroids, size=2)
+    norm: float = math.sqrt(13)
+    assert index == {1: {1: -3.0 / norm}, 2: {1: 2.0 / norm}, 4: {2: 1.0}}
+    assert makeClassIndex(centroids, size=0) == makeClassIndex(centroids, size=4)
+
+
+def test_class_index_ties_keep_the_lower_feature():
+    centroid: {int, float} = {9: 1.0, 3: -1.0, 6: 1.0, 1: 0.5}
+    assert set(makeClassIndex([(1, centroid)], size=2).keys()) == {3, 6}
+    assert set(makeClassIndex([(1, dict(reversed(list(centroid.items()))))], size=2).keys()) == {3, 6}
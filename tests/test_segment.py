@@ -0,0 +1,127 @@
+import io
+from array import array
+
+import pytest
+
+from segment import writeVarint, readVarint, encodePostings, decodePostings, decodePostingsAt, encodeTiers, \
+    writeRunRecord, readRunRecords, writeForwardRecord, readForwardRecords, SegmentWriter, SegmentReader
+
+BIG: int = 1 << 40
+
+
+def _records(*records) -> [(int, array)]:
+    return [(doc, array('I', positions)) for doc, positions in records]
+
+
+def test_varints_round_trip():
+    values: [int] = [0, 1, 127, 128, 255, 16383, 16384, (1 << 32) - 1, 1 << 32, (1 << 63) + 5]
+    out = bytearray()
+    for value in values:
+        writeVarint(out, value)
+    offset: int = 0
+    for value in values:
+        decoded, offset = readVarint(out, offset)
+        assert decoded == value
+    assert offset == len(out)
+    assert len(out) == sum(max(1, (value.bit_length() + 6) // 7) for value in values)
+    with pytest.raises(ValueError):
+        writeVarint(bytearray(), -1)
+    with pytest.raises(IndexError):
+        readVarint(bytes([0x80, 0x80]), 0)
+
+
+@pytest.mark.parametrize("records", [
+    [],
+    _records((0, [])),
+    _records((0, [0, 1, 2]), (1, [5]), (2, [0, 4294967295])),
+    _records((3, [7]), (BIG, [1, 1 << 20]), (BIG + 1, [])),
+    # champion lists are not in doc order, their gaps go negative
+    _records((BIG, [2]), (5, [1]), (6, [3]), (0, [9]), (BIG, [4])),
+])
+def test_postings_round_trip(records):
+    encoded: bytes = encodePostings(records)
+    assert decodePostings(encoded) == records
+    assert decodePostingsAt(b"xy" + encoded + b"z", 2) == (records, 2 + len(encoded))
+
+
+def test_empty_postings_take_a_byte():
+    assert encodePostings([]) == b"\x00"
+    assert encodeTiers([]) == b""
+    assert encodeTiers([[], []]) == b"\x00\x00"
+
+
+def test_tiers_are_stored_back_to_back():
+    tiers: [[(int, array)]] = [_records((9, [1, 2]), (BIG, [3])), [], _records((0, [0]))]
+    encoded: bytes = encodeTiers(tiers)
+    offset: int = 0
+    decoded: list = []
+    while offset < len(encoded):
+        records, offset = decodePostingsAt(encoded, offset)
+        decoded.append(records)
+    assert decoded == tiers
+
+
+def test_run_and_forward_records_round_trip():
+    run = io.BytesIO()
+    writeRunRecord(run, 0, "کتاب", b"")
+    writeRunRecord(run, (1 << 32) - 1, "", encodePostings(_records((BIG, [1]))))
+    run.write(b"\x01\x00")  # a torn record at the end is left out
+    run.seek(0)
+    assert [(pl_id, term, decodePostings(data) if data else data) for pl_id, term, data in readRunRecords(run)] == \
+        [(0, "کتاب", b""), ((1 << 32) - 1, "", _records((BIG, [1])))]
+    forward = io.BytesIO()
+    writeForwardRecord(forward, "1-1", [(0, 1), (7, 300), (BIG, 2)])
+    writeForwardRecord(forward, "2-1", [])
+    forward.seek(0)
+    assert list(readForwardRecords(forward)) == [("1-1", [(0, 1), (7, 300), (BIG, 2)]), ("2-1", [])]
+
+
+def test_segment_round_trip(tmp_path):
+    addr: str = str(tmp_path / "dist" / "index.seg")
+    postings: {int, list} = {0: _records((0, [1, 5]), (3, [2])), 2: _records((BIG, [0])), 3: []}
+    tiers: {int, list} = {0: [_records((3, [2])), _records((0, [1, 5]))], 2: [], 3: [[]]}
+    writer = SegmentWriter(addr)
+    for pl_id in (3, 0, 2):
+        writer.addTerm(pl_id, encodePostings(postings[pl_id]), encodeTiers(tiers[pl_id]))
+    assert writer.hasTerm(2) and not writer.hasTerm(1)
+    writer.close(["1-1", "۲-۲", ""], 5)
+    reader = SegmentReader(addr)
+    assert reader.getDocs() == ["1-1", "۲-۲", ""]
+    assert reader.getTermCount() == 5
+    for pl_id in (0, 2, 3):
+        assert reader.hasTerm(pl_id)
+        assert reader.getPostings(pl_id) == postings[pl_id]
+        assert reader.getChampionTiers(pl_id) == tiers[pl_id]
+        assert reader.getChampions(pl_id) == [record for records in tiers[pl_id] for record in records]
+        assert reader.getRawTerm(pl_id) == (encodePostings(postings[pl_id]), encodeTiers(tiers[pl_id]))
+    # terms without an entry, and ids out of the table
+    for pl_id in (1, 4, 5, -1):
+        assert not reader.hasTerm(pl_id)
+        assert reader.getPostings(pl_id) is None
+        assert reader.getChampionTiers(pl_id) is None
+        assert reader.getChampions(pl_id) is None
+        assert reader.getRawTerm(pl_id) is None
+    reader.close()
+
+
+def test_empty_segment(tmp_path):
+    addr: str = str(tmp_path / "index.seg")
+    SegmentWriter(addr).close([], 0)
+    reader = SegmentReader(addr)
+    assert reader.getDocs() == [] and reader.getTermCount() == 0
+    assert reader.getPostings(0) is None
+    reader.close()
+
+
+def test_corrupt_segment_is_rejected(tmp_path):
+    addr: str = str(tmp_path / "index.seg")
+    writer = SegmentWriter(addr)
+    writer.addTerm(0, encodePostings(_records((1, [1]))), b"")
+    writer.close(["1-1"], 1)
+    with open(addr, 'r+b') as file:
+        file.write(b"IRSEG001")
+    with pytest.raises(ValueError, match="not a segment file"):
+        SegmentReader(addr)
+    open(addr, 'wb').close()
+    with pytest.raises(ValueError):
+        SegmentReader(addr)
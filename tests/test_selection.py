@@ -0,0 +1,26 @@
+import pytest
+
+from conftest import ListCorpus
+from indexer import Indexer, Dictionary
+from selection import FeatureSelector
+from test_classifier import DOCS
+
+
+@pytest.mark.parametrize("arguments", [{"min_df": 1.0}, {"min_df": 2.0}, {"min_df": -0.1}, {"max_df": 1.5},
+                                       {"max_df": 0.0}, {"method": "tfidf"}])
+def test_ambiguous_thresholds_are_rejected(arguments):
+    with pytest.raises(ValueError):
+        FeatureSelector(**arguments)
+
+
+def test_ints_count_documents_and_floats_share_them(workdir):
+    Indexer(corpus=ListCorpus(DOCS)).train()
+    dictionary = Dictionary(load=True)
+    dfs = dictionary.getDocFrequencies()
+    everything: [int] = [pl_id for pl_id, df in enumerate(dfs) if df > 0]
+    assert FeatureSelector(min_df=1).select(dictionary) == everything
+    assert FeatureSelector(min_df=0.0, max_df=1.0).select(dictionary) == everything
+    # 6 documents, a third of them is 2
+    assert FeatureSelector(min_df=2).select(dictionary) == [pl_id for pl_id in everything if dfs[pl_id] >= 2]
+    assert FeatureSelector(min_df=1 / 3).select(dictionary) == FeatureSelector(min_df=2).select(dictionary)
+    assert FeatureSelector(max_df=1).select(dictionary) == [pl_id for pl_id in everything if dfs[pl_id] == 1]
@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+from classifier import Classifier
+from conftest import ListCorpus
+from indexer import Indexer
+from service import ClassificationService, ServiceServer, ServiceClient
+from test_incremental import DOCS
+
+
+class FailingClassifier(Classifier):
+    def classify_batch(self, docs):
+        raise KeyError("broken model")
+
+
+def _serve(classifier: Classifier, requests: [(str, bytes, str)]) -> [(int, dict)]:
+    async def run() -> [(int, dict)]:
+        server = ServiceServer(ClassificationService(classifier))
+        await server.start(path="./service.sock")
+        client = ServiceClient(path="./service.sock")
+        try:
+            return [await client.request("POST", "/classify", body, content_type)
+                    for body, content_type in requests]
+        finally:
+            await client.close()
+            await server.close()
+    return asyncio.run(run())
+
+
+def _json(value) -> (bytes, str):
+    return json.dumps(value).encode("utf-8"), "application/json"
+
+
+def test_bad_requests_get_a_400_and_keep_the_connection(workdir):
+    Indexer(corpus=ListCorpus(DOCS)).train()
+    responses = _serve(Classifier(), [
+        _json({"docs": "ریاضی"}),
+        _json({"docs": ["ریاضی", 3]}),
+        _json({"doc": None}),
+        _json(["ریاضی"]),
+        _json({"text": "ریاضی"}),
+        (b"{not json", "application/json"),
+        (b"\xff\xfe", "text/plain"),
+        _json({"docs": ["ریاضی هندسه", "تاریخ ایران"]}),
+    ])
+    assert [status for status, response in responses] == [400] * 7 + [200]
+    assert all("error" in response for status, response in responses[:7])
+    assert [result["classes"] for result in responses[-1][1]["results"]] == [[2], [1]]
+
+
+def test_a_failing_classifier_gets_a_500(workdir, caplog):
+    Indexer(corpus=ListCorpus(DOCS)).train()
+    responses = _serve(FailingClassifier(), [("ریاضی".encode("utf-8"), "text/plain"), _json({"docs": ["ریاضی"]})])
+    assert responses == [(500, {"error": "internal server error"})] * 2
+    assert "broken model" in caplog.text
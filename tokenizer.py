@@ -1,7 +1,12 @@
+import io
 import typing
 
+# characters tokenizeDoc treats as word separators on top of whitespace
+SEPARATORS = str.maketrans({"(": " ", ")": " ", "»": " "})
+
 
 class Token:
+    __slots__ = ('_word', '_position')
     _word: str
     _position: int
 
@@ -23,10 +28,42 @@ class Tokenizer:
     def __init__(self):
         pass
 
+    @staticmethod
+    def splitDoc(doc: str) -> [str]:
+        # the words of tokenizeDoc without Token objects, the position of a word is its index + 1
+        return doc.strip().replace("(", " ").replace(")", " ").replace("»", " ").replace("»", " ").split()
+
+    @staticmethod
+    def iterWords(source: typing.Union[str, typing.TextIO], chunk_size: int = 1 << 16) -> typing.Iterator[str]:
+        """
+        streaming splitDoc: yields the words of a text file object (or a string) reading chunk_size
+        characters at a time, so only one chunk of a long document is held in memory.
+        a word cut by the end of a chunk is carried over to the next one.
+        """
+        if isinstance(source, str):
+            source = io.StringIO(source)
+        tail: str = ""
+        while True:
+            chunk: str = source.read(chunk_size)
+            if chunk == "":
+                break
+            words: [str] = (tail + chunk).translate(SEPARATORS).split()
+            tail = ""
+            if len(words) > 0 and not chunk[-1].isspace() and chunk[-1] not in "()»":
+                tail = words.pop()
+            yield from words
+        if tail != "":
+            yield tail
+
+    @staticmethod
+    def streamDoc(source: typing.Union[str, typing.TextIO], chunk_size: int = 1 << 16):
+        # (word, position) pairs of iterWords, numbered like tokenizeDoc
+        return enumerate(Tokenizer.iterWords(source, chunk_size), 1)
+
     @staticmethod
     def tokenizeDoc(doc: str) -> list:
         result: [Token] = []
-        lst: list = doc.strip().replace("(", " ").replace(")", " ").replace("»", " ").replace("»", " ").split()
+        lst: list = Tokenizer.splitDoc(doc)
         # lst[:] = [word.strip().replace(".", "").replace("،", "") for word in lst]
         word: str
         for word in lst:
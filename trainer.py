@@ -1,4 +1,5 @@
 from indexer import Indexer
+from instrument import instruments
 
 
 class Trainer:
@@ -11,6 +12,7 @@ class Trainer:
 
 def main():
     trainer = Trainer()
+    instruments.report()
 
 
 if __name__ == '__main__':